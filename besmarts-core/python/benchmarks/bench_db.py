@@ -0,0 +1,101 @@
+"""
+Benchmark the dataset store.
+
+The molecules of the input are encoded and written to a new dataset until it
+holds the requested number of graphs, and are then read back at random one
+at a time, in batches, and in order. For comparison, the same graphs are
+written to and read from a dbm database with one key per graph, as the store
+used to do.
+
+usage: python bench_db.py [n_graphs] [graphs.bg ...]
+"""
+
+import dbm
+import os
+import random
+import sys
+import tempfile
+import time
+
+from besmarts.core import db
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def load_intvecs(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    icd = native_graphs.native_graphs_intvec_codec(G[0])
+    return [icd.graph_encode(g) for g in G]
+
+
+def report(name, n, dt):
+    print(f"{name:28s} {n:9d} graphs {dt:8.3f}s {n/dt:12.1f} graphs/s")
+
+
+def run_dataset(path, A, n, reads):
+    t0 = time.perf_counter()
+    ds = db.db_dataset_open(path, create=True)
+    db.db_dataset_write_graphs(ds, (A[i % len(A)] for i in range(n)))
+    db.db_dataset_close(ds)
+    report("dataset write", n, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    ds = db.db_dataset_open(path)
+    report("dataset open", n, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    total = 0
+    for i in reads:
+        total += ds[i].v[0]
+    report("dataset random read", len(reads), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for batch in range(0, len(reads), 1000):
+        for iv in db.db_dataset_read_graph_list(ds, reads[batch:batch+1000]):
+            total += iv.v[0]
+    report("dataset batched read", len(reads), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for i, iv in ds.items():
+        total += iv.v[0]
+    report("dataset scan", n, time.perf_counter() - t0)
+
+    size = sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+    print(f"dataset size {size/2**20:.1f} MiB")
+    db.db_dataset_remove(ds)
+
+
+def run_dbm(path, A, n, reads):
+    t0 = time.perf_counter()
+    with dbm.open(path, "n") as kv:
+        for i in range(n):
+            kv[str(i)] = A[i % len(A)].v.tobytes()
+    report("dbm write", n, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    total = 0
+    with dbm.open(path, "r") as kv:
+        for i in reads:
+            total += len(kv[str(i)])
+    report("dbm random read", len(reads), time.perf_counter() - t0)
+
+
+def main(argv):
+    n = int(argv[0]) if argv else 1000000
+    A = load_intvecs(argv[1:])
+    reads = [random.randrange(n) for _ in range(min(n, 100000))]
+
+    # dbm is too slow to fill with more than this
+    n_dbm = min(n, 100000)
+    reads_dbm = [random.randrange(n_dbm) for _ in reads]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run_dataset(os.path.join(tmp, "ds"), A, n, reads)
+        run_dbm(os.path.join(tmp, "kv"), A, n_dbm, reads_dbm)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
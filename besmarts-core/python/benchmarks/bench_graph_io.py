@@ -0,0 +1,102 @@
+"""
+Benchmark reading and writing graphs in the native formats.
+
+The input graphs are repeated to make a large text file, which is then read
+whole, read as a stream, converted to the packed format, and read back from
+the packed format both in order and at random. The peak memory of each read
+is measured in a second run so it does not slow the timed run.
+
+usage: python bench_graph_io.py [copies] [graphs.bg ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+default_files = [
+    os.path.join(here, "..", "tests", "g.bg"),
+    os.path.join(here, "..", "examples", "propane.bg"),
+]
+
+
+def measure(name, fn, n):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+
+    # tracing slows everything down, so the memory is a separate run
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:20s} {n:8d} graphs {dt:8.3f}s {n/dt:10.1f} graphs/s"
+        f" peak {peak/2**20:8.1f} MiB"
+    )
+
+
+def run(G, copies):
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, "G.bg")
+        n = len(G) * copies
+        measure(
+            "write",
+            lambda: codec_native.graph_codec_native_save(
+                fname, (g for _ in range(copies) for g in G)
+            ),
+            n
+        )
+        print(f"text size {os.path.getsize(fname)/2**20:.1f} MiB")
+
+        measure("load", lambda: codec_native.graph_codec_native_load(fname), n)
+
+        def stream():
+            for g in codec_native.graph_codec_native_stream(fname):
+                pass
+
+        measure("stream", stream, n)
+
+        path = os.path.join(tmp, "G")
+        measure(
+            "pack",
+            lambda: codec_native.graph_codec_native_pack(
+                path, codec_native.graph_codec_native_stream(fname)
+            ),
+            n
+        )
+        print(f"packed size {os.path.getsize(path + '.dat')/2**20:.1f} MiB")
+
+        packed = codec_native.graph_codec_native_unpack(path)
+
+        def read():
+            for g in packed:
+                pass
+
+        measure("packed read", read, n)
+
+        idx = [random.randrange(n) for _ in range(min(n, 10000))]
+
+        def read_random():
+            for i in idx:
+                packed[i]
+
+        measure("packed random", read_random, len(idx))
+
+
+def main(argv):
+    copies = int(argv[0]) if argv else 2000
+    G = []
+    for fname in argv[1:] or default_files:
+        G.extend(codec_native.graph_codec_native_load(fname))
+    run(G, copies)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Benchmark the fingerprint screen of the native hierarchy labeler.
+
+A hierarchy is built from the data: a root pattern, one child per unique
+depth 0 environment, and one grandchild per unique depth 1 environment. The
+structures are then labeled with and without the screen and the number of
+full matches avoided is reported.
+
+usage: python bench_hierarchy_screen.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import trees
+from besmarts.assign import hierarchy_assign_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run(G, topo):
+    structs = []
+    for g in G:
+        structs.append(graphs.graph_to_structure_topology(g, topo))
+
+    sh = native_graphs.native_graphs_hierarchy(
+        [s for x in structs for s in x], topo
+    )
+    roots = trees.tree_index_roots(sh.index)
+    print(f"topology {topo.primary}: {len(sh.index.nodes)} nodes")
+
+    results = {}
+    for screen in (False, True):
+        hierarchy_assign_native.screen_stats.clear()
+        t0 = time.perf_counter()
+        results[screen] = [
+            hierarchy_assign_native.structure_hierarchy_assign(
+                sh, roots, x, screen=screen
+            )
+            for x in structs
+        ]
+        dt = time.perf_counter() - t0
+        stats = hierarchy_assign_native.screen_stats
+        print(
+            f"  screen={screen!s:5s} time={dt:8.3f}s"
+            f" matches={stats['matched']:6d} skipped={stats['screened']:6d}"
+        )
+
+    assert results[True] == results[False]
+
+
+def main(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    for topo in (topology.bond, topology.angle, topology.torsion):
+        run(G, topo)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
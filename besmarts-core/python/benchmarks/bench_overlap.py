@@ -0,0 +1,91 @@
+"""
+Benchmark the batched atom overlap scores.
+
+First, the atoms of the input are scored against each other in blocks of
+increasing size, pair by pair and with bechem_batch_overlap forced to pack
+every block. Then every pair of angles of the input, extended to depth 2,
+is mapped with map_to with the pairwise_overlap cache disabled, once with
+the atoms always scored pair by pair and once with the default
+configs.bechem_batch_min_pairs. Both must give the same maps.
+
+usage: python bench_overlap.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import chem
+from besmarts.core import configs
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.core import topology
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run_blocks(G):
+    atoms = [bc for g in G for bc in g.nodes.values()]
+    min_pairs = configs.bechem_batch_min_pairs
+    configs.bechem_batch_min_pairs = 0
+    try:
+        for n, m in ((1, 1), (1, 2), (2, 2), (2, 4), (4, 4), (8, 8), (16, 16)):
+            A = atoms[:n]
+            B = atoms[-m:]
+            repeat = max(1, 20000 // (n * m))
+
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                ref = [[chem.bechem_align_score(x, y) for y in B] for x in A]
+            t1 = time.perf_counter()
+            for _ in range(repeat):
+                scores = chem.bechem_batch_overlap(A, B)
+            t2 = time.perf_counter()
+
+            assert scores == ref
+            print(
+                f"block {n:2d}x{m:2d}: pairs {(t1 - t0) / repeat * 1e6:9.1f}us"
+                f" batch {(t2 - t1) / repeat * 1e6:9.1f}us"
+            )
+    finally:
+        configs.bechem_batch_min_pairs = min_pairs
+
+
+def run_map(G, topo, depth, min_pairs):
+    structs = []
+    config = configs.smarts_extender_config(depth, depth, True)
+    for g in G:
+        S = graphs.graph_to_structure_topology(g, topo)
+        graphs.structure_extend(config, S)
+        structs.extend(S)
+
+    configs.bechem_batch_min_pairs, default = min_pairs, configs.bechem_batch_min_pairs
+    mapper.pairwise_overlap_cache_configure(0)
+    try:
+        t0 = time.perf_counter()
+        maps = [mapper.map_to(a, b).map for a in structs for b in structs]
+        dt = time.perf_counter() - t0
+    finally:
+        configs.bechem_batch_min_pairs = default
+        mapper.pairwise_overlap_cache_configure(2**16)
+
+    print(
+        f"map topology {topo.primary} depth {depth} min_pairs {min_pairs}:"
+        f" {len(maps):6d} maps {dt:8.3f}s"
+    )
+    return maps
+
+
+def main(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    run_blocks(G)
+    pairs = run_map(G, topology.angle, 2, sys.maxsize)
+    batch = run_map(G, topology.angle, 2, configs.bechem_batch_min_pairs)
+    assert pairs == batch
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
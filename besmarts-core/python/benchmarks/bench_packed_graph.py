@@ -0,0 +1,45 @@
+"""
+Report the memory used per atom by graphs and packed graphs.
+
+usage: python bench_packed_graph.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import packed
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+default_files = [
+    os.path.join(here, "..", "tests", "g.bg"),
+    os.path.join(here, "..", "examples", "propane.bg"),
+]
+
+
+def main(fnames):
+    G = []
+    for fname in fnames or default_files:
+        for g in codec_native.graph_codec_native_load(fname):
+            if hasattr(g, "select"):
+                g = graphs.subgraph_to_graph(g)
+            G.append(g)
+
+    n_atoms = sum(len(g.nodes) for g in G)
+
+    t0 = time.perf_counter()
+    P = [packed.packed_graph_from_graph(g) for g in G]
+    dt = time.perf_counter() - t0
+
+    before = sum(packed.graph_memory(g) for g in G)
+    after = sum(packed.packed_graph_memory(p) for p in P)
+
+    print(f"graphs={len(G)} atoms={n_atoms} pack time={dt:.4f}s")
+    print(f"graph        {before / n_atoms:10.1f} bytes/atom")
+    print(f"packed_graph {after / n_atoms:10.1f} bytes/atom")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,82 @@
+"""
+Benchmark the single bit screen of the split search.
+
+The bonds of the input graphs are split at bit depths 1 and 2, once without
+the screen and once with the screen forced on, and the time of each search
+is reported with the number of combinations the screen pruned. Both
+searches must find the same splits. The screen is only worth running when
+the time it saves is more than the time it takes, which is what
+configs.split_bit_screen_min_ratio estimates.
+
+usage: python bench_split_screen.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import configs
+from besmarts.core import compute
+from besmarts.core import mapper
+from besmarts.core import splits
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run(G, icd, topo, screen):
+    E = {i: icd.graph_encode(g) for i, g in enumerate(G)}
+    selections = []
+    structs = []
+    for i, g in enumerate(G):
+        for s in graphs.graph_to_structure_topology(g, topo):
+            selections.append((i, s.select))
+            structs.append(s)
+    S0 = graphs.structure_remove_unselected(mapper.union_list(structs))
+    S0 = graphs.subgraph(S0.nodes, S0.edges, S0.select)
+
+    splitter = configs.smarts_splitter_config(
+        1, 2, 0, 0, 0, 0, unique=True, return_matches=True, max_splits=0
+    )
+
+    configs.split_bit_screen = screen
+    configs.split_bit_screen_min_ratio = 0.0
+    wq = compute.workqueue_local("127.0.0.1", 0)
+    try:
+        t0 = time.perf_counter()
+        S, _, matched = splits.split_subgraphs_distributed(
+            topo, splitter, S0, E, selections, wq, icd
+        )
+        dt = time.perf_counter() - t0
+    finally:
+        wq.close()
+
+    return dt, sorted(
+        (hash(T.H), tuple(m)) for T, m in zip(S, matched)
+    )
+
+
+def main(fnames):
+    configs.remote_compute_enable = False
+    G = native_graphs.native_graphs_load(fnames)
+    icd = native_graphs.native_graphs_intvec_codec(G[0])
+    topo = topology.bond
+
+    results = {}
+    for screen in (False, True):
+        dt, results[screen] = run(G, icd, topo, screen)
+        print(
+            f"topology {topo.primary}: screen={screen!s:5s}"
+            f" processors={configs.processors} time={dt:8.3f}s"
+            f" splits={len(results[screen])}"
+        )
+
+    assert results[True] == results[False]
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+"""
+Benchmark structure extension.
+
+Every torsion of the input is extended one depth at a time up to depth 3, as
+the SMARTS search does when it builds the environments of a dataset. Each
+depth query of the extension is answered from the distance table of the
+molecule, which is calculated once and shared by all of its torsions. The
+batch mode extends all torsions of each molecule in one pass with
+graph_to_structures_extend.
+
+usage: python bench_structure_extend.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import configs
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run(G, topo, depth, repeat):
+    dt = 0.0
+    n = 0
+    nodes = 0
+    for _ in range(repeat):
+        if hasattr(graphs, "graph_distances_cache_clear"):
+            graphs.graph_distances_cache_clear()
+        structs = []
+        for g in G:
+            structs.extend(graphs.graph_to_structure_topology(g, topo))
+
+        t0 = time.perf_counter()
+        for d in range(depth + 1):
+            config = configs.smarts_extender_config(d, d, True)
+            graphs.structure_extend(config, structs)
+        nodes += sum(graphs.structure_max_depth(s) for s in structs)
+        dt += time.perf_counter() - t0
+        n += len(structs)
+
+    print(
+        f"topology {topo.primary}: {n:6d} structures to depth {depth}"
+        f" {dt:8.3f}s {n/dt:10.1f} structures/s (sum of depths {nodes})"
+    )
+
+
+def run_batch(G, topo, depth, repeat):
+    dt = 0.0
+    n = 0
+    nodes = 0
+    for _ in range(repeat):
+        graphs.graph_distances_cache_clear()
+
+        t0 = time.perf_counter()
+        config = configs.smarts_extender_config(depth, depth, True)
+        structs = []
+        for g in G:
+            structs.extend(graphs.graph_to_structures_extend(g, None, topo, config))
+        nodes += sum(graphs.structure_max_depth(s) for s in structs)
+        dt += time.perf_counter() - t0
+        n += len(structs)
+
+    print(
+        f"topology {topo.primary}: {n:6d} structures to depth {depth}"
+        f" {dt:8.3f}s {n/dt:10.1f} structures/s (sum of depths {nodes}, batch)"
+    )
+
+
+def main(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    run(G, topology.torsion, 3, 20)
+    if hasattr(graphs, "graph_to_structures_extend"):
+        run_batch(G, topology.torsion, 3, 20)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
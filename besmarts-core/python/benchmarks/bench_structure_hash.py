@@ -0,0 +1,57 @@
+"""
+Benchmark structure hashing.
+
+Each bond, angle, and torsion of the input is extended one depth at a time,
+and hashed at every depth, in the same way the SMARTS search hashes the
+environments it visits. The hashes are reported as hashes per second.
+
+usage: python bench_structure_hash.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import configs
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run(G, topo, depth, repeat):
+    structs = []
+    for g in G:
+        structs.extend(graphs.graph_to_structure_topology(g, topo))
+
+    n = 0
+    dt = 0.0
+    hashes = set()
+    for _ in range(repeat):
+        for s in structs:
+            s = graphs.structure_copy(s)
+            for d in range(depth + 1):
+                config = configs.smarts_extender_config(d, d, True)
+                graphs.structure_extend(config, [s])
+                t0 = time.perf_counter()
+                hashes.add(hash(s))
+                dt += time.perf_counter() - t0
+                n += 1
+
+    print(
+        f"topology {topo.primary}: {n:6d} hashes {len(hashes):5d} unique"
+        f" {dt:8.3f}s {n/dt:10.1f} hashes/s"
+    )
+
+
+def main(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    for topo in (topology.bond, topology.angle, topology.torsion):
+        run(G, topo, 3, 5)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
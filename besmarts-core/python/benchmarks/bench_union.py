@@ -0,0 +1,56 @@
+"""
+Benchmark the parallel union of a dataset.
+
+The bonds of the input graphs are repeated to build datasets of increasing
+size, and each dataset is unioned at depth 1 with union_list_parallel, in
+the same way the split search builds the union of a cluster. The time of
+each union is reported against the number of selections.
+
+usage: python bench_union.py [graphs.bg ...]
+"""
+
+import os
+import sys
+import time
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import configs
+from besmarts.core import mapper
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "tests"))
+
+import native_graphs
+
+
+def run(G, icd, topo, n):
+    E = {}
+    selections = []
+    while len(selections) < n:
+        for g in G:
+            i = len(E)
+            E[i] = icd.graph_encode(g)
+            for s in graphs.graph_to_structure_topology(g, topo):
+                selections.append((i, s.select))
+    selections = selections[:n]
+
+    t0 = time.perf_counter()
+    Q = mapper.union_list_parallel(E, selections, topo, max_depth=1, icd=icd)
+    dt = time.perf_counter() - t0
+
+    print(
+        f"topology {topo.primary}: N= {len(selections):6d}"
+        f" nodes= {len(Q.nodes):3d} {dt:8.3f}s"
+    )
+
+
+def main(fnames):
+    G = native_graphs.native_graphs_load(fnames)
+    icd = native_graphs.native_graphs_intvec_codec(G[0])
+    for n in (30, 100, 300, 1000):
+        run(G, icd, topology.bond, n)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+"""
+Benchmark the latency of a local workspace.
+
+Trivial tasks are submitted to a local workspace and collected with
+workspace_flush, in batches of the given size. The time from the first
+submit to the last result is reported, so that the overhead of collecting
+results dominates.
+
+usage: python bench_workspace_flush.py [n_tasks] [batch_size]
+"""
+
+import sys
+import time
+
+from besmarts.core import compute
+from besmarts.core import configs
+
+
+def task(i, shm=None):
+    return i
+
+
+def run(wq, n, batchsize, chunksize):
+    ws = compute.workqueue_new_workspace(wq, address=("127.0.0.1", 0))
+
+    iterable = {i: ((i,), {}) for i in range(n)}
+
+    t0 = time.perf_counter()
+    results = compute.workspace_submit_and_flush(
+        ws, task, iterable, chunksize, 1.0, batchsize
+    )
+    dt = time.perf_counter() - t0
+
+    ws.close()
+
+    assert results == {i: i for i in range(n)}
+    print(
+        f"tasks= {n:6d} batch= {batchsize:6d} chunk= {chunksize:4d}"
+        f" {dt:8.3f}s {n/dt:10.1f} tasks/s"
+    )
+
+
+def main(n=10000, batchsize=1000):
+    configs.remote_compute_enable = False
+    wq = compute.workqueue_local("127.0.0.1", 0)
+    for chunksize in (1, 100):
+        run(wq, n, batchsize, chunksize)
+    wq.close()
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
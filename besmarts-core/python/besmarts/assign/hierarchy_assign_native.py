@@ -4,7 +4,8 @@ besmarts.assign.hierarchy_assign_native
 Assign molecule structures to a SMARTS hierarchy using pure BESMARTS matching
 """
 
-from typing import List
+from typing import List, Dict, Sequence
+import collections
 
 from besmarts.core import (
     codecs,
@@ -16,6 +17,7 @@ from besmarts.core import (
     tree_iterators,
     configs,
     mapper,
+    db,
 )
 from besmarts.cluster import cluster_assignment
 
@@ -120,12 +122,16 @@ def smarts_hierarchy_assign(
 
     roots = trees.tree_index_roots(sh.index)
 
-    for smi in smiles:
-        g = gcd.smiles_decode(smi)
-        ics = graphs.graph_to_structure_topology(g, topo)
-        selections = structure_hierarchy_assign(sh, roots, ics)
-        sa = cluster_assignment.smiles_assignment_str(smi, selections)
-        sag.append(sa)
+    try:
+        for smi in smiles:
+            g = db.db_smiles_decode(gcd, smi)
+            ics = graphs.graph_to_structure_topology(g, topo)
+            selections = structure_hierarchy_assign(sh, roots, ics)
+            sa = cluster_assignment.smiles_assignment_str(smi, selections)
+            sag.append(sa)
+    finally:
+        # pool workers exit without running atexit
+        db.db_smiles_cache_flush(gcd)
 
     return assignments.smiles_assignment_group(sag, topo)
 
@@ -168,8 +174,177 @@ def smarts_hierarchy_assign_outofplanes(
     sag = smarts_hierarchy_assign(sh, gcd, smiles, topology.outofplane)
     return sag
 
+# counts of the matches that were screened out and performed
+screen_stats = collections.Counter()
+
+
+def structure_fingerprint(g: graphs.structure):
+    """
+    Compute a cheap fingerprint of a structure that is used to screen out
+    patterns that cannot match. The fingerprint is the OR of the primitives
+    of the primary atoms, the OR of the primitives of the bonds between the
+    primary atoms, and the OR of the primitives of all atoms in the graph.
+
+    Parameters
+    ----------
+    g : graphs.structure
+        The structure to fingerprint
+
+    Returns
+    -------
+    Tuple[Dict[str, int], Dict[str, int], Dict[str, int]]
+        The primary atom, primary bond, and total atom fingerprints
+    """
+
+    primary = [g.select[i] for i in g.topology.primary]
+
+    atoms = {}
+    for n in primary:
+        for name, x in g.nodes[n].primitives.items():
+            atoms[name] = atoms.get(name, 0) | x.v
+
+    bonds = {}
+    for i, j in g.topology.connect:
+        e = graphs.edge((primary[i], primary[j]))
+        for name, x in g.edges[e].primitives.items():
+            bonds[name] = bonds.get(name, 0) | x.v
+
+    total = {}
+    for bechem in g.nodes.values():
+        for name, x in bechem.primitives.items():
+            total[name] = total.get(name, 0) | x.v
+
+    return atoms, bonds, total
+
+
+def structure_screen_mask(S: graphs.structure):
+    """
+    Compute the bits a structure needs to see in a fingerprint before it can
+    possibly be matched. Since each primary atom and bond of a structure
+    must be a subset of a primary atom or bond of the pattern, the OR of the
+    pattern primaries bounds the primaries of anything it matches. Every
+    other atom of the pattern must be matched by at least one atom in the
+    graph, and so each of these must overlap with the total fingerprint.
+
+    Parameters
+    ----------
+    S : graphs.structure
+        The pattern to build a mask for
+
+    Returns
+    -------
+    Tuple[Dict[str, int], Dict[str, int], List[Dict[str, int]]]
+        The allowed primary atom bits, the allowed primary bond bits, and the
+        primitives of each non-primary atom
+    """
+
+    primary = [S.select[i] for i in S.topology.primary]
+    atoms, bonds, _ = structure_fingerprint(S)
+
+    required = []
+    for n in S.select:
+        if n in primary:
+            continue
+        required.append(
+            {name: x.v for name, x in S.nodes[n].primitives.items()}
+        )
+
+    return atoms, bonds, required
+
+
+def structure_screen(fp, mask) -> bool:
+    """
+    Determine whether a structure with fingerprint fp can possibly match the
+    pattern of mask. A False result means the structure does not match, but
+    a True result must still be confirmed with a full match.
+
+    Parameters
+    ----------
+    fp : Tuple
+        The structure fingerprint from structure_fingerprint
+    mask : Tuple
+        The pattern mask from structure_screen_mask
+
+    Returns
+    -------
+    bool
+        Whether a full match is needed
+    """
+
+    for g_prims, s_prims in zip(fp[:2], mask[:2]):
+        for name, x in g_prims.items():
+            y = s_prims.get(name)
+            if y is not None and x & ~y:
+                return False
+
+    total = fp[2]
+    for prims in mask[2]:
+        for name, y in prims.items():
+            x = total.get(name)
+            if x is not None and not (x & y):
+                return False
+
+    return True
+
+
+def structure_extend_cached(
+    cache: collections.OrderedDict,
+    structs: Sequence[graphs.structure],
+    k: int,
+    depth: int,
+    cache_depths: int,
+) -> graphs.structure:
+    """
+    Return structure k extended to the given depth. Extended structures are
+    cached by depth and built on first use, so each structure is extended at
+    most once per depth. When more than cache_depths depths are held, the
+    least recently used depth is evicted. The structure that is returned is
+    the one held in the cache, so it must not be modified.
+
+    Parameters
+    ----------
+    cache : collections.OrderedDict
+        The cache of depth to extended structures
+    structs : Sequence[graphs.structure]
+        The unextended structures
+    k : int
+        The index of the structure to return
+    depth : int
+        The depth to extend to
+    cache_depths : int
+        The maximum number of depths to hold in the cache
+
+    Returns
+    -------
+    graphs.structure
+        The extended structure, shared with the cache
+    """
+
+    ext = cache.get(depth)
+    if ext is None:
+        ext = [None] * len(structs)
+        cache[depth] = ext
+        while len(cache) > max(1, cache_depths):
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(depth)
+
+    g = ext[k]
+    if g is None:
+        config = configs.smarts_extender_config(depth, depth, True)
+        g = graphs.structure_copy(structs[k])
+        mapper.mapper_smarts_extend(config, [g])
+        ext[k] = g
+
+    return g
+
+
 def structure_hierarchy_assign(
-    sh: hierarchies.structure_hierarchy, roots, structs
+    sh: hierarchies.structure_hierarchy,
+    roots,
+    structs,
+    screen=True,
+    cache_depths=4
 ):
     if len(structs) == 0:
         return {}
@@ -180,6 +355,8 @@ def structure_hierarchy_assign(
         tuple(g.select[i] for i in g.topology.primary): None for g in structs
     }
     ordering = {}
+    fps = [structure_fingerprint(g) for g in structs] if screen else None
+    extended = collections.OrderedDict()
 
     for root in roots:
         ordering.update({
@@ -208,12 +385,17 @@ def structure_hierarchy_assign(
 
             lbl = cur.name
             d = graphs.structure_max_depth(S0)
-            config = configs.smarts_extender_config(d, d, True)
+            mask = structure_screen_mask(S0) if screen else None
 
-            for g in structs:
+            for k, g in enumerate(structs):
                 assert S0.topology == g.topology
-                g = graphs.structure_copy(g)
-                mapper.mapper_smarts_extend(config, [g])
+                if screen and not structure_screen(fps[k], mask):
+                    screen_stats["screened"] += 1
+                    continue
+                screen_stats["matched"] += 1
+                g = structure_extend_cached(
+                    extended, structs, k, d, cache_depths
+                )
                 if not mapper.mapper_match(g, S0):
                     continue
                 ic = tuple(g.select[i] for i in g.topology.primary)
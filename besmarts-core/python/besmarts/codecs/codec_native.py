@@ -4,7 +4,9 @@ besmarts.codecs.codec_native
 SMARTS and SMILES parsing using native BESMARTS formats
 """
 
-from typing import Sequence, Dict
+import array
+import itertools
+from typing import Sequence, Dict, Iterable, Generator
 
 from besmarts.core import (
     graphs,
@@ -14,6 +16,7 @@ from besmarts.core import (
     graph_visitors,
     codecs,
     arrays,
+    db,
 )
 
 topology_tab = {
@@ -41,12 +44,21 @@ def graph_load(lines, dtype=arrays.bitvec):
     atom_codecs = [key for key in primitives.primitive_key_set]
     bond_codecs = [key for key in primitives.primitive_key_set]
 
-    line = [l for l in lines if l[0] == "#ATOM"]
+    # split the directives from the atoms and bonds in one pass
+    directives = {"#ATOM": [], "#BOND": []}
+    data = []
+    for line in lines:
+        if line[0].startswith("#"):
+            directives.setdefault(line[0], []).append(line)
+        else:
+            data.append(line)
+
+    line = directives["#ATOM"]
     assert len(line) == 1, f"Expected one #ATOM directive, found {len(line)}"
     atom_primitives = primitive_load(line[0], atom_codecs)
 
-    line = [l for l in lines if l[0] == "#BOND"]
-    assert len(line) == 1, "Expected one #BOND directive, found {len(line)}"
+    line = directives["#BOND"]
+    assert len(line) == 1, f"Expected one #BOND directive, found {len(line)}"
     bond_primitives = primitive_load(line[0], bond_codecs)
 
     atoms = {}
@@ -54,9 +66,7 @@ def graph_load(lines, dtype=arrays.bitvec):
 
     select = []
 
-    for line in lines:
-        if line[0].startswith("#"):
-            continue
+    for line in data:
         i, j = int(line[0]), int(line[1])
         if i == j:
             if i < 0:
@@ -117,10 +127,11 @@ def graph_save(g: graphs.graph, order=None):
         f"#BOND " + " ".join(bond_names),
     ]
 
+    select = set(getattr(g, "select", ()))
     for i in sorted(order):
         atom = order[i]
         _chem = g.nodes[atom]
-        if hasattr(g, "select") and atom in g.select:
+        if atom in select:
             atom = -atom
         line = f"{atom:3d} {atom:3d} " + " ".join(
             [f"{_chem.primitives[name].v:3d}" for name in atom_names]
@@ -146,37 +157,75 @@ def graph_save(g: graphs.graph, order=None):
     return lines
 
 
-def graph_codec_native_read(f) -> Sequence:
+def graph_codec_native_iter(f) -> Generator:
+    """
+    Read graphs from a file one at a time. The file is read in a single pass
+    and only the lines of the current graph are kept, so this can read a
+    pipe or a file that does not fit in memory.
 
-    graph_lines = []
-    f.seek(0)
-    for i, line in enumerate(f):
+    Parameters
+    ----------
+    f : file
+        The file to read from the current position
+
+    Returns
+    -------
+    Generator
+        The graphs in the order they appear in the file
+    """
+
+    lines = []
+    for line in f:
         tokens = line.split()
-        if tokens[0] == "#GRAPH":
-            graph_lines.append(i)
-    graph_lines.append(i + 1)
+        if not tokens:
+            continue
+        if tokens[0] == "#GRAPH" and lines:
+            yield graph_load(lines)
+            lines = []
+        lines.append(tokens)
 
-    f.seek(0)
-    graphs = []
-    for i, start in enumerate(graph_lines[:-1], 1):
-        n = graph_lines[i] - start
-        lines = [next(f) for _ in range(n)]
-        lines = [l.split() for l in lines if l]
-        graph = graph_load(lines)
-        graphs.append(graph)
+    if lines:
+        yield graph_load(lines)
 
-    return graphs
+
+def graph_codec_native_read(f) -> Sequence:
+
+    f.seek(0)
+    return list(graph_codec_native_iter(f))
 
 def graph_codec_native_load(fname) -> Sequence:
 
     with open(fname) as f:
         return graph_codec_native_read(f)
 
-def graph_codec_native_write(f, graphs):
+def graph_codec_native_stream(fname) -> Generator:
+    """
+    Read graphs from a file one at a time. See graph_codec_native_iter.
+    """
+
+    with open(fname) as f:
+        yield from graph_codec_native_iter(f)
+
+def graph_codec_native_write(f, graphs, buffer_size=1 << 20):
+    """
+    Write graphs to a file. The graphs are formatted into a buffer that is
+    written once it holds buffer_size characters, so graphs can be a
+    generator that is written as it is consumed.
+    """
 
+    buffer = []
+    n = 0
     for g in graphs:
-        lines = graph_save(g)
-        f.write("\n".join(lines) + "\n")
+        text = "\n".join(graph_save(g)) + "\n"
+        buffer.append(text)
+        n += len(text)
+        if n >= buffer_size:
+            f.write("".join(buffer))
+            buffer.clear()
+            n = 0
+
+    if buffer:
+        f.write("".join(buffer))
     return True
 
 def graph_codec_native_save(fname, graphs):
@@ -186,6 +235,249 @@ def graph_codec_native_save(fname, graphs):
     return True
 
 
+# the kind of each packed graph; structures add the index of their topology
+# in topology_tab
+PACKED_GRAPH = 0
+PACKED_SUBGRAPH = 1
+PACKED_STRUCTURE = 2
+
+
+def graph_pack(g: graphs.graph, atom_primitives, bond_primitives) -> array.array:
+    """
+    Encode a graph as a record of the packed format. The record is the kind
+    of graph, the number of nodes, edges, and selected nodes, followed by the
+    selection, then each node id and each edge id with the values of its
+    primitives.
+
+    Parameters
+    ----------
+    g : graphs.graph
+        The graph, subgraph, or structure to encode
+    atom_primitives : Sequence[str]
+        The names of the atom primitives to encode
+    bond_primitives : Sequence[str]
+        The names of the bond primitives to encode
+
+    Returns
+    -------
+    array.array
+    """
+
+    select = getattr(g, "select", ())
+    if hasattr(g, "topology"):
+        topo_names = list(topology_tab.values())
+        kind = PACKED_STRUCTURE + topo_names.index(g.topology)
+    elif hasattr(g, "select"):
+        kind = PACKED_SUBGRAPH
+    else:
+        kind = PACKED_GRAPH
+
+    # unlike the text format, the edges between unselected nodes are kept
+    edges = g.edges
+
+    rec = array.array("q", [kind, len(g.nodes), len(edges), len(select)])
+    rec.extend(select)
+    for i, atom in g.nodes.items():
+        rec.append(i)
+        rec.extend([atom.primitives[name].v for name in atom_primitives])
+    for (i, j) in edges:
+        rec.append(i)
+        rec.append(j)
+        bond = g.edges[(i, j)]
+        rec.extend([bond.primitives[name].v for name in bond_primitives])
+
+    return rec
+
+
+def graph_unpack(
+    rec: Sequence[int], atom_primitives, bond_primitives, dtype=arrays.bitvec
+) -> graphs.graph:
+    """
+    Decode a record of the packed format. See graph_pack.
+
+    Parameters
+    ----------
+    rec : Sequence[int]
+        The record
+    atom_primitives : Sequence[str]
+        The names of the atom primitives in the record
+    bond_primitives : Sequence[str]
+        The names of the bond primitives in the record
+
+    Returns
+    -------
+    graphs.graph
+        The graph, subgraph, or structure that was encoded
+    """
+
+    kind, n_nodes, n_edges, n_select = rec[:4]
+    idx = 4 + n_select
+    select = tuple(rec[4:idx])
+
+    na = len(atom_primitives)
+    atoms = {}
+    for _ in range(n_nodes):
+        bechem = {
+            name: dtype(x)
+            for name, x in zip(atom_primitives, rec[idx + 1:idx + 1 + na])
+        }
+        atoms[rec[idx]] = chem.bechem(bechem, tuple(bechem))
+        idx += 1 + na
+
+    nb = len(bond_primitives)
+    bonds = {}
+    for _ in range(n_edges):
+        bechem = {
+            name: dtype(x)
+            for name, x in zip(bond_primitives, rec[idx + 2:idx + 2 + nb])
+        }
+        bonds[(rec[idx], rec[idx + 1])] = chem.bechem(bechem, tuple(bechem))
+        idx += 2 + nb
+
+    if kind >= PACKED_STRUCTURE:
+        topo = list(topology_tab.values())[kind - PACKED_STRUCTURE]
+        return graphs.structure(atoms, bonds, select, topo)
+    elif kind == PACKED_SUBGRAPH:
+        return graphs.subgraph(atoms, bonds, select)
+    else:
+        return graphs.graph(atoms, bonds)
+
+
+class graph_codec_native_packed:
+    """
+    Graphs in the packed format. This is the binary companion of the native
+    text format: each graph is a record in a db_table, so any graph can be
+    read without reading the graphs before it. The primitive names are kept
+    in a text header next to the table, as the #ATOM and #BOND directives
+    of the text format.
+    """
+
+    __slots__ = "path", "atom_primitives", "bond_primitives", "table"
+
+    def __init__(self, path, atom_primitives, bond_primitives, table):
+        self.path: str = path
+        self.atom_primitives: Sequence[str] = atom_primitives
+        self.bond_primitives: Sequence[str] = bond_primitives
+        self.table: db.db_table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i) -> graphs.graph:
+        return graph_codec_native_packed_read(self, i)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def graph_codec_native_pack(
+    path, graphs: Iterable, atom_primitives=None, bond_primitives=None
+) -> graph_codec_native_packed:
+    """
+    Write graphs in the packed format, replacing any graphs that were
+    packed to the path before. The graphs are consumed one at a time, so
+    a text file can be converted with graph_codec_native_stream without
+    loading it. All graphs must perceive the same primitives.
+
+    Parameters
+    ----------
+    path : str
+        The path of the packed graphs. The records are path.dat and path.idx
+        and the header is path.hdr
+    graphs : Iterable[graphs.graph]
+        The graphs to write
+    atom_primitives : Sequence[str]
+        The names of the atom primitives. If None, the names are taken from
+        the first graph that has atoms
+    bond_primitives : Sequence[str]
+        The names of the bond primitives. If None, the names are taken from
+        the first graph that has bonds
+
+    Returns
+    -------
+    graph_codec_native_packed
+    """
+
+    graphs = iter(graphs)
+
+    # hold the graphs until one with atoms and one with bonds are seen
+    head = []
+    if atom_primitives is None or bond_primitives is None:
+        for g in graphs:
+            head.append(g)
+            if atom_primitives is None and g.nodes:
+                atom_primitives = next(iter(g.nodes.values())).select
+            if bond_primitives is None and g.edges:
+                bond_primitives = next(iter(g.edges.values())).select
+            if atom_primitives is not None and bond_primitives is not None:
+                break
+    graphs = itertools.chain(head, graphs)
+    atom_primitives = tuple(atom_primitives or ())
+    bond_primitives = tuple(bond_primitives or ())
+
+    def records():
+        for g in graphs:
+            for atom in g.nodes.values():
+                assert tuple(atom.select) == atom_primitives, (
+                    f"Expected atom primitives {atom_primitives}"
+                )
+                break
+            for bond in g.edges.values():
+                assert tuple(bond.select) == bond_primitives, (
+                    f"Expected bond primitives {bond_primitives}"
+                )
+                break
+            yield graph_pack(g, atom_primitives, bond_primitives)
+
+    db.db_table_remove(path)
+    with open(path + ".hdr", "w") as f:
+        f.write("#ATOM " + " ".join(atom_primitives) + "\n")
+        f.write("#BOND " + " ".join(bond_primitives) + "\n")
+
+    table = db.db_table_open(path, "q", create=True)
+    db.db_table_append(table, records())
+
+    return graph_codec_native_packed(
+        path, atom_primitives, bond_primitives, table
+    )
+
+
+def graph_codec_native_unpack(path) -> graph_codec_native_packed:
+    """
+    Open graphs that were written in the packed format.
+
+    Parameters
+    ----------
+    path : str
+        The path that was given to graph_codec_native_pack
+
+    Returns
+    -------
+    graph_codec_native_packed
+    """
+
+    with open(path + ".hdr") as f:
+        header = {line[0]: tuple(line[1:]) for line in map(str.split, f)}
+
+    return graph_codec_native_packed(
+        path, header["#ATOM"], header["#BOND"], db.db_table_open(path, "q")
+    )
+
+
+def graph_codec_native_packed_read(
+    packed: graph_codec_native_packed, i: int
+) -> graphs.graph:
+    """
+    Read and decode graph i of packed graphs.
+    """
+
+    return graph_unpack(
+        db.db_table_read(packed.table, i),
+        packed.atom_primitives,
+        packed.bond_primitives,
+    )
+
+
 class graph_codec_native(codecs.graph_codec):
     def __init__(
         self,
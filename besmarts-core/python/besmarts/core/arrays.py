@@ -325,6 +325,252 @@ def bitvec_superset(a: bitvec, b: bitvec) -> bool:
     return b.v == (a.v & b.v)
 
 
+class bitvec_batch:
+
+    """
+    Holds the values of many bitvecs of a single primitive, packed into
+    fixed-width lanes of a single integer so that operations act on every
+    value at once. Each lane is a multiple of 64 bits wide and holds a value
+    in two's complement, so the bits of an inverted (negative) value are on
+    up to the top of its lane. The inverted values are also flagged in neg,
+    one bit per lane.
+    """
+
+    __slots__ = "v", "neg", "n", "lane", "maxbits"
+
+    def __init__(self, v=0, neg=0, n=0, lane=64, maxbits=63):
+        self.v: int = v
+        self.neg: int = neg
+        self.n: int = n
+        self.lane: int = lane
+        self.maxbits: int = maxbits
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __and__(self, o) -> "bitvec_batch":
+        return bitvec_batch_and(self, o)
+
+    def __or__(self, o) -> "bitvec_batch":
+        return bitvec_batch_or(self, o)
+
+    def __sub__(self, o) -> "bitvec_batch":
+        return bitvec_batch_subtract(self, o)
+
+
+def bitvec_batch_lane(width: int) -> int:
+    """
+    Return the lane width needed to hold values of width bits and their sign.
+    Values of 64 bits or more use lanes of several 64 bit words.
+    """
+    return 64 * (width // 64 + 1)
+
+
+def bitvec_batch_pack(bvs: List[bitvec], maxbits=None) -> bitvec_batch:
+    """
+    Pack a sequence of bitvecs into a batch.
+
+    Parameters
+    ----------
+    bvs : List[bitvec]
+        The bitvecs to pack
+    maxbits : int
+        The number of bits to keep from each value. The default is the largest
+        maxbits of the input, or INF if any input is unbounded. Values are
+        only truncated if a bounded maxbits is given; otherwise the lanes are
+        sized from the bit length of the values so that every bit is kept.
+
+    Returns
+    -------
+    bitvec_batch
+    """
+
+    truncate = maxbits is not None and maxbits != INF
+    if maxbits is None:
+        maxbits = max((bv.maxbits for bv in bvs), default=63)
+        if any(bv.maxbits == INF for bv in bvs):
+            maxbits = INF
+
+    if truncate:
+        width = maxbits
+        keep = (1 << maxbits) - 1
+    else:
+        width = max([maxbits] + [bv.v.bit_length() for bv in bvs])
+    lane = bitvec_batch_lane(width)
+    mask = (1 << lane) - 1
+
+    v = 0
+    neg = 0
+    for i, bv in enumerate(bvs):
+        x = bv.v
+        if truncate:
+            x = (x & keep) | (~keep if x < 0 else 0)
+        v |= (x & mask) << (i * lane)
+        if x < 0:
+            neg |= 1 << i
+
+    return bitvec_batch(v, neg, len(bvs), lane, maxbits)
+
+
+def bitvec_batch_outer(
+    a: bitvec_batch, b: bitvec_batch
+) -> Tuple[bitvec_batch, bitvec_batch]:
+    """
+    Broadcast two batches against each other such that lane i*len(b) + j of
+    the results holds a[i] and b[j], respectively.
+
+    Parameters
+    ----------
+    a : bitvec_batch
+    b : bitvec_batch
+
+    Returns
+    -------
+    Tuple[bitvec_batch, bitvec_batch]
+    """
+
+    lane = max(a.lane, b.lane)
+    a = bitvec_batch_relane(a, lane)
+    b = bitvec_batch_relane(b, lane)
+    n, m = a.n, b.n
+
+    # the multiplications below copy values into lanes with no carries
+    rep = sum(1 << (j * lane) for j in range(m))
+    rep_neg = (1 << m) - 1
+    v = 0
+    neg = 0
+    for i in range(n):
+        x = (a.v >> (i * lane)) & ((1 << lane) - 1)
+        v |= (x * rep) << (i * m * lane)
+        if (a.neg >> i) & 1:
+            neg |= rep_neg << (i * m)
+    a_rep = bitvec_batch(v, neg, n * m, lane, a.maxbits)
+
+    tile = sum(1 << (i * m * lane) for i in range(n))
+    tile_neg = sum(1 << (i * m) for i in range(n))
+    b_tile = bitvec_batch(b.v * tile, b.neg * tile_neg, n * m, lane, b.maxbits)
+
+    return a_rep, b_tile
+
+
+def bitvec_batch_relane(b: bitvec_batch, lane: int) -> bitvec_batch:
+    """
+    Return a batch with the same values in lanes of the given width, which
+    must be at least as wide as the lanes of b.
+    """
+
+    if b.lane == lane:
+        return b
+
+    mask = (1 << lane) - 1
+    v = 0
+    for i, x in enumerate(bitvec_batch_unpack(b)):
+        v |= (x & mask) << (i * lane)
+    return bitvec_batch(v, b.neg, b.n, lane, b.maxbits)
+
+
+def bitvec_batch_unpack(b: bitvec_batch) -> List[int]:
+    """
+    Return the values of a batch as integers, in the same form as bitvec.v
+    """
+
+    words = bitvec_batch_words(b.v, b.n, b.lane)
+    k = b.lane // 64
+    vals = []
+    for i in range(b.n):
+        x = 0
+        for w in range(k):
+            x |= words[i * k + w] << (64 * w)
+        if (b.neg >> i) & 1:
+            x |= -1 << b.lane
+        vals.append(x)
+    return vals
+
+
+def bitvec_batch_words(v: int, n: int, lane: int) -> array.array:
+    """
+    Split the lanes of a batch into 64 bit words.
+    """
+    words = array.array("Q")
+    nbytes = n * lane // 8
+    if nbytes:
+        words.frombytes(v.to_bytes(nbytes, "little"))
+    return words
+
+
+def bitvec_batch_and(a: bitvec_batch, b: bitvec_batch) -> bitvec_batch:
+    return bitvec_batch(
+        a.v & b.v, a.neg & b.neg, a.n, a.lane, min(a.maxbits, b.maxbits)
+    )
+
+
+def bitvec_batch_or(a: bitvec_batch, b: bitvec_batch) -> bitvec_batch:
+    return bitvec_batch(
+        a.v | b.v, a.neg | b.neg, a.n, a.lane, max(a.maxbits, b.maxbits)
+    )
+
+
+def bitvec_batch_subtract(a: bitvec_batch, b: bitvec_batch) -> bitvec_batch:
+    return bitvec_batch(a.v & ~b.v, a.neg & ~b.neg, a.n, a.lane, a.maxbits)
+
+
+def bitvec_batch_any(a: bitvec_batch) -> List[bool]:
+    """
+    Return whether each value of a batch has any bit on.
+    """
+    words = bitvec_batch_words(a.v, a.n, a.lane)
+    k = a.lane // 64
+    return [
+        bool((a.neg >> i) & 1) or any(words[i * k:(i + 1) * k])
+        for i in range(a.n)
+    ]
+
+
+def bitvec_batch_subset(a: bitvec_batch, b: bitvec_batch) -> List[bool]:
+    """
+    Return whether each value of a is a subset of the value of b in the same
+    lane.
+    """
+    return [not x for x in bitvec_batch_any(bitvec_batch_subtract(a, b))]
+
+
+def bitvec_batch_intersects(a: bitvec_batch, b: bitvec_batch) -> List[bool]:
+    """
+    Return whether each value of a shares any bits with the value of b in the
+    same lane.
+    """
+    return bitvec_batch_any(bitvec_batch_and(a, b))
+
+
+def bitvec_batch_bits(a: bitvec_batch, maxbits=False) -> List[int]:
+    """
+    Return the number of bits on of each value in a batch, following the
+    same rules as bitvec_bits. Only the lowest maxbits bits are counted,
+    except that every bit of an unbounded (INF) value is counted.
+    """
+
+    nbits = a.n * a.lane
+    full = (1 << nbits) - 1
+    x = a.v
+    if a.maxbits != INF and a.maxbits < a.lane:
+        x &= ((1 << a.maxbits) - 1) * (full // ((1 << a.lane) - 1))
+
+    # count the bits of each 64 bit word in parallel
+    for shift, div in ((1, 3), (2, 5), (4, 17), (8, 257), (16, 65537)):
+        m = full // div
+        x = (x & m) + ((x >> shift) & m)
+    m = full // ((1 << 32) + 1)
+    x = (x & m) + ((x >> 32) & m)
+
+    words = bitvec_batch_words(x, a.n, a.lane)
+    k = a.lane // 64
+    inv = a.maxbits if maxbits else INF
+    return [
+        inv if (a.neg >> i) & 1 else sum(words[i * k:(i + 1) * k])
+        for i in range(a.n)
+    ]
+
+
 array_dtype = type(bitvec)
 
 
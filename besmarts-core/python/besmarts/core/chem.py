@@ -9,6 +9,7 @@ molecular information contained in the graph.
 from typing import Dict, List, Sequence, Generator, Tuple
 
 from besmarts.core import arrays
+from besmarts.core import configs
 from besmarts.core.primitives import primitive_key, primitive_key_set
 
 class bechem:
@@ -344,6 +345,47 @@ def bechem_align_score(bc: bechem, o: bechem) -> int:
     return bechem_bits(bc & o, maxbits=True)
 
 
+def bechem_batch_overlap(A: List[bechem], B: List[bechem]) -> List[List[int]]:
+    """
+    Return the overlap score, as given by bechem_align_score, of every pair of
+    A and B. The primitives are compared as batches rather than pair by pair
+    if there are at least configs.bechem_batch_min_pairs pairs.
+
+    Parameters
+    ----------
+    A : List[bechem]
+    B : List[bechem]
+
+    Returns
+    -------
+    List[List[int]]
+        The scores, where element [i][j] is the score of A[i] and B[j]
+    """
+
+    n, m = len(A), len(B)
+    scores = [0] * (n * m)
+    if not n or not m:
+        return [[] for _ in A]
+
+    if n * m < configs.bechem_batch_min_pairs:
+        return [[bechem_align_score(x, y) for y in B] for x in A]
+
+    for name in A[0].select:
+        a = [bc.primitives[name] for bc in A]
+        b = [bc.primitives[name] for bc in B]
+        widths = set(x.maxbits for x in a).union(x.maxbits for x in b)
+        if len(widths) > 1:
+            bits = [(x & y).bits(maxbits=True) for x in a for y in b]
+        else:
+            a, b = arrays.bitvec_batch_outer(
+                arrays.bitvec_batch_pack(a), arrays.bitvec_batch_pack(b)
+            )
+            bits = arrays.bitvec_batch_bits(a & b, maxbits=True)
+        scores = [x + y for x, y in zip(scores, bits)]
+
+    return [scores[i * m:(i + 1) * m] for i in range(n)]
+
+
 def bechem_copy(bc: bechem) -> bechem:
     """
     Return a copy of bc.
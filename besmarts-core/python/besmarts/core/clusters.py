@@ -9,6 +9,7 @@ import sys
 import pickle
 import datetime
 import collections
+import itertools
 import multiprocessing.pool
 import threading
 import time
@@ -30,6 +31,7 @@ from besmarts.core import (
     splits,
     compute,
     arrays,
+    db,
 )
 from besmarts.cluster import cluster_assignment
 
@@ -169,12 +171,19 @@ def find_successful_candidates_distributed(S, Sj, operation, edits, shm=None):
         hidx.smarts[hent.index] = shm.gcd.smarts_encode(graphs.subgraph_as_structure(Sj, topo))
 
         # print(datetime.datetime.now(), '*** 4')
-        new_assignments = labeler.assign(hidx, gcd, smiles, topo)
+        if configs.clustering_incremental_labeling:
+            cst = clustering_update_split(
+                cst, hidx, S, hent, labeler, gcd, smiles
+            )
+        else:
+            new_assignments = labeler.assign(hidx, gcd, smiles, topo)
 
-        # print(datetime.datetime.now(), '*** 5')
-        new_match = clustering_build_assignment_mappings(hidx, new_assignments)
+            # print(datetime.datetime.now(), '*** 5')
+            new_match = clustering_build_assignment_mappings(
+                hidx, new_assignments
+            )
 
-        cst = smarts_clustering(hidx, new_assignments, new_match)
+            cst = smarts_clustering(hidx, new_assignments, new_match)
 
         # print(datetime.datetime.now(), '*** 6')
         groups = clustering_build_ordinal_mappings(cst, sag, [S.name, hent.name])
@@ -219,10 +228,17 @@ def find_successful_candidates_distributed(S, Sj, operation, edits, shm=None):
         obj = objective.merge(groups[S.name], groups[hent.name], overlap=edits)
         trees.tree_index_node_remove(hidx.index, Sj.index)
         # print(datetime.datetime.now(), '*** 9')
-        new_assignments = labeler.assign(hidx, gcd, smiles, topo)
-        # print(datetime.datetime.now(), '*** 10')
-        new_match = clustering_build_assignment_mappings(hidx, new_assignments)
-        cst = smarts_clustering(hidx, new_assignments, new_match)
+        if configs.clustering_incremental_labeling:
+            cst = clustering_update_merge(
+                cst, hidx, hent, labeler, gcd, smiles
+            )
+        else:
+            new_assignments = labeler.assign(hidx, gcd, smiles, topo)
+            # print(datetime.datetime.now(), '*** 10')
+            new_match = clustering_build_assignment_mappings(
+                hidx, new_assignments
+            )
+            cst = smarts_clustering(hidx, new_assignments, new_match)
         # print(datetime.datetime.now(), '*** 11')
         _, X = get_objective(cst, assn, objective.split, edits, splitting=False)
         # Sj = hidx.subgraphs[Sj.index]
@@ -434,10 +450,34 @@ def smarts_clustering_optimize(
     strategy: optimization.optimization_strategy,
     initial_conditions: smarts_clustering,
 ) -> smarts_clustering:
+    """
+    Optimize a SMARTS clustering. The split searches of the optimization
+    share one segment of the graphs of the dataset, which is removed when
+    the optimization ends.
+    """
+
+    try:
+        return smarts_clustering_optimize_search(
+            gcd, labeler, sag, objective, strategy, initial_conditions
+        )
+    finally:
+        splits.split_segment_close()
+
+
+def smarts_clustering_optimize_search(
+    gcd: codecs.graph_codec,
+    labeler: assignments.smarts_hierarchy_assignment,
+    sag: assignments.smiles_assignment_group,
+    objective: clustering_objective,
+    strategy: optimization.optimization_strategy,
+    initial_conditions: smarts_clustering,
+) -> smarts_clustering:
 
     # gc.disable()
     started = datetime.datetime.now()
 
+    clustering_union_ctx.unions.clear()
+
     smiles = [a.smiles for a in sag.assignments]
 
     topo = sag.topology
@@ -478,7 +518,15 @@ def smarts_clustering_optimize(
     group_number += 1
 
     # gc.collect()
-    if len(sag.assignments) > 100000:
+    smiles = [a.smiles for a in sag.assignments]
+
+    # graphs decoded by a previous run are read from the cache
+    decoded = db.db_smiles_cache_read(gcd, smiles)
+    if decoded:
+        print(f"{datetime.datetime.now()} Read {len(decoded)} graphs from the SMILES cache")
+    todo = [smi for smi in dict.fromkeys(smiles) if smi not in decoded]
+
+    if len(todo) > 100000:
         batch_size = 10000
         print(f"{datetime.datetime.now()} Large number of graphs detected... using a workspace")
         wq = compute.workqueue_local('', configs.workqueue_port)
@@ -487,19 +535,16 @@ def smarts_clustering_optimize(
         work = compute.workspace_submit_and_flush(
             ws,
             codecs.smiles_decode_list_distributed,
-            {i: ((list(e),), {}) for i, e in enumerate(arrays.batched((s.smiles for s in sag.assignments), batch_size))},
+            {i: ((list(e),), {}) for i, e in enumerate(arrays.batched(todo, batch_size))},
             chunksize=10
         )
         
-        G0 = {}
-        n_ics = 0
+        new = {}
         for ii in sorted(work):
             i = 0
             for i, ig in enumerate(work[ii], ii*batch_size):
-                G0[i] = ig
-                sels = sag.assignments[i].selections
-                n_ics += len(sels)
-            print(f"\r{datetime.datetime.now()} graphs= {i+1:8d}/{len(sag.assignments)} subgraphs= {n_ics:8d}", end="")
+                new[todo[i]] = ig
+            print(f"\r{datetime.datetime.now()} graphs= {i+1:8d}/{len(todo)}", end="")
         print()
             
             
@@ -513,8 +558,12 @@ def smarts_clustering_optimize(
 
     else:
 
-        G0 = {i: icd.graph_encode(gcd.smiles_decode(a.smiles)) for i, a in enumerate(sag.assignments)}
-        n_ics = sum((len(s.selections) for s in sag.assignments))
+        new = {smi: icd.graph_encode(gcd.smiles_decode(smi)) for smi in todo}
+
+    db.db_smiles_cache_write(gcd, new)
+    decoded.update(new)
+    G0 = {i: decoded[smi] for i, smi in enumerate(smiles)}
+    n_ics = sum((len(s.selections) for s in sag.assignments))
 
     N = len(hidx.index.nodes)
     try:
@@ -750,6 +799,24 @@ def smarts_clustering_optimize(
                     step_tracker[S.name] = strategy.cursor
                     continue
 
+                # search on the unique environments only; selections with
+                # the same environment at depth d can never be split. The
+                # candidates are still scored on all selections
+                aa_split = aa
+                aa_groups = None
+                if configs.clustering_compress_selections:
+                    aa_split, aa_groups = clustering_compress_selections(
+                        G, aa, topo, d, icd
+                    )
+                    print(
+                        f"{datetime.datetime.now()} Compressed N={len(aa)}"
+                        f" to {len(aa_split)} unique environments at depth={d}"
+                    )
+                    if len(aa_split) < 2:
+                        print(f"Skipping {S.name} since all environments are the same")
+                        step_tracker[S.name] = strategy.cursor
+                        continue
+
                 if (
                     step.direct_enable
                 ):  # and config.splitter.bit_search_limit > 2:
@@ -822,13 +889,15 @@ def smarts_clustering_optimize(
                     #     max_depth=graphs.structure_max_depth(S0),
                     #     icd=icd if len(a) > 100000 else None
                     # )
-                    Q = mapper.union_list_parallel(
-                        G, aa, topo,
-                        # list(a.values()),
-                        reference=S0,
-                        max_depth=graphs.structure_max_depth(S0),
-                        icd=icd
-                        # icd=icd if len(a) > 100000 else None
+                    Q = clustering_union_get(
+                        S.name,
+                        G,
+                        aa,
+                        topo,
+                        S0,
+                        graphs.structure_max_depth(S0),
+                        icd,
+                        unique=aa_split
                     )
 
                     t = datetime.datetime.now()
@@ -837,17 +906,22 @@ def smarts_clustering_optimize(
                     return_matches = config.splitter.return_matches
                     config.splitter.return_matches = True
 
+                    # the whole dataset is passed so that each split
+                    # reuses the same shared segment
                     ret = splits.split_structures_distributed(
                         config.splitter,
                         S0,
-                        G,
-                        aa,
+                        G0,
+                        aa_split,
                         compute.workqueue_local("", configs.workqueue_port),
                         icd,
                         Q=Q,
                     )
                     config.splitter.return_matches = return_matches
 
+                    if aa_groups is not None:
+                        ret = clustering_expand_split_return(ret, aa, aa_groups)
+
                     backmap = {i: j for i, j in enumerate(cst.mappings[S.name])}
                     print(
                         f"{datetime.datetime.now()} Collecting new candidates"
@@ -1575,6 +1649,363 @@ def clustering_collect_structures(A, matches, topo, extend):
     return a
 
 
+def clustering_compress_selections(
+    G: Dict[int, graphs.graph],
+    selections,
+    topo,
+    depth: int,
+    icd: codecs.intvec_codec
+) -> Tuple[List, List[List[int]]]:
+    """
+    Collapse the selections of a dataset into the selections with unique
+    environments, where the environment of a selection is its structure
+    extended to the given depth. Selections with the same environment match
+    any SMARTS pattern of at most that depth the same way, and so cannot be
+    split from each other.
+
+    Only the split search uses the compressed selections. Candidates are
+    still labeled and scored on every selection, so the objective is not
+    merged over the selections of an environment.
+
+    Parameters
+    ----------
+    G : Dict[int, graphs.graph]
+        The encoded graphs of the dataset, keyed by graph index.
+    selections : List[Tuple[int, Tuple[int]]]
+        The graph index and selected nodes of each selection.
+    topo : structure_topology
+        The topology of the selections.
+    depth : int
+        The depth to extend the selections to.
+    icd : codecs.intvec_codec
+        The codec used to decode the graphs.
+
+    Returns
+    -------
+    Tuple[List, List[List[int]]]
+        The first selection of each unique environment, in the order of the
+        input, and the indices of the input selections in each environment.
+    """
+
+    config = configs.smarts_extender_config(depth, depth, True)
+
+    structs = []
+    for i, group in itertools.groupby(selections, key=lambda x: x[0]):
+        g = icd.graph_decode(G[i])
+        sels = [sel for _, sel in group]
+        for s in graphs.graph_to_structures_extend(g, sels, topo, config):
+            structs.append(graphs.structure_remove_unselected(s))
+
+    groups = [sorted(x) for x in mapper.group_by_isomorphism(structs)]
+    groups.sort(key=lambda x: x[0])
+    unique = [selections[x[0]] for x in groups]
+
+    return unique, groups
+
+
+def clustering_expand_split_return(
+    ret: splits.split_return_type, selections, groups: List[List[int]]
+) -> splits.split_return_type:
+    """
+    Expand the matches of a split search on compressed selections back to
+    the original selections.
+
+    Parameters
+    ----------
+    ret : splits.split_return_type
+        The result of the split search on the compressed selections.
+    selections : List[Tuple[int, Tuple[int]]]
+        The original selections.
+    groups : List[List[int]]
+        The indices of the original selections in each compressed selection,
+        as returned by clustering_compress_selections.
+
+    Returns
+    -------
+    splits.split_return_type
+        The result of the split search in terms of the original selections.
+    """
+
+    matched = tuple(
+        tuple(sorted(i for j in m for i in groups[j])) for m in ret.matched_idx
+    )
+    seen = set(i for m in matched for i in m)
+    unmatch = tuple((i for i in range(len(selections)) if i not in seen))
+
+    return splits.split_return_type(
+        ret.splits, ret.shards, matched, unmatch, selections, ret.topology
+    )
+
+
+class clustering_union:
+    """
+    The union of the selections of a cluster, kept up to date as selections
+    enter and leave the cluster. The union is built once, and is then the
+    frame that each distinct environment of the cluster is mapped onto. The
+    number of environments that set each bit of the frame is counted, so
+    that a bit is removed once the last environment that sets it leaves.
+    Environments are bucketed by hash but are only shared by selections
+    that are equal, so a hash collision cannot drop the bits of one.
+    """
+
+    __slots__ = "frame", "key", "members", "envs", "hashes", "serial", "counts"
+
+    def __init__(self, frame: graphs.structure, key):
+        # the union that the environments are mapped onto
+        self.frame: graphs.structure = frame
+
+        # the reference and depth the union was built with
+        self.key = key
+
+        # the environment of each selection
+        self.members: Dict[Tuple, int] = {}
+
+        # the number of selections with each environment, its bits, and the
+        # environment itself
+        self.envs: Dict[int, List] = {}
+
+        # the environments with each hash
+        self.hashes: Dict[int, List[int]] = {}
+
+        # the id of the next environment
+        self.serial = 0
+
+        # the number of environments that set each bit of the frame
+        self.counts: Dict[Tuple, collections.Counter] = {}
+
+
+class clustering_union_ctx:
+    # the union of each cluster by name
+    unions = {}
+
+
+def clustering_union_structures(
+    g, sels, topo, depth: int
+) -> List[graphs.structure]:
+    """
+    Return the selections of a graph as the structures they contribute to a
+    union.
+    """
+
+    config = configs.smarts_extender_config(depth, depth, True)
+    structs = graphs.graph_to_structures_extend(g, sels, topo, config)
+    return [graphs.structure_up_to_depth(s, depth) for s in structs]
+
+
+def clustering_union_env_find(U: clustering_union, s: graphs.structure):
+    """
+    Return the id of the environment of a union that is equal to s, or None.
+    """
+
+    for eid in U.hashes.get(hash(s), ()):
+        if mapper.mapper_equal(s, U.envs[eid][2]):
+            return eid
+    return None
+
+
+def clustering_union_env_add(U: clustering_union, s: graphs.structure):
+    """
+    Map a new environment onto the frame of a union and count its bits.
+
+    Returns
+    -------
+    int
+        The id of the environment, or None if it does not fit in the frame.
+    """
+
+    M = mapper.map_to(s, U.frame).map
+    if M is None or any(M.get(n) is None for n in s.nodes):
+        return None
+
+    bits = []
+    for n, bc in s.nodes.items():
+        for p, bv in bc.primitives.items():
+            bits.append(((M[n], p), bv.v & ((1 << bv.maxbits) - 1)))
+    for e, bc in s.edges.items():
+        e = graphs.edge((M[e[0]], M[e[1]]))
+        if e not in U.frame.edges:
+            return None
+        for p, bv in bc.primitives.items():
+            bits.append(((e, p), bv.v & ((1 << bv.maxbits) - 1)))
+
+    for k, v in bits:
+        c = U.counts.setdefault(k, collections.Counter())
+        for b in range(v.bit_length()):
+            if (v >> b) & 1:
+                c[b] += 1
+
+    eid = U.serial
+    U.serial += 1
+    U.envs[eid] = [0, bits, s]
+    U.hashes.setdefault(hash(s), []).append(eid)
+    return eid
+
+
+def clustering_union_env_remove(U: clustering_union, eid: int) -> None:
+    """
+    Remove an environment from a union, clearing the bits that no other
+    environment sets.
+    """
+
+    _, bits, s = U.envs.pop(eid)
+    h = hash(s)
+    U.hashes[h].remove(eid)
+    if not U.hashes[h]:
+        del U.hashes[h]
+    for k, v in bits:
+        c = U.counts[k]
+        for b in range(v.bit_length()):
+            if (v >> b) & 1:
+                c[b] -= 1
+                if c[b] == 0:
+                    del c[b]
+
+
+def clustering_union_update(
+    U: clustering_union,
+    G: Dict[int, graphs.graph],
+    selections,
+    topo,
+    depth: int,
+    icd: codecs.intvec_codec
+) -> bool:
+    """
+    Update the members of a union to the given selections. Only the
+    selections that entered or left the union are visited.
+
+    Returns
+    -------
+    bool
+        Whether all selections fit in the frame of the union. If not, the
+        union must be rebuilt.
+    """
+
+    current = set(selections)
+    for x in [x for x in U.members if x not in current]:
+        eid = U.members.pop(x)
+        U.envs[eid][0] -= 1
+        if U.envs[eid][0] == 0:
+            clustering_union_env_remove(U, eid)
+
+    new = [x for x in dict.fromkeys(selections) if x not in U.members]
+    for i, group in itertools.groupby(new, key=lambda x: x[0]):
+        group = list(group)
+        g = icd.graph_decode(G[i])
+        structs = clustering_union_structures(
+            g, [sel for _, sel in group], topo, depth
+        )
+        for x, s in zip(group, structs):
+            eid = clustering_union_env_find(U, s)
+            if eid is None:
+                eid = clustering_union_env_add(U, s)
+                if eid is None:
+                    return False
+            U.envs[eid][0] += 1
+            U.members[x] = eid
+
+    return True
+
+
+def clustering_union_get_structure(U: clustering_union) -> graphs.structure:
+    """
+    Return the union as a structure. Nodes of the frame that no member maps
+    to are removed.
+    """
+
+    Q = graphs.structure_copy(U.frame)
+    empty = []
+    for n, bc in Q.nodes.items():
+        on = False
+        for p, bv in bc.primitives.items():
+            bv.v = sum(1 << b for b in U.counts.get((n, p), ()))
+            on = on or bv.v
+        if not on:
+            empty.append(n)
+    for e, bc in Q.edges.items():
+        for p, bv in bc.primitives.items():
+            bv.v = sum(1 << b for b in U.counts.get((e, p), ()))
+
+    if empty:
+        Q = graphs.structure_remove_nodes(Q, empty)
+    return Q
+
+
+def clustering_union_get(
+    name: str,
+    G: Dict[int, graphs.graph],
+    selections,
+    topo,
+    reference: graphs.structure,
+    depth: int,
+    icd: codecs.intvec_codec,
+    unique=None,
+) -> graphs.structure:
+    """
+    Return the union of the selections of a cluster. The union of the
+    cluster is updated with the selections that entered or left the cluster
+    since the last call, and is only built from scratch the first time or if
+    a new selection does not fit. At depth 0 the result equals a union built
+    from scratch. At greater depths the selections are aligned to the frame
+    of the first union rather than to each other, so the nodes and bits may
+    differ from a union built from scratch, but every selection maps into
+    the union. Every union is built from scratch if
+    configs.clustering_incremental_union is False.
+
+    Parameters
+    ----------
+    name : str
+        The name of the cluster.
+    G : Dict[int, graphs.graph]
+        The encoded graphs of the dataset, keyed by graph index.
+    selections : List[Tuple[int, Tuple[int]]]
+        The graph index and selected nodes of each selection in the cluster.
+    topo : structure_topology
+        The topology of the selections.
+    reference : graphs.structure
+        The structure to align the selections to when building the union.
+    depth : int
+        The depth of the union.
+    icd : codecs.intvec_codec
+        The codec used to decode the graphs.
+    unique : List[Tuple[int, Tuple[int]]]
+        A subset of the selections with the same union, used when building
+        the union from scratch.
+
+    Returns
+    -------
+    graphs.structure
+        The union of the selections.
+    """
+
+    if unique is None:
+        unique = selections
+
+    if not configs.clustering_incremental_union:
+        clustering_union_ctx.unions.pop(name, None)
+        return mapper.union_list_parallel(
+            G, unique, topo, reference=reference, max_depth=depth, icd=icd
+        )
+
+    key = (hash(reference), depth)
+    U = clustering_union_ctx.unions.get(name)
+    if U is not None and U.key == key:
+        if clustering_union_update(U, G, selections, topo, depth, icd):
+            return clustering_union_get_structure(U)
+
+    Q = mapper.union_list_parallel(
+        G, unique, topo, reference=reference, max_depth=depth, icd=icd
+    )
+
+    U = clustering_union(Q, key)
+    if clustering_union_update(U, G, selections, topo, depth, icd):
+        clustering_union_ctx.unions[name] = U
+        Q = clustering_union_get_structure(U)
+    else:
+        clustering_union_ctx.unions.pop(name, None)
+
+    return Q
+
+
 def clustering_update_assignments(
     group: assignments.structure_assignment_group, match
 ) -> assignments.structure_assignment_group:
@@ -1794,6 +2225,244 @@ def clustering_build_assignment_mappings(
     return mappings
 
 
+def clustering_relabel_subset(
+    hidx: hierarchies.structure_hierarchy,
+    keep: Sequence[int],
+    members: Sequence[Tuple[int, Sequence[int]]],
+    labeler: assignments.smarts_hierarchy_assignment,
+    gcd: codecs.graph_codec,
+    smiles: List[str],
+) -> Dict[Tuple[int, Sequence[int]], str]:
+    """
+    Label a subset of the dataset using only a subset of the hierarchy nodes.
+    The tree is shared with the full hierarchy so that the node priorities are
+    the same, but only the nodes in keep have patterns and only the molecules
+    in members are labeled.
+
+    Parameters
+    ----------
+    hidx : hierarchies.structure_hierarchy
+        The hierarchy to label with
+    keep : Sequence[int]
+        The hierarchy indices of the nodes to match against
+    members : Sequence[Tuple[int, Sequence[int]]]
+        The (molecule index, selection) pairs to relabel
+    labeler : assignments.smarts_hierarchy_assignment
+        The labeler to use
+    gcd : codecs.graph_codec
+        The graph codec used by the labeler
+    smiles : List[str]
+        The SMILES of the entire dataset
+
+    Returns
+    -------
+    Dict[Tuple[int, Sequence[int]], str]
+        The new label of each member. Members that did not match any of the
+        nodes are assigned None.
+    """
+
+    if not members:
+        return {}
+
+    mol_idx = sorted(set(i for i, _ in members))
+
+    sub = hierarchies.structure_hierarchy(
+        hidx.index,
+        {k: v for k, v in hidx.smarts.items() if k in keep},
+        {k: v for k, v in hidx.subgraphs.items() if k in keep},
+        hidx.topology,
+    )
+
+    procs = configs.processors
+    configs.processors = 1
+    sub_assignments = labeler.assign(
+        sub, gcd, [smiles[i] for i in mol_idx], hidx.topology
+    )
+    configs.processors = procs
+
+    sub_assignments = dict(zip(mol_idx, sub_assignments.assignments))
+
+    return {
+        (i, sel): sub_assignments[i].selections.get(sel)
+        for i, sel in members
+    }
+
+
+def clustering_update_split(
+    cst: smarts_clustering,
+    hidx: hierarchies.structure_hierarchy,
+    S: trees.tree_node,
+    hent: trees.tree_node,
+    labeler: assignments.smarts_hierarchy_assignment,
+    gcd: codecs.graph_codec,
+    smiles: List[str],
+) -> smarts_clustering:
+    """
+    Incrementally relabel a clustering after a new node has been added as the
+    first child of S. Since the new node is a specialization of S, only the
+    subgraphs currently labeled S can change, and these are only tested
+    against the new node. The result is identical to labeling the entire
+    dataset with hidx.
+
+    Parameters
+    ----------
+    cst : smarts_clustering
+        The clustering before the node was added
+    hidx : hierarchies.structure_hierarchy
+        The hierarchy with the new node added
+    S : trees.tree_node
+        The parent node
+    hent : trees.tree_node
+        The new node
+    labeler : assignments.smarts_hierarchy_assignment
+        The labeler to use
+    gcd : codecs.graph_codec
+        The graph codec used by the labeler
+    smiles : List[str]
+        The SMILES of the entire dataset
+
+    Returns
+    -------
+    smarts_clustering
+        The new clustering
+    """
+
+    members = cst.mappings[S.name]
+    labels = clustering_relabel_subset(
+        hidx, [hent.index], members, labeler, gcd, smiles
+    )
+
+    moved = [x for x in members if labels[x] == hent.name]
+
+    return clustering_update_labels(
+        cst, hidx, {x: hent.name for x in moved}
+    )
+
+
+def clustering_update_merge(
+    cst: smarts_clustering,
+    hidx: hierarchies.structure_hierarchy,
+    hent: trees.tree_node,
+    labeler: assignments.smarts_hierarchy_assignment,
+    gcd: codecs.graph_codec,
+    smiles: List[str],
+) -> smarts_clustering:
+    """
+    Incrementally relabel a clustering after a node has been removed. Only
+    the subgraphs labeled by the removed node can change, and they can only
+    be relabeled by a node that comes before the removed node in the
+    hierarchy since any node afterwards would have already taken priority.
+    The result is identical to labeling the entire dataset with hidx.
+
+    Parameters
+    ----------
+    cst : smarts_clustering
+        The clustering before the node was removed
+    hidx : hierarchies.structure_hierarchy
+        The hierarchy with the node removed
+    hent : trees.tree_node
+        The removed node
+    labeler : assignments.smarts_hierarchy_assignment
+        The labeler to use
+    gcd : codecs.graph_codec
+        The graph codec used by the labeler
+    smiles : List[str]
+        The SMILES of the entire dataset
+
+    Returns
+    -------
+    smarts_clustering
+        The new clustering
+    """
+
+    keep = []
+    index = cst.hierarchy.index
+    for n in tree_iterators.tree_iter_dive(
+        index, trees.tree_index_roots(index)
+    ):
+        if n.index == hent.index:
+            break
+        keep.append(n.index)
+
+    members = cst.mappings[hent.name]
+    labels = clustering_relabel_subset(
+        hidx, keep, members, labeler, gcd, smiles
+    )
+
+    return clustering_update_labels(cst, hidx, labels)
+
+
+def clustering_update_labels(
+    cst: smarts_clustering,
+    hidx: hierarchies.structure_hierarchy,
+    labels: Dict[Tuple[int, Sequence[int]], str],
+) -> smarts_clustering:
+    """
+    Build a new clustering by patching the labels of a subset of the
+    subgraphs. The assignments of the unchanged molecules are shared with the
+    original clustering, and the mappings are kept in the same order as
+    clustering_build_assignment_mappings would produce.
+
+    Parameters
+    ----------
+    cst : smarts_clustering
+        The clustering to patch
+    hidx : hierarchies.structure_hierarchy
+        The hierarchy of the new clustering
+    labels : Dict[Tuple[int, Sequence[int]], str]
+        The new label of each (molecule index, selection) pair
+
+    Returns
+    -------
+    smarts_clustering
+        The new clustering
+    """
+
+    group = cst.group
+    new_assignments = list(group.assignments)
+
+    changed = set()
+    for (i, sel), lbl in labels.items():
+        old = group.assignments[i].selections[sel]
+        if old == lbl:
+            continue
+        if new_assignments[i] is group.assignments[i]:
+            new_assignments[i] = group.assignments[i].copy()
+        new_assignments[i].selections[sel] = lbl
+        changed.add(old)
+        changed.add(lbl)
+
+    mappings = {}
+    for n in hidx.index.nodes.values():
+        mappings[n.name] = cst.mappings.get(n.name, [])
+
+    positions = {}
+    for name in changed:
+        if name not in mappings:
+            continue
+        members = [x for x in mappings[name] if labels.get(x, name) == name]
+        added = [
+            x for x, lbl in labels.items()
+            if lbl == name and group.assignments[x[0]].selections[x[1]] != name
+        ]
+        if added:
+            members.extend(added)
+            for i, _ in members:
+                if i not in positions:
+                    positions[i] = {
+                        sel: j
+                        for j, sel in enumerate(new_assignments[i].selections)
+                    }
+            members.sort(key=lambda x: (x[0], positions[x[0]][x[1]]))
+        mappings[name] = members
+
+    new_group = assignments.smiles_assignment_group(
+        new_assignments, group.topology
+    )
+
+    return smarts_clustering(hidx, new_group, mappings)
+
+
 def clustering_build_ordinal_mappings(
     initial_conditions: smarts_clustering, stuag, select=None
 ):
@@ -7,6 +7,7 @@ SMARTS and SMILES strings to a BESMARTS graph representation.
 
 from typing import Sequence, Dict, List, Tuple
 import re
+import collections
 
 from besmarts.core.configs import smiles_perception_config
 from besmarts.core.primitives import primitive_key, primitive_codec, element_tr
@@ -16,6 +17,7 @@ from besmarts.core import chem
 from besmarts.core import arrays
 from besmarts.core import graphs
 from besmarts.core import graph_visitors
+from besmarts.core import packed
 
 from besmarts.core.arrays import bitvec as bitvec
 from besmarts.core.arrays import array_dtype
@@ -1755,6 +1757,89 @@ def intvec_codec_structure_decode(
     topo = topology.topology_index[graph_t]
     return graphs.graph_to_structure(g, select, topo)
 
+class intvec_codec_decode_cache:
+    """
+    A bounded, least recently used cache of decoded graphs, keyed by the
+    index of the graph in a sequence of intvecs. This is meant to be kept by
+    each worker so that a graph with many selections is only decoded once.
+    In lazy mode, the graphs are read-only views over the intvec buffers and
+    the primitives are materialized into new bechem objects on every access,
+    which only pays off when few of the nodes of each graph are read.
+    """
+
+    __slots__ = ("icd", "A", "maxsize", "lazy", "graphs", "hits", "misses")
+
+    def __init__(self, icd: intvec_codec, A, maxsize=1024, lazy=False):
+        self.icd = icd
+        self.A = A
+        self.maxsize = maxsize
+        self.lazy = lazy
+        self.graphs = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def graph_decode(self, idx) -> graphs.graph:
+        return intvec_codec_decode_cache_get(self, idx)
+
+
+def intvec_codec_decode_cache_get(
+    cache: intvec_codec_decode_cache, idx
+) -> graphs.graph:
+    """
+    Return the decoded graph at index idx, decoding it if needed.
+
+    Parameters
+    ----------
+    cache : intvec_codec_decode_cache
+        The cache
+    idx : int
+        The index of the graph in the intvec sequence
+
+    Returns
+    -------
+    graphs.graph
+        The decoded graph. This must not be modified.
+    """
+
+    G = cache.graphs
+    g = G.get(idx)
+    if g is not None:
+        cache.hits += 1
+        G.move_to_end(idx)
+        return g
+
+    cache.misses += 1
+    icd = cache.icd
+    if cache.lazy:
+        g = packed.packed_graph_from_intvec(
+            cache.A[idx], icd.atom_primitives, icd.bond_primitives, copy=False
+        )
+    else:
+        g = icd.graph_decode(cache.A[idx])
+
+    G[idx] = g
+    if len(G) > cache.maxsize:
+        G.popitem(last=False)
+
+    return g
+
+
+def intvec_codec_decode_cache_clear(cache: intvec_codec_decode_cache):
+    """
+    Drop the decoded graphs and the intvecs of a cache. In lazy mode the
+    graphs are views of the intvec buffers, which cannot be resized or closed
+    until the dropped graphs have been garbage collected.
+
+    Parameters
+    ----------
+    cache : intvec_codec_decode_cache
+        The cache
+    """
+
+    cache.graphs.clear()
+    cache.A = None
+
+
 def smiles_decode_list_distributed(smiles: List[str], shm=None) -> graphs.graph:
     gcd: graph_codec = shm.gcd
     icd = intvec_codec(gcd.primitive_codecs, gcd.atom_primitives, gcd.bond_primitives)
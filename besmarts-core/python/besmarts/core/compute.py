@@ -43,6 +43,10 @@ import multiprocessing.pool
 
 import threading
 import pickle
+import hashlib
+import mmap
+import tempfile
+from multiprocessing import shared_memory, resource_tracker
 
 from besmarts.core import configs
 from besmarts.core import arrays
@@ -1612,6 +1616,23 @@ class myqueue(queue.Queue):
             ret = ret[0]
         return ret
 
+    def get_available(self, timeout=None, n=None):
+        """Remove and return the items in the queue, up to n items.
+
+        Blocks until at least one item is available, waiting at most
+        'timeout' seconds if it is not None. Returns an empty list if no item
+        became available. Unlike get, does not wait for n items.
+        """
+        ret = []
+        with self.not_empty:
+            if not self._qsize():
+                self.not_empty.wait(timeout)
+            while self._qsize() and (n is None or len(ret) < n):
+                ret.append(self._get())
+            if ret:
+                self.not_full.notify_all()
+        return ret
+
 
 # myqueue = multiprocessing.Queue
 # myqueue = queue.Queue
@@ -1624,11 +1645,273 @@ class myiqueue(queue.Queue):
         return super().get(block=block, timeout=timeout)
 
 
+class shm_segment:
+    """
+    A read-only mapping of intvecs stored back to back in a single buffer,
+    with a table of offsets into it. The buffer is placed in shared memory so
+    that local workers read the intvecs without a copy. Only the tables are
+    pickled; remote workers fetch the buffer once and cache it on disk under
+    the hash of its contents.
+    """
+
+    __slots__ = "index", "offsets", "digest", "size", "name", "buffer", "handle"
+
+    def __init__(self, index, offsets, digest, size, name=None):
+        self.index: Dict = index
+        self.offsets: array.array = offsets
+        self.digest: str = digest
+        self.size: int = size
+        self.name: str = name
+        self.buffer: memoryview = None
+        self.handle = None
+
+    def __getstate__(self):
+        return self.index, self.offsets, self.digest, self.size, self.name
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+        shm_segment_attach(self)
+
+    def __getitem__(self, key) -> arrays.intvec:
+        if self.buffer is None and not shm_segment_attach(self):
+            raise KeyError(f"shm_segment {self.digest} is not attached")
+        i = self.index[key]
+        iv = arrays.intvec()
+        iv.v = self.buffer[self.offsets[i]:self.offsets[i+1]]
+        return iv
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def values(self):
+        return (self[k] for k in self.index)
+
+    def items(self):
+        return ((k, self[k]) for k in self.index)
+
+
+def shm_segment_new(A: Mapping, shared=True) -> shm_segment:
+    """
+    Copy the intvecs of a mapping or sequence into a new segment.
+
+    Parameters
+    ----------
+    A : Mapping | Sequence
+        The intvecs to copy. Sequences are keyed by position.
+    shared : bool
+        Place the buffer in shared memory. Otherwise the buffer is private to
+        this process and other processes must load it from the disk cache.
+
+    Returns
+    -------
+    shm_segment
+    """
+
+    if not hasattr(A, "items"):
+        A = dict(enumerate(A))
+
+    index = {}
+    offsets = array.array("q", [0])
+    data = array.array("q")
+    for i, (k, iv) in enumerate(A.items()):
+        index[k] = i
+        data.extend(iv.v)
+        offsets.append(len(data))
+
+    digest = hashlib.sha256(data).hexdigest()
+    size = len(data) * data.itemsize
+
+    if not shared:
+        seg = shm_segment(index, offsets, digest, size)
+        seg.buffer = memoryview(data)
+        return seg
+
+    handle = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    handle.buf[:size] = memoryview(data).cast("B")
+
+    seg = shm_segment(index, offsets, digest, size, name=handle.name)
+    seg.handle = handle
+    seg.buffer = handle.buf[:size].cast("q")
+    return seg
+
+
+def shm_segment_cache_path(digest: str) -> str:
+    """
+    Return the path of the disk cache of a segment.
+    """
+    path = configs.shm_cache_path or tempfile.gettempdir()
+    return os.path.join(path, f"besmarts-{digest}.seg")
+
+
+def shm_segment_attach(seg: shm_segment) -> bool:
+    """
+    Attach the buffer of a segment, first by the name of its shared memory,
+    and then from the disk cache.
+
+    Returns
+    -------
+    bool
+        Whether the segment is attached.
+    """
+
+    if seg.buffer is not None:
+        return True
+
+    if seg.name is not None:
+        try:
+            handle = shared_memory.SharedMemory(name=seg.name)
+            # the creator owns the segment; attaching must not unlink it
+            # when this process exits
+            resource_tracker.unregister(handle._name, "shared_memory")
+            seg.handle = handle
+            seg.buffer = handle.buf[:seg.size].cast("q")
+            return True
+        except (FileNotFoundError, OSError):
+            pass
+
+    path = shm_segment_cache_path(seg.digest)
+    if not os.path.exists(path) or os.path.getsize(path) != seg.size:
+        return False
+
+    # mark it as recently used so it is the last to be pruned
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    if seg.size == 0:
+        seg.buffer = memoryview(array.array("q"))
+        return True
+
+    with open(path, "rb") as f:
+        handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    seg.handle = handle
+    seg.buffer = memoryview(handle).cast("q")
+    return True
+
+
+def shm_segment_bytes(seg: shm_segment) -> bytes:
+    """
+    Return the contents of the buffer of a segment.
+    """
+    shm_segment_attach(seg)
+    return seg.buffer.tobytes()
+
+
+def shm_segment_cache_write(seg: shm_segment, data: bytes) -> bool:
+    """
+    Save the buffer of a segment to the disk cache and attach it.
+
+    Returns
+    -------
+    bool
+        Whether the segment is attached.
+    """
+
+    if hashlib.sha256(data).hexdigest() != seg.digest:
+        return False
+
+    path = shm_segment_cache_path(seg.digest)
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        shm_segment_cache_prune(configs.shm_cache_max, keep=path)
+
+    return shm_segment_attach(seg)
+
+
+def shm_segment_cache_prune(n: int, keep=None) -> int:
+    """
+    Remove all but the n most recently used segments from the disk cache.
+    Segments that are attached stay mapped until they are closed.
+
+    Parameters
+    ----------
+    n : int
+        The number of segments to keep
+    keep : str
+        The path of a segment that is never removed
+
+    Returns
+    -------
+    int
+        The number of segments removed
+    """
+
+    path = os.path.dirname(shm_segment_cache_path(""))
+    segs = []
+    for name in os.listdir(path):
+        fname = os.path.join(path, name)
+        if name.startswith("besmarts-") and name.endswith(".seg") and fname != keep:
+            try:
+                segs.append((os.path.getmtime(fname), fname))
+            except OSError:
+                pass
+
+    if keep is not None:
+        n -= 1
+    segs.sort(reverse=True)
+
+    removed = 0
+    for _, fname in segs[max(n, 0):]:
+        try:
+            os.remove(fname)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def shm_segment_close(seg: shm_segment, unlink=False):
+    """
+    Detach the buffer of a segment, and remove its shared memory if unlink is
+    True. Only the process that made the segment should unlink it.
+    """
+
+    handle = seg.handle
+    seg.buffer = None
+    seg.handle = None
+    if handle is None:
+        return
+
+    if type(handle) is shared_memory.SharedMemory:
+        if unlink:
+            # attaching in this process may have already unregistered it
+            resource_tracker.register(handle._name, "shared_memory")
+            handle.unlink()
+        try:
+            handle.close()
+        except BufferError:
+            # views of the buffer are still alive; the mapping is released
+            # with the last of them
+            pass
+    else:
+        try:
+            handle.close()
+        except BufferError:
+            pass
+
+
 def shm_init(proxy):
     """ """
     print(f"{datetime.now()} shm_init: building shm")
     shm = shm_local()
     data = dict(proxy.get())
+    for k, v in data.items():
+        if type(v) is shm_segment and not shm_segment_attach(v):
+            print(f"{datetime.now()} shm_init: fetching segment {k}")
+            shm_segment_cache_write(v, proxy.segment(v.digest))
     shm.__dict__.update(data)
     print(f"{datetime.now()} shm_init: shm has members {list(data.keys())}")
     return shm
@@ -1644,6 +1927,11 @@ class shm_local:
     def get(self):
         return self.__dict__
 
+    def segment(self, digest):
+        for v in self.__dict__.values():
+            if type(v) is shm_segment and v.digest == digest:
+                return shm_segment_bytes(v)
+
     def remote_init(self):
         return shm_init
 
@@ -2564,6 +2852,25 @@ def workspace_submit_and_flush(
 
 
 def workspace_flush(ws: workspace_local, indices, timeout: float = TIMEOUT):
+    """
+    Collect the results of the given tasks from a workspace. Results are
+    waited for on the output queue, so that each result is collected as soon
+    as it is put there.
+
+    Parameters
+    ----------
+    ws : workspace_local
+        The workspace the tasks were submitted to
+    indices : Set
+        The indices of the tasks to collect
+    timeout : float
+        The time to wait for results while no tasks are in progress
+
+    Returns
+    -------
+    Dict
+        The results of the tasks that finished, by index
+    """
     if len(indices) == 0:
         return {}
     results = {}
@@ -2580,7 +2887,6 @@ def workspace_flush(ws: workspace_local, indices, timeout: float = TIMEOUT):
     if not roq:
         return {}
     n = len(indices)
-    at_least_one = False
     waited = 0.0
     waittime = 5.0
 
@@ -2595,34 +2901,18 @@ def workspace_flush(ws: workspace_local, indices, timeout: float = TIMEOUT):
 
     ttp = 10  # times to print; 100 is every 1%
     update = set()
-    force_update = True
-    remote_finished = 0
-    iqsize0 = 0
-    oqsize0 = 0
     i = 0
     first = True
     ti = time.monotonic()
-    t0 = time.monotonic()
-    sleepiness = 0.0
 
     while (totalwait is not None and waited < totalwait) or (
         ws.holding or ws.iqueue.qsize() or ws.oqueue.qsize()
     ):
-        t00 = time.perf_counter()
-        count = len(indices.intersection(results))
         dt = time.monotonic() - ti
-        if i != count:
-            force_update = True
-        else:
-            force_update = False
-        i = count
         iqsize = ws.iqueue.qsize()
         oqsize = ws.oqueue.qsize()
 
-        if dt < 10.0:
-            force_update = False
-        else:
-            force_update = True
+        force_update = dt >= 10.0
 
         progress = int(i / n * ttp) % ttp
         if i == n:
@@ -2654,45 +2944,30 @@ def workspace_flush(ws: workspace_local, indices, timeout: float = TIMEOUT):
             if first:
                 print()
                 first = False
-            force_update = False
-        if len(indices.difference(results)) == 0:
+        if i == n:
             break
 
-        packets = queue_get_nowait(oq, timeout=5.0, n=1000)
-        if (packets is None or len(packets) == 0) and not (
-            ws.holding or iqsize or oqsize
-        ):
-            if waited >= totalwait:
-                print(f"Done waiting")
-                break
-            sleepiness = 0.0
-            time.sleep(waittime)
-            waited += waittime
-            # print(f"Waited {int(waited)}/{totalwait}")
-        elif packets:
-            # print("\nReceived packet")
-            sleepiness = 0.0
-            force_update = True
-            # print(f"RECEIVED type {type(packets)} values are \n{pprint.pformat(packets)}")
-            for packet in packets:
-                # print(f"    packet is type {type(packet)}")
-                results.update(packet)
-                for idx in packet:
-                    at_least_one = True
-                    waited = False
-                    # print(f"\nUnit {idx} is ready: {result}")
-
-                    with ws.holding_remote_lock:
-                        if idx in ws.holding_remote:
-                            ws.holding_remote.pop(idx)
-
-        t01 = time.perf_counter()
-        dt = t01 - t00
-        if dt < 0.0:
-            time.sleep(0.0 - dt)
-        # print("JOINING GOT", i)
+        t0 = time.monotonic()
+        packets = oq.get_available(timeout=waittime, n=1000)
+        if not packets:
+            if not (ws.holding or iq.qsize() or oq.qsize()):
+                waited += time.monotonic() - t0
+                if totalwait is not None and waited >= totalwait:
+                    print(f"Done waiting")
+                    break
+            continue
+
+        waited = 0.0
+        for packet in packets:
+            for idx, result in packet.items():
+                if idx in indices and idx not in results:
+                    i += 1
+                results[idx] = result
+
+                with ws.holding_remote_lock:
+                    if idx in ws.holding_remote:
+                        ws.holding_remote.pop(idx)
 
-    # print("\nDone flushing.")
     print()
     return results
 
@@ -8,6 +8,39 @@ processors = os.cpu_count()
 remote_compute_enable = True
 workqueue_port = 55555
 
+# where remote workers cache the shared dataset segments; None is the
+# system temporary directory
+shm_cache_path = None
+
+# the most segments kept in the cache; the least recently used are removed
+shm_cache_max = 4
+
+# where decoded SMILES are cached between runs; None disables the cache
+smiles_cache_path = None
+
+# relabel only the affected subgraphs when scoring clustering candidates
+clustering_incremental_labeling = True
+
+# search for splits on the unique environments of a cluster only
+clustering_compress_selections = True
+
+# keep the union of each cluster up to date as selections enter and leave
+# instead of rebuilding it. Deeper unions are aligned to the first union of the
+# cluster, so they may differ from a union rebuilt from scratch
+clustering_incremental_union = True
+
+# skip bit combinations that cannot split, using the matches of single bits
+split_bit_screen = True
+
+# the screen matches every single bit against every selection, so it is only
+# run when there are at least this many combinations of two or more bits for
+# each of those matches
+split_bit_screen_min_ratio = 2.0
+
+# score atom pairs as packed batches only when there are at least this many
+# pairs; packing costs more than it saves for fewer
+bechem_batch_min_pairs = 8
+
 class smiles_perception_config:
     def __init__(
         self,
@@ -157,3 +190,8 @@ def smarts_perception_config_copy(self):
     split = self.splitter.copy()
     extend = self.extender.copy()
     return smarts_perception_config(split, extend)
+
+# keep a table of all path lengths only for graphs with at most this many
+# nodes, since it grows with the square of the nodes; the depths of larger
+# graphs are found by walking the graph each time
+graph_distances_max_nodes = 128
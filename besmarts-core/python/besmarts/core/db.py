@@ -1,236 +1,906 @@
 """
 besmarts.core.db
+
+An append-only dataset store on disk. Each table of a dataset is a single
+payload file with the records stored back to back, and an index file with the
+offset of each record. The payload is memory mapped, so records are read by
+slicing the map without a copy, and a table that is sent to a worker process
+maps the same files again instead of sending the records.
 """
-import dbm
-import glob
+
+import array
+import atexit
+import fcntl
+import hashlib
+import mmap
 import os
+import shutil
 
-from typing import Sequence, Dict, List
+from typing import Sequence, Dict, List, Iterable, Tuple
 
 from besmarts.core import arrays
 from besmarts.core import codecs
-from besmarts.core import compute
+from besmarts.core import configs
+from besmarts.core import graphs
+
+
+class db_table:
+    """
+    An append-only table of variable length records. Records are arrays of
+    the same typecode, and are numbered in the order they were written.
+    """
+
+    __slots__ = "path", "typecode", "offsets", "handle", "buffer"
+
+    def __init__(self, path: str, typecode: str = "q"):
+        self.path: str = path
+        self.typecode: str = typecode
+
+        # the offset of each record in the payload, plus the end
+        self.offsets: array.array = array.array("q", [0])
+
+        # the map of the payload and a view of it as the typecode
+        self.handle: mmap.mmap = None
+        self.buffer: memoryview = None
+
+    def __getstate__(self):
+        return self.path, self.typecode
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+        db_table_load(self)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i) -> memoryview:
+        return db_table_read(self, i)
+
+
+def db_table_open(path: str, typecode: str = "q", create=False) -> db_table:
+    """
+    Open a table, creating empty files for it if create is True.
+
+    Parameters
+    ----------
+    path : str
+        The path of the table. The payload is path.dat and the index is
+        path.idx
+    typecode : str
+        The typecode of the records
+    create : bool
+        Whether to create the table if it does not exist
+
+    Returns
+    -------
+    db_table
+    """
+
+    t = db_table(path, typecode)
+    if create and not os.path.exists(path + ".idx"):
+        open(path + ".dat", "wb").close()
+        with open(path + ".idx", "wb") as f:
+            f.write(t.offsets.tobytes())
+    db_table_load(t)
+    return t
+
+
+def db_table_load(t: db_table) -> None:
+    """
+    Read the index of a table and map its payload.
+    """
+
+    offsets = array.array("q")
+    with open(t.path + ".idx", "rb") as f:
+        offsets.frombytes(f.read())
+    t.offsets = offsets
+    db_table_map(t)
+
+
+def db_table_map(t: db_table) -> None:
+    """
+    Map the payload of a table, remapping it if records were appended since
+    the last map.
+    """
+
+    itemsize = array.array(t.typecode).itemsize
+    size = t.offsets[-1] * itemsize
+    if t.buffer is not None and len(t.buffer) * itemsize >= size:
+        return
+
+    db_table_unmap(t)
+    if size == 0:
+        t.buffer = memoryview(array.array(t.typecode))
+        return
+
+    with open(t.path + ".dat", "rb") as f:
+        t.handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    t.buffer = memoryview(t.handle)[:size].cast(t.typecode)
+
+
+def db_table_unmap(t: db_table) -> None:
+    """
+    Release the map of the payload of a table. The map is closed once no
+    record read from it is alive.
+    """
+
+    t.buffer = None
+    if t.handle is not None:
+        try:
+            t.handle.close()
+        except BufferError:
+            pass
+        t.handle = None
+
+
+def db_table_append(t: db_table, records: Iterable[Sequence]) -> range:
+    """
+    Append records to the end of a table. The records are written in one
+    pass, and the index is written after the payload so that a table that
+    is interrupted while writing still reads correctly. The index is locked
+    while writing, so several processes can append to the same table.
+
+    Parameters
+    ----------
+    t : db_table
+        The table
+    records : Iterable[Sequence]
+        The records to append
+
+    Returns
+    -------
+    range
+        The numbers of the new records
+    """
+
+    offsets = array.array("q")
+
+    with open(t.path + ".idx", "ab") as idx:
+        # other processes may append to the same table, so hold the index
+        # and pick up anything they wrote before appending
+        fcntl.flock(idx, fcntl.LOCK_EX)
+        size = os.fstat(idx.fileno()).st_size
+        if size != len(t.offsets) * t.offsets.itemsize:
+            db_table_load(t)
+
+        start = len(t)
+        end = t.offsets[-1]
+        with open(t.path + ".dat", "ab") as f:
+            # drop anything left by a write that did not finish
+            f.truncate(end * array.array(t.typecode).itemsize)
+            for batch in arrays.batched(records, 10000):
+                data = array.array(t.typecode)
+                for rec in batch:
+                    data.extend(rec)
+                    offsets.append(end + len(data))
+                f.write(data.tobytes())
+                end += len(data)
+
+        idx.write(offsets.tobytes())
+
+    t.offsets.extend(offsets)
+    return range(start, len(t))
+
+
+def db_table_read(t: db_table, i: int) -> memoryview:
+    """
+    Return a record of a table as a view of the payload.
+    """
+
+    db_table_map(t)
+    return t.buffer[t.offsets[i]:t.offsets[i + 1]]
+
+
+def db_table_read_list(t: db_table, indices: Sequence[int]) -> List[memoryview]:
+    """
+    Return records of a table as views of the payload.
+    """
+
+    db_table_map(t)
+    buffer = t.buffer
+    offsets = t.offsets
+    return [buffer[offsets[i]:offsets[i + 1]] for i in indices]
+
+
+def db_table_remove(path: str) -> None:
+    """
+    Remove the files of a table.
+    """
+    for ext in (".dat", ".idx"):
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
+
+
+class db_dataset:
+    """
+    A dataset of graphs encoded as intvecs, the selections in each graph, and
+    a label for each selection, each in their own table in a directory. The
+    dataset is a mapping of graph index to intvec, so it can be used wherever
+    the encoded graphs of a dataset are expected.
+    """
+
+    __slots__ = "path", "graphs", "selections", "labels"
+
+    def __init__(self, path, graphs, selections, labels):
+        self.path: str = path
+        self.graphs: db_table = graphs
+
+        # the graph index followed by the selected nodes
+        self.selections: db_table = selections
+        self.labels: db_table = labels
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, state):
+        ds = db_dataset_open(state)
+        self.__init__(ds.path, ds.graphs, ds.selections, ds.labels)
+
+    def __getitem__(self, i) -> arrays.intvec:
+        return db_dataset_read_graph(self, i)
+
+    def __len__(self):
+        return len(self.graphs)
+
+    def __iter__(self):
+        return iter(range(len(self.graphs)))
+
+    def __contains__(self, i):
+        return type(i) is int and 0 <= i < len(self.graphs)
+
+    def keys(self):
+        return range(len(self.graphs))
+
+    def values(self):
+        return (self[i] for i in range(len(self.graphs)))
+
+    def items(self):
+        return ((i, self[i]) for i in range(len(self.graphs)))
+
+
+def db_dataset_open(path: str, create=False) -> db_dataset:
+    """
+    Open a dataset, creating it if create is True.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the dataset
+    create : bool
+        Whether to create the dataset if it does not exist
+
+    Returns
+    -------
+    db_dataset
+    """
+
+    if create:
+        os.makedirs(path, exist_ok=True)
+
+    return db_dataset(
+        path,
+        db_table_open(os.path.join(path, "graphs"), "q", create=create),
+        db_table_open(os.path.join(path, "selections"), "q", create=create),
+        db_table_open(os.path.join(path, "labels"), "B", create=create),
+    )
+
+
+def db_dataset_close(ds: db_dataset) -> None:
+    """
+    Release the maps of the tables of a dataset.
+    """
+    for t in (ds.graphs, ds.selections, ds.labels):
+        db_table_unmap(t)
+
+
+def db_dataset_remove(ds: db_dataset) -> None:
+    """
+    Close a dataset and remove its files.
+    """
+    db_dataset_close(ds)
+    shutil.rmtree(ds.path, ignore_errors=True)
+
+
+def db_dataset_write_graphs(
+    ds: db_dataset, vecs: Iterable[arrays.intvec]
+) -> range:
+    """
+    Append encoded graphs to a dataset.
+
+    Returns
+    -------
+    range
+        The indices of the new graphs
+    """
+    return db_table_append(ds.graphs, (x.v for x in vecs))
+
+
+def db_dataset_write_selections(
+    ds: db_dataset, selections: Iterable[Tuple[int, Sequence[int]]]
+) -> range:
+    """
+    Append selections to a dataset. Each selection is the index of a graph
+    and the selected nodes.
+
+    Returns
+    -------
+    range
+        The indices of the new selections
+    """
+    return db_table_append(ds.selections, ((i, *sel) for i, sel in selections))
+
+
+def db_dataset_write_labels(ds: db_dataset, labels: Iterable[str]) -> range:
+    """
+    Append labels to a dataset, usually one for each selection.
+
+    Returns
+    -------
+    range
+        The indices of the new labels
+    """
+    return db_table_append(ds.labels, (x.encode() for x in labels))
+
+
+def db_dataset_read_graph(ds: db_dataset, i: int) -> arrays.intvec:
+    """
+    Return an encoded graph of a dataset. The intvec is a view of the
+    dataset and is not copied.
+    """
+    iv = arrays.intvec()
+    iv.v = db_table_read(ds.graphs, i)
+    return iv
+
+
+def db_dataset_read_graph_list(
+    ds: db_dataset, indices: Sequence[int]
+) -> List[arrays.intvec]:
+    """
+    Return encoded graphs of a dataset as views of the dataset.
+    """
+    vecs = []
+    for v in db_table_read_list(ds.graphs, indices):
+        iv = arrays.intvec()
+        iv.v = v
+        vecs.append(iv)
+    return vecs
+
+
+def db_dataset_read_selections(
+    ds: db_dataset, indices: Sequence[int] = None
+) -> List[Tuple[int, Tuple[int]]]:
+    """
+    Return selections of a dataset, or all of them if indices is None.
+    """
+    if indices is None:
+        indices = range(len(ds.selections))
+    return [
+        (v[0], tuple(v[1:])) for v in db_table_read_list(ds.selections, indices)
+    ]
+
+
+def db_dataset_read_labels(
+    ds: db_dataset, indices: Sequence[int] = None
+) -> List[str]:
+    """
+    Return labels of a dataset, or all of them if indices is None.
+    """
+    if indices is None:
+        indices = range(len(ds.labels))
+    return [bytes(v).decode() for v in db_table_read_list(ds.labels, indices)]
+
 
 class db_dict:
+    """
+    A key value store of intvecs. If a name is given, the intvecs are stored
+    in a table on disk and only the keys are kept in memory; a key that is
+    written again points to its latest record.
+    """
+
     def __init__(self, icd, name=""):
         self.icd = icd
         self.name = name
+        self.kv = {}
+        self.table = None
+        self.names = None
         if name:
-            self.kv = None
-            assert db_intvec_create(name)
-        else:
-            self.kv = {}
+            self.table = db_table_open(name + ".kv", "q", create=True)
+            self.names = db_table_open(name + ".keys", "B", create=True)
+            names = db_table_read_list(self.names, range(len(self.names)))
+            for i, k in enumerate(names):
+                k = bytes(k).decode()
+                if k.startswith("\0"):
+                    self.kv.pop(k[1:], None)
+                else:
+                    self.kv[k] = i
 
     def write_intvec(self, kv, prefix=""):
         if self.name:
-            return db_intvec_write(self.name, kv, prefix=prefix)
+            return db_intvec_write(self, kv, prefix=prefix)
         else:
             self.kv.update(kv)
             return len(kv)
 
-    def read_intvec(self, keys, prefix=""):
+    def read_intvec(self, key, prefix=""):
         if self.name:
-            return db_intvec_read(self.name, kv, prefix=prefix)
+            return db_intvec_read(self, key, prefix=prefix)
         else:
-            return self.kv[k]
+            return self.kv[key]
 
     def read_intvec_list(self, keys, prefix=""):
         if self.name:
-            return db_intvec_read_list(self.name, kv, prefix=prefix)
+            return db_intvec_read_list(self, keys, prefix=prefix)
         else:
             return [self.kv[k] for k in keys]
 
     def delete_intvec(self, keys, prefix=""):
         if self.name:
-            db_intvec_delete(self.name, keys, prefix=prefix)
+            db_intvec_delete(self, keys, prefix=prefix)
         else:
             for k in keys:
                 del self.kv[k]
-        
+
     def write_subgraph(self, kv, prefix=""):
-        if self.name:
-            return db_intvec_write(
-                self.name,
-                {k: self.icd.subgraph_encode(v) for k,v in kv.items()},
-                prefix=prefix
-            )
-        else:
-            self.kv.update({k: self.icd.subgraph_encode(v) for k,v in kv.items()})
-            return len(kv)
+        return self.write_intvec(
+            {k: self.icd.subgraph_encode(v) for k, v in kv.items()},
+            prefix=prefix
+        )
 
     def write_structure(self, kv, prefix=""):
-        if self.name:
-            return db_structure_write(
-                self.icd,
-                self.name,
-                kv,
-                prefix=prefix
-            )
-        else:
-            self.kv.update({k: self.icd.structure_encode(v) for k,v in kv.items()})
-            return len(kv)
+        return self.write_intvec(
+            {k: self.icd.structure_encode(v) for k, v in kv.items()},
+            prefix=prefix
+        )
 
     def write_graph(self, kv, prefix=""):
-        if self.name:
-            return db_intvec_write(
-                self.name,
-                {k: self.icd.graph_encode(v) for k,v in kv.items()},
-                prefix=prefix
-            )
-        else:
-            self.kv.update({k: self.icd.graph_encode(v) for k,v in kv.items()})
-            return len(kv)
+        return self.write_intvec(
+            {k: self.icd.graph_encode(v) for k, v in kv.items()},
+            prefix=prefix
+        )
 
     def read_graph(self, key, prefix=""):
-        if self.name:
-            return self.icd.graph_decode(db_intvec_read(
-                self.name,
-                key,
-                prefix=prefix
-            ))
-        else:
-            return self.icd.graph_decode(self.kv[k])
+        return self.icd.graph_decode(self.read_intvec(key, prefix=prefix))
 
     def read_graph_list(self, keys, prefix=""):
-        if self.name:
-            return [
-                self.icd.graph_decode(x) for x in db_intvec_read_list(
-                    self.name,
-                    keys,
-                    prefix=prefix
-                )
-            ]
-        else:
-            return [self.icd.graph_decode(self.kv[x]) for x in keys]
-
-    def read_structure_list(self, keys, prefix=""):
-        if self.name:
-            return [
-                self.icd.structure_decode(x) for x in db_intvec_read_list(
-                    self.name,
-                    keys,
-                    prefix=prefix
-                )
-            ]
-        else:
-            return [self.icd.structure_decode(self.kv[x]) for x in keys]
+        return [
+            self.icd.graph_decode(x)
+            for x in self.read_intvec_list(keys, prefix=prefix)
+        ]
 
     def read_structure(self, key, prefix=""):
-        if self.name:
-            return self.icd.structure_decode(db_intvec_read(self.name, key, prefix=prefix))
-        else:
-            return self.icd.structure_decode(self.kv[key])
-
-    def remove(self):
-        for fn in glob.glob(self.name+"*"):
-            os.remove(fn)
-
-def db_intvec_create(db_name) -> bool:
-    try:
-        with dbm.open(db_name, 'c') as db:
-            return True
-    except Exception:
-        return False
-
-def db_graph_write(icd: codecs.intvec_codec, db_name, pairs, prefix=""):
+        return self.icd.structure_decode(self.read_intvec(key, prefix=prefix))
 
-    if prefix:
-        prefix = prefix + ":"
-
-    with open(dbm.open(db_name), 'w') as db:
-        for k,v in pairs.items():
-            db[prefix+str(k)] = icd.graph_encode(v).tobytes()
-
-def db_structure_write_distributed(pairs, shm=None):
-    prefix = shm.prefix
-    if prefix:
-        prefix = prefix + ":"
-    for k,v in pairs:
-        shm.db[prefix+str(k)] = shm.icd.graph_encode(v).tobytes()
+    def read_structure_list(self, keys, prefix=""):
+        return [
+            self.icd.structure_decode(x)
+            for x in self.read_intvec_list(keys, prefix=prefix)
+        ]
 
+    def remove(self):
+        if self.name:
+            db_table_unmap(self.table)
+            db_table_unmap(self.names)
+            db_table_remove(self.name + ".kv")
+            db_table_remove(self.name + ".keys")
+        self.kv.clear()
 
-def db_structure_write(icd: codecs.intvec_codec, db_name, pairs, prefix=""):
 
+def db_key(key, prefix="") -> str:
     if prefix:
         prefix = prefix + ":"
+    return prefix + str(key)
 
-    with open(dbm.open(db_name), 'wf') as db:
-        wq = compute.workqueue_local('', 0)
-        ws = compute.workqueue_new_workspace(
-            wq,
-            address=('127.0.0.1', 0),
-            shm={"icd": icd, "db": db, "prefix": prefix}
-        )
-        
-        compute.workspace_submit_and_flush(db_structure_write, arrays.batched(pairs, 10000), chunksize=10)
-        for k,v in pairs.items():
-            db[prefix+str(k)] = icd.graph_encode(v).tobytes()
 
-        ws.close()
-        wq.close()
-        db.sync()
+def db_intvec_write(db: db_dict, pairs: Dict, prefix="") -> int:
+    """
+    Append intvecs to a db_dict on disk.
+    """
 
+    keys = [db_key(k, prefix) for k in pairs]
+    rows = db_table_append(db.table, (v.v for v in pairs.values()))
+    db_table_append(db.names, (k.encode() for k in keys))
+    db.kv.update(zip(keys, rows))
     return len(pairs)
 
-def db_intvec_write(db_name, pairs, prefix=""):
 
-    if prefix:
-        prefix = prefix + ":"
+def db_intvec_delete(db: db_dict, keys, prefix="") -> None:
+    """
+    Delete keys of a db_dict on disk. The records are kept, and an empty
+    record marks each key as deleted.
+    """
 
-    with dbm.open(db_name, 'wf') as db:
-        for k,v in pairs.items():
-            db[prefix+str(k)] = v.v.tobytes()
-        db.sync()
-    return len(pairs)
+    keys = [db_key(k, prefix) for k in keys]
+    for k in keys:
+        del db.kv[k]
+    db_table_append(db.table, ([] for _ in keys))
+    db_table_append(db.names, (("\0" + k).encode() for k in keys))
 
-def db_intvec_delete(db_name, keys, prefix=""):
 
-    if prefix:
-        prefix = prefix + ":"
+def db_intvec_read(db: db_dict, key, prefix="") -> arrays.intvec:
+    """
+    Read an intvec from a db_dict on disk.
+    """
 
-    with dbm.open(db_name, 'wf') as db:
-        for k,v in pairs.items():
-            del db[prefix+str(k)]
-        db.sync()
+    v = arrays.intvec()
+    v.v = db_table_read(db.table, db.kv[db_key(key, prefix)])
+    return v
 
-## readers
 
-def db_intvec_read(db_name, keys, prefix=""):
-
-    if prefix:
-        prefix = prefix + ":"
-
-    with dbm.open(db_name, 'rfu') as db:
-        v = arrays.intvec()
-        v.v.frombytes(db[prefix+str(k)])
-        return v
-
-def db_intvec_read_list(db_name, keys, prefix=""):
-
-    if prefix:
-        prefix = prefix + ":"
+def db_intvec_read_list(db: db_dict, keys, prefix="") -> List[arrays.intvec]:
+    """
+    Read intvecs from a db_dict on disk.
+    """
 
+    rows = [db.kv[db_key(k, prefix)] for k in keys]
     vals = []
-    with dbm.open(db_name, 'rfu') as db:
-        for k in keys:
-            v = arrays.intvec()
-            v.v.frombytes(db[prefix+str(k)])
-            vals.append(v)
-
+    for x in db_table_read_list(db.table, rows):
+        v = arrays.intvec()
+        v.v = x
+        vals.append(v)
     return vals
 
-def db_graph_read(icd: codecs.intvec_codec, db_name, keys, prefix=""):
-
-    if prefix:
-        prefix = prefix + ":"
-
-    keyvals = {}
-    with dbm.open(db_name, 'rfu') as db:
-        for k in keys:
-            v = arrays.intvec()
-            v.v.frombytes(db[prefix+str(k)])
-            keyvals[k] = icd.graph_decode(v)
-
-    return keyvals
 
+def db_graph_read(icd: codecs.intvec_codec, db: db_dict, keys, prefix=""):
+    """
+    Read and decode graphs from a db_dict on disk.
+    """
+
+    vals = db_intvec_read_list(db, keys, prefix=prefix)
+    return {k: icd.graph_decode(v) for k, v in zip(keys, vals)}
+
+
+class db_smiles_cache:
+    """
+    A cache of decoded SMILES on disk. Each record of the table is a SMILES
+    followed by its graph encoded as an intvec, so a record is always
+    written whole even when several processes add to the cache at once. The
+    cache of a codec is in a directory named by the digest of everything
+    that changes the decoded graph, so codecs that decode differently never
+    share graphs.
+    """
+
+    __slots__ = (
+        "path", "icd", "table", "index", "indexed", "pending", "refreshed"
+    )
+
+    def __init__(self, path, icd, table):
+        self.path: str = path
+        self.icd: codecs.intvec_codec = icd
+        self.table: db_table = table
+
+        # the row of each SMILES in the table
+        self.index: Dict[str, int] = {}
+
+        # the number of rows that are indexed
+        self.indexed: int = 0
+
+        # decoded SMILES that are not written yet
+        self.pending: Dict[str, arrays.intvec] = {}
+
+        # whether the SMILES of other processes were indexed since the
+        # last flush
+        self.refreshed: bool = False
+
+
+class db_smiles_cache_ctx:
+    """
+    The caches opened by this process, keyed by path
+    """
+
+    caches: Dict[str, db_smiles_cache] = {}
+
+    # the number of decoded SMILES to hold before writing them
+    pending_max = 1000
+
+
+def db_smiles_cache_key(gcd: codecs.graph_codec) -> str:
+    """
+    Return the digest of the codec settings that determine the graph a
+    SMILES decodes to.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decodes the SMILES
+
+    Returns
+    -------
+    str
+    """
+
+    key = [
+        type(gcd).__module__,
+        type(gcd).__qualname__,
+        ",".join(map(str, gcd.atom_primitives)),
+        ",".join(map(str, gcd.bond_primitives)),
+    ]
+
+    # not every codec perceives SMILES with a config
+    cfg = getattr(gcd, "smiles_config", None)
+    if cfg is not None:
+        key.extend(
+            map(
+                str,
+                (
+                    cfg.allow_unconnected,
+                    cfg.protonate,
+                    cfg.strip_hydrogen,
+                    cfg.aromaticity,
+                ),
+            )
+        )
+    return hashlib.sha256("\0".join(key).encode()).hexdigest()
+
+
+def db_smiles_cache_get(gcd: codecs.graph_codec) -> db_smiles_cache:
+    """
+    Return the SMILES cache of a codec in configs.smiles_cache_path, opening
+    it if this process has not opened it yet.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decodes the SMILES
+
+    Returns
+    -------
+    db_smiles_cache
+        The cache, or None if configs.smiles_cache_path is not set
+    """
+
+    if not configs.smiles_cache_path:
+        return None
+
+    path = os.path.join(configs.smiles_cache_path, db_smiles_cache_key(gcd))
+    cache = db_smiles_cache_ctx.caches.get(path)
+    if cache is None:
+        os.makedirs(path, exist_ok=True)
+        icd = codecs.intvec_codec(
+            gcd.primitive_codecs, gcd.atom_primitives, gcd.bond_primitives
+        )
+        cache = db_smiles_cache(
+            path,
+            icd,
+            db_table_open(os.path.join(path, "smiles"), "q", create=True),
+        )
+        db_smiles_cache_ctx.caches[path] = cache
+        db_smiles_cache_refresh(cache)
+    return cache
+
+
+def db_smiles_cache_open(gcd: codecs.graph_codec) -> db_smiles_cache:
+    """
+    Return the SMILES cache of a codec, with the SMILES added by other
+    processes indexed.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decodes the SMILES
+
+    Returns
+    -------
+    db_smiles_cache
+        The cache, or None if configs.smiles_cache_path is not set
+    """
+
+    cache = db_smiles_cache_get(gcd)
+    if cache is not None:
+        db_smiles_cache_refresh(cache)
+    return cache
+
+
+def db_smiles_cache_record(smiles: str, v: arrays.intvec) -> array.array:
+    """
+    Make the record of a SMILES and its graph. The record is the length of
+    the SMILES in bytes, the SMILES padded to a whole number of integers,
+    and the graph.
+    """
+
+    b = smiles.encode()
+    rec = array.array("q", [len(b)])
+    rec.frombytes(b + bytes(-len(b) % rec.itemsize))
+    rec.extend(v.v)
+    return rec
+
+
+def db_smiles_cache_refresh(cache: db_smiles_cache) -> None:
+    """
+    Index the SMILES that were added to the cache since it was last indexed,
+    including those added by other processes.
+    """
+
+    t = cache.table
+    if os.path.getsize(t.path + ".idx") != len(t.offsets) * t.offsets.itemsize:
+        # another process wrote to the cache
+        db_table_load(t)
+
+    rows = range(cache.indexed, len(t))
+    for i, rec in zip(rows, db_table_read_list(t, rows)):
+        n = rec[0]
+        smi = bytes(rec[1:1 + (n + 7) // 8])[:n].decode()
+        cache.index.setdefault(smi, i)
+    cache.indexed = rows.stop
+
+
+def db_smiles_cache_lookup(cache: db_smiles_cache, smiles: str) -> arrays.intvec:
+    """
+    Return the encoded graph of a SMILES from the cache, or None if it is
+    not in the cache. The graph is copied out of the cache so it can be sent
+    to other processes.
+    """
+
+    v = cache.pending.get(smiles)
+    if v is not None:
+        return v
 
+    i = cache.index.get(smiles)
+    if i is None:
+        return None
+
+    rec = db_table_read(cache.table, i)
+    v = arrays.intvec()
+    v.v = array.array("q", rec[1 + (rec[0] + 7) // 8:])
+    return v
+
+
+def db_smiles_cache_read(
+    gcd: codecs.graph_codec, smiles: Iterable[str]
+) -> Dict[str, arrays.intvec]:
+    """
+    Read the encoded graphs of the SMILES that are in the cache.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decodes the SMILES
+    smiles : Iterable[str]
+        The SMILES to read
+
+    Returns
+    -------
+    Dict[str, arrays.intvec]
+        The encoded graph of each SMILES that was found. The graphs are
+        encoded with the atom and bond primitives of the codec, and are copied
+        out of the cache so they can be sent to other processes.
+    """
+
+    cache = db_smiles_cache_open(gcd)
+    if cache is None:
+        return {}
+
+    found = {}
+    for smi in smiles:
+        v = db_smiles_cache_lookup(cache, smi)
+        if v is not None:
+            found[smi] = v
+    return found
+
+
+def db_smiles_cache_commit(cache: db_smiles_cache) -> int:
+    """
+    Write the decoded SMILES that are held by a cache. The next miss of
+    db_smiles_decode looks for SMILES added by other processes again.
+    """
+
+    cache.refreshed = False
+    if not cache.pending:
+        return 0
+
+    pending = cache.pending
+    cache.pending = {}
+
+    # the table is reloaded while locked, so SMILES written by other
+    # processes since the last refresh are only written again, and the
+    # first record of a SMILES is the one that is read
+    db_table_append(
+        cache.table,
+        (db_smiles_cache_record(k, v) for k, v in pending.items())
+    )
+    db_smiles_cache_refresh(cache)
+    return len(pending)
+
+
+def db_smiles_cache_flush(gcd: codecs.graph_codec) -> int:
+    """
+    Write the decoded SMILES that db_smiles_decode is holding for a codec.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decoded the SMILES
+
+    Returns
+    -------
+    int
+        The number of graphs that were written
+    """
+
+    cache = db_smiles_cache_get(gcd)
+    if cache is None:
+        return 0
+    return db_smiles_cache_commit(cache)
+
+
+def db_smiles_cache_flush_all() -> int:
+    """
+    Write the decoded SMILES that are held for every cache of this process.
+    This is called when the process exits.
+    """
+
+    return sum(map(db_smiles_cache_commit, db_smiles_cache_ctx.caches.values()))
+
+
+atexit.register(db_smiles_cache_flush_all)
+
+
+def db_smiles_cache_write(
+    gcd: codecs.graph_codec, pairs: Dict[str, arrays.intvec]
+) -> int:
+    """
+    Add encoded graphs to the cache. SMILES that are already in the cache
+    are skipped.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decoded the SMILES
+    pairs : Dict[str, arrays.intvec]
+        The graph of each SMILES, encoded with the atom and bond primitives
+        of the codec
+
+    Returns
+    -------
+    int
+        The number of graphs that were added
+    """
+
+    cache = db_smiles_cache_open(gcd)
+    if cache is None:
+        return 0
+
+    for k, v in pairs.items():
+        if k not in cache.index:
+            cache.pending[k] = v
+    return db_smiles_cache_flush(gcd)
+
+
+def db_smiles_decode(gcd: codecs.graph_codec, smiles: str) -> graphs.graph:
+    """
+    Decode a SMILES, using the cache if configs.smiles_cache_path is set.
+    A SMILES that is not in the cache is decoded and held, and the held
+    SMILES are written together once there are
+    db_smiles_cache_ctx.pending_max of them. Call db_smiles_cache_flush to
+    write the rest at the end of each batch of SMILES; the SMILES added by
+    other processes are only looked for on the first miss of a batch.
+
+    Parameters
+    ----------
+    gcd : codecs.graph_codec
+        The codec that decodes the SMILES
+    smiles : str
+        The SMILES to decode
+
+    Returns
+    -------
+    graphs.graph
+    """
+
+    cache = db_smiles_cache_get(gcd)
+    if cache is None:
+        return gcd.smiles_decode(smiles)
+
+    v = db_smiles_cache_lookup(cache, smiles)
+    if v is None and not cache.refreshed:
+        # only look for SMILES added by other processes on a miss
+        db_smiles_cache_refresh(cache)
+        cache.refreshed = True
+        v = db_smiles_cache_lookup(cache, smiles)
+    if v is not None:
+        return cache.icd.graph_decode(v)
+
+    g = gcd.smiles_decode(smiles)
+    cache.pending[smiles] = cache.icd.graph_encode(g)
+    if len(cache.pending) >= db_smiles_cache_ctx.pending_max:
+        db_smiles_cache_flush(gcd)
+    return g
@@ -11,8 +11,11 @@ of the same topology, for example bonds, angles and dihedrals.
 
 from typing import Sequence, Dict, Tuple, List, Generator
 
+import array
+import collections
 import datetime
 import itertools
+import os
 
 from besmarts.core import arrays
 from besmarts.core import chem
@@ -25,6 +28,79 @@ from besmarts.core.primitives import primitive_key
 node_id = int
 edge_id = Tuple[node_id, node_id]
 
+graph_dict_serials = itertools.count()
+
+
+class graph_dict(dict):
+    """
+    The nodes or edges of a graph. The serial changes whenever an id is added
+    or removed, so what is calculated from the ids, such as the depths and
+    distances of graph_shape_key, can be kept until the ids change. Two
+    dicts only share a serial if one is a copy of the other with the same
+    ids.
+    """
+
+    __slots__ = ("serial",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.serial = next(graph_dict_serials)
+
+    def __setitem__(self, k, v):
+        if k not in self:
+            self.serial = next(graph_dict_serials)
+        super().__setitem__(k, v)
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self.serial = next(graph_dict_serials)
+
+    def __ior__(self, o):
+        super().__ior__(o)
+        self.serial = next(graph_dict_serials)
+        return self
+
+    def __reduce__(self):
+        # serials are only unique within a process
+        return (graph_dict, (dict(self),))
+
+    def pop(self, *args):
+        self.serial = next(graph_dict_serials)
+        return super().pop(*args)
+
+    def popitem(self):
+        self.serial = next(graph_dict_serials)
+        return super().popitem()
+
+    def clear(self):
+        self.serial = next(graph_dict_serials)
+        super().clear()
+
+    def update(self, *args, **kwargs):
+        self.serial = next(graph_dict_serials)
+        super().update(*args, **kwargs)
+
+    def setdefault(self, k, v=None):
+        if k not in self:
+            self.serial = next(graph_dict_serials)
+        return super().setdefault(k, v)
+
+    def copy(self) -> "graph_dict":
+        return graph_dict_like(self, self)
+
+
+def graph_dict_like(d, items: Dict) -> graph_dict:
+    """
+    Return the items as a graph_dict with the same serial as d, which must
+    have the same ids.
+    """
+
+    g = graph_dict(items)
+    serial = getattr(d, "serial", None)
+    if serial is not None:
+        g.serial = serial
+    return g
+
 
 class graph:
     """
@@ -38,6 +114,10 @@ class graph:
         nodes: Dict[node_id, chem.bechem],
         edges: Dict[edge_id, chem.bechem],
     ):
+        if type(nodes) is dict:
+            nodes = graph_dict(nodes)
+        if type(edges) is dict:
+            edges = graph_dict(edges)
         self.nodes: Dict[node_id, chem.bechem] = nodes
         self.edges: Dict[edge_id, chem.bechem] = edges
         self.cache: Dict = {}
@@ -150,7 +230,9 @@ class structure(subgraph):
     the distance from any of the atoms in the core structure, called the
     primary nodes in the topology."""
 
-    __slots__ = ("nodes", "edges", "select", "topology", "cache", "hashes")
+    __slots__ = (
+        "nodes", "edges", "select", "topology", "cache", "hashes", "shape"
+    )
 
     def __init__(
         self,
@@ -169,90 +251,62 @@ class structure(subgraph):
 
         self.cache: Dict = {}
         self.hashes: Dict = {}
+        self.shape: Dict = {}
 
     def __hash__(self):
         h = self.hashes.get(self.select)
-        # h = None
-        # print("CACHE:", id(self), self.hashes)
-        # h = None
         if h is None:
-            g = structure_remove_unselected(self)
-            g = structure_remove_nodes(g, structure_unreachable_nodes(g))
-            g = structure_relabel_nodes(g, {k:i for i,k in enumerate(g.nodes)})
-            # beg = structure_to_graph(self)
-            beg = subgraph(g.nodes, g.edges, g.select)
-
-            # overall topology defines uniqueness
-            depths = tuple(structure_node_depths(self))
-
-            # we can have a single graph with 2 labeled bonds.. make sure they are
-            # unique
-            core = 0
-            topo_nodes = tuple((self.select[n] for n in self.topology.primary))
-            core = structure_remove_nodes(
-                self, tuple((n for n in self.nodes if n not in topo_nodes))
-            )
-            core = structure_to_graph(core)
-            adjlens = {i: j for i, j in subgraph_connections(self).items() if i in self.select and j in self.select}
-            nbr_hash = 0
-            if adjlens:
-                nbr_hash = tuple((tuple([hash(self.nodes[j])] + sorted([hash(self.nodes[i]) for i in adjlens[j]])) for j in topo_nodes))
-
-            depth = structure_max_depth(g)
-            atom_hash = 0
-            if len(self.topology.primary) > 1:
-                atom_hashes = []
-                for i in self.topology.primary:
-                    if (
-                        set([perm[i] for perm in self.topology.permutations])
-                        == 1
-                    ):
-                        atom_hashes.append(0)
-                        continue
-                    i = g.select[i]
-                    select = tuple([i] + [x for x in beg.select if i != x])
-                    ag = structure(
-                        beg.nodes, beg.edges, select, topology.atom_topology()
-                    )
-                    ag = structure_remove_unselected(ag)
-                    ag = structure_up_to_depth(ag, depth)
-                    remove = structure_unreachable_nodes(ag)
-                    ag = structure_remove_nodes(ag, remove)
-                    # print("SELECT", ag.select, "HASH", hash(ag), tuple(structure_node_depths(ag)))
-                    ah = tuple(structure_node_depths(ag))
-                    atom_hashes.append(ah)
-                atom_hash = max(
-                    hash(tuple(atom_hashes[i] for i in y))
-                    for y in self.topology.permutations
-                )
-            preh = (hash(beg), depths, hash(nbr_hash), hash(core), atom_hash)
-            # atom_hash = 0
-            # preh = (hash(beg), atom_hash)
-            # preh = (hash(beg), *depths, hash(core))
-            h = hash(preh)
-            # print(h, preh)
+            h = structure_invariant(self)
             self.hashes[self.select] = h
-            # print("CACHE MISS", self.select)
-            # print("CACHE SET:", id(self), self.hashes)
-        # else:
-        # print("CACHE HIT", self.select)
         return h
 
     def __eq__(self, o):
+        """
+        Return whether two structures have the same invariant, see
+        structure_invariant. The invariant is a Weisfeiler-Lehman hash, so
+        structures that it cannot tell apart, such as some fused ring
+        systems, compare equal. This is accepted since structures are mostly
+        compared to group them as keys, and use mapper.mapper_equal when an
+        exact comparison is needed.
+        """
         return hash(self) == hash(o)
 
     def __neq__(self, o):
         return hash(self) != hash(o)
 
 
+class graph_distance_table:
+    """
+    The shortest path lengths between all pairs of nodes in a graph, stored as
+    a flat n by n array. Pairs that are not connected have a length of n.
+    """
+
+    __slots__ = ("index", "n", "table")
+
+    def __init__(self, index: Dict[node_id, int], table: array.array):
+        self.index: Dict[node_id, int] = index
+        self.n: int = len(index)
+        self.table: array.array = table
+
+
+class graph_distances_ctx:
+    """
+    The distance tables of graphs keyed by graph_shape_key, so that all
+    structures made from the same molecule share a single table.
+    """
+    cache = collections.OrderedDict()
+    cache_size = 2**12
+    stats = collections.Counter()
+
+
 def graph_nodes_copy(g: graph) -> Dict[node_id, chem.bechem]:
     nodes = {k: chem.bechem_copy(v) for k, v in g.nodes.items()}
-    return nodes
+    return graph_dict_like(g.nodes, nodes)
 
 
 def graph_edges_copy(g: graph) -> Dict[edge_id, chem.bechem]:
     edges = {k: chem.bechem_copy(v) for k, v in g.edges.items()}
-    return edges
+    return graph_dict_like(g.edges, edges)
 
 
 def graph_connection(g: graph, a: int):
@@ -446,7 +500,7 @@ def graph_minimum_spanning_tree(
                 edges.append(tuple(sorted([i, n])))
                 new.add(n)
                 visited.add(n)
-    g.edges = {e: g.edges[e] for e in edges}
+    g.edges = graph_dict({e: g.edges[e] for e in edges})
     return g
 
 
@@ -620,6 +674,156 @@ def graph_to_structures(
     else:
         return [structure(g.nodes, g.edges, select, topo) for select in selections]
 
+def graph_to_structures_extend(
+    g: graph,
+    selections: Sequence[Sequence[node_id]],
+    topo: topology.structure_topology,
+    config: configs.smarts_extender_config,
+) -> List[structure]:
+    """
+    Make the structures of a graph and extend them in a single pass. The
+    structures share the nodes and edges of the graph, and the adjacency and
+    distances of the graph are calculated once for all of them. The result
+    is the same as extending each structure with structure_extend.
+
+    Parameters
+    ----------
+    g : graph
+        The input graph
+
+    selections : Sequence[Sequence[node_id]]
+        A list of selections for each structure. If None, every selection of
+        the topology in the graph is used.
+
+    topo: structure_topology
+        The topology of the structures
+
+    config : smarts_extender_config
+        The configuration for extending the structures
+
+    Returns
+    -------
+    List[structure]
+        The extended structures, one for each selection
+    """
+
+    if selections is None:
+        selections = [s.select for s in graph_to_structure_topology(g, topo)]
+
+    adj = {i: [] for i in g.nodes}
+    for i, j in g.edges:
+        adj[i].append(j)
+        adj[j].append(i)
+
+    dist = None
+    if len(g.nodes) <= configs.graph_distances_max_nodes:
+        dist = graph_distances(g)
+    key = graph_shape_key(g)
+
+    structs = []
+    for select in selections:
+        s = structure(g.nodes, g.edges, tuple(select), topo)
+
+        primary = tuple(s.select[i] for i in topo.primary)
+        if dist is None:
+            depths = graph_distances_walk(adj, primary)
+        else:
+            depths = graph_distances_from(dist, primary)
+            s.shape["distances"] = key, dist
+        s.shape[primary] = key, adj, depths
+
+        extension = structure_extend_step(s, adj, depths, config)
+        while extension:
+            s.select = (*s.select, *extension)
+            extension = structure_extend_step(s, adj, depths, config)
+
+        structs.append(s)
+
+    return structs
+
+
+def graph_to_intvecs_extend(
+    g: graph,
+    selections: Sequence[Sequence[node_id]],
+    topo: topology.structure_topology,
+    config: configs.smarts_extender_config,
+    atom_primitives,
+    bond_primitives,
+) -> List[arrays.intvec]:
+    """
+    Make the structures of a graph, extend them, and encode them as intvecs
+    in a single pass. The nodes and edges of the graph are encoded once and
+    shared by all of the intvecs. The result is the same as encoding each
+    structure of graph_to_structures_extend with structure_to_intvec.
+
+    Parameters
+    ----------
+    g : graph
+        The input graph
+
+    selections : Sequence[Sequence[node_id]]
+        A list of selections for each structure. If None, every selection of
+        the topology in the graph is used.
+
+    topo: structure_topology
+        The topology of the structures
+
+    config : smarts_extender_config
+        The configuration for extending the structures
+
+    atom_primitives : Sequence[primitive_key]
+        The atom primitives to encode
+
+    bond_primitives : Sequence[primitive_key]
+        The bond primitives to encode
+
+    Returns
+    -------
+    List[arrays.intvec]
+        The encoded structures, one for each selection
+    """
+
+    structs = graph_to_structures_extend(g, selections, topo, config)
+
+    rows = {}
+    for k, v in g.nodes.items():
+        rows[k] = array.array(
+            "q", [v.primitives[name].v for name in atom_primitives]
+        )
+
+    edges = array.array("q")
+    for k, v in g.edges.items():
+        edges.append(k[0])
+        edges.append(k[1])
+        edges.fromlist([v.primitives[name].v for name in bond_primitives])
+
+    header = [
+        len(g.nodes),
+        len(atom_primitives),
+        len(g.edges),
+        len(bond_primitives),
+        topology.index_of(topo),
+    ]
+
+    vecs = []
+    for s in structs:
+        intvec = arrays.intvec()
+        vec = intvec.v
+        vec.fromlist(header)
+        select = set(s.select)
+        for k in s.select:
+            vec.append(-k)
+            vec.extend(rows[k])
+        for k in rows:
+            if k not in select:
+                vec.append(k)
+                vec.extend(rows[k])
+        vec.extend(edges)
+        vecs.append(intvec)
+
+    return vecs
+
+
 def graph_to_structure_topology(g, topo) -> Sequence[structure]:
     ic_tab = {
         topology.atom : graph_to_structure_atoms,
@@ -1301,6 +1505,134 @@ def structure_node_depths(g: structure) -> Sequence[int]:
 
     return lens
 
+def structure_shape(g: structure, adj=None):
+    """
+    Return the adjacency of a structure and the depth of each node. These do
+    not depend on the selection, so they are kept across extensions and only
+    recalculated if the nodes, edges, or primary nodes change, see
+    graph_shape_key. The depths come from the distance table of the graph,
+    see graph_distances, or from walking the graph if it has more than
+    configs.graph_distances_max_nodes nodes.
+
+    Parameters
+    ----------
+    g : structure
+        The input structure
+
+    adj : Dict[node_id, Sequence[node_id]]
+        An adjacency map of the nodes, which is calculated if not given
+
+    Returns
+    -------
+    Tuple[Dict[node_id, List[node_id]], Dict[node_id, int]]
+        The neighbors of each node, and the depth of each reachable node
+    """
+
+    primary = tuple(g.select[i] for i in g.topology.primary)
+    key = graph_shape_key(g)
+    shape = g.shape.get(primary)
+    if shape is not None and shape[0] == key:
+        return shape[1], shape[2]
+
+    if adj is None:
+        adj = {i: [] for i in g.nodes}
+        for i, j in g.edges:
+            adj[i].append(j)
+            adj[j].append(i)
+
+    # drop the shapes of other primary nodes, but keep the distances since
+    # graph_distances checks them itself
+    dist = g.shape.get("distances")
+    g.shape.clear()
+    if len(g.nodes) > configs.graph_distances_max_nodes:
+        depths = graph_distances_walk(adj, primary)
+    else:
+        if dist is not None:
+            g.shape["distances"] = dist
+        depths = graph_distances_from(graph_distances(g), primary)
+
+    g.shape[primary] = key, adj, depths
+    return adj, depths
+
+
+def graph_shape_key(g: graph) -> Tuple:
+    """
+    Return the serials of the node and edge ids of a graph, see graph_dict.
+    The shapes and distance tables that are kept with a graph are stored
+    with this key, and are only used if the key of the graph is still the
+    same, so they are recalculated after a node or edge is added or removed,
+    even if the number of nodes and edges does not change.
+
+    Parameters
+    ----------
+    g : graph
+        The input graph
+
+    Returns
+    -------
+    Tuple
+        The process id and the serials of the nodes and the edges
+    """
+
+    nodes = getattr(g.nodes, "serial", None)
+    edges = getattr(g.edges, "serial", None)
+    if nodes is None or edges is None:
+        # nodes or edges that were assigned as a plain mapping
+        return tuple(g.nodes), tuple(g.edges)
+    # the shapes kept in a pickled graph have the serials of another process
+    return os.getpid(), nodes, edges
+
+
+def structure_invariant(g: structure) -> int:
+    """
+    Return a hash of a structure that does not depend on how its nodes are
+    labeled. Isomorphic structures always have the same invariant, but
+    structures with the same invariant are not always isomorphic.
+
+    The selected nodes start colored by their primitives and depth, and each
+    color is then repeatedly refined by the colors and bonds of its neighbors
+    until no more nodes can be told apart (Weisfeiler-Lehman refinement).
+
+    Parameters
+    ----------
+    g : structure
+        The input structure
+
+    Returns
+    -------
+    int
+        The invariant hash
+    """
+
+    adj, depths = structure_shape(g)
+    primary = [g.select[i] for i in g.topology.primary]
+
+    select = set(g.select)
+    nbrs = {
+        i: [(j, hash(g.edges[edge((i, j))])) for j in adj[i] if j in select]
+        for i in g.select
+    }
+    colors = {i: hash((hash(g.nodes[i]), depths.get(i))) for i in g.select}
+
+    n_colors = len(set(colors.values()))
+    for _ in range(len(select)):
+        colors = {
+            i: hash((c, tuple(sorted((e, colors[j]) for j, e in nbrs[i]))))
+            for i, c in colors.items()
+        }
+        n = len(set(colors.values()))
+        if n == n_colors:
+            break
+        n_colors = n
+
+    core = min(
+        tuple(colors[primary[i]] for i in perm)
+        for perm in g.topology.permutations
+    )
+
+    return hash((core, tuple(sorted(colors.values()))))
+
+
 def graph_remove_nodes(g: graph, nodes: Sequence[node_id]) -> graph:
     """
     Remove a list of nodes from a structure
@@ -1792,9 +2124,6 @@ def structure_extend(
     modified = True
     i = -1
 
-    include_hydrogen = config.include_hydrogen
-    depth_min = config.depth_min
-    depth_max = config.depth_max
     success = False
 
     while modified:
@@ -1805,49 +2134,9 @@ def structure_extend(
 
         for group in groups:
             for atom_env in (atoms[j] for j in group):
-                primaries = [
-                    atom_env.select[n] for n in atom_env.topology.primary
-                ]
-
-                adj = graph_connections(atom_env)
-
-                if not adj:
-                    continue
-
-                neighbors = set(
-                    x for atom in atom_env.select for x in adj[atom]
-                )
-                neighbors.difference_update(atom_env.select)
-
-                if not include_hydrogen:
-                    neighbors = set(
-                        x
-                        for x in neighbors
-                        if not (
-                            atom_env.nodes[x][primitive_key.ELEMENT].bits() == 1
-                            and atom_env.nodes[x][primitive_key.ELEMENT][1]
-                        )
-                    )
+                adj, depths = structure_shape(atom_env)
 
-                lengths = {
-                    nbr: min(
-                        (
-                            graph_shortest_path_length(
-                                atom_env, origin, nbr, adj
-                            )
-                            for origin in primaries
-                        )
-                    )
-                    for nbr in neighbors
-                }
-                # print("lengths\n", lengths)
-                extension = []
-                for nbr, depth in lengths.items():
-                    below = depth <= depth_min
-                    above = depth_max is not None and depth > depth_max
-                    if (below or not above) and nbr not in atom_env.select:
-                        if nbr not in extension:
-                            extension.append(nbr)
+                extension = structure_extend_step(atom_env, adj, depths, config)
 
                 if extension:
                     atom_env.select = (*atom_env.select, *extension)
@@ -1857,6 +2146,66 @@ def structure_extend(
 
     return success
 
+
+def structure_extend_step(
+    g: structure, adj, depths, config: configs.smarts_extender_config
+) -> List[node_id]:
+    """
+    Return the nodes that one round of extension adds to the selection of a
+    structure.
+
+    Parameters
+    ----------
+    g : structure
+        The structure to extend
+
+    adj : Dict[node_id, List[node_id]]
+        The neighbors of each node of the structure
+
+    depths : Dict[node_id, int]
+        The depth of each node of the structure
+
+    config : smarts_extender_config
+        The configuration for extending the structure
+
+    Returns
+    -------
+    List[node_id]
+        The nodes to add to the selection
+    """
+
+    if not adj:
+        return []
+
+    depth_min = config.depth_min
+    depth_max = config.depth_max
+
+    neighbors = set(x for atom in g.select for x in adj[atom])
+    neighbors.difference_update(g.select)
+
+    if not config.include_hydrogen:
+        neighbors = set(
+            x
+            for x in neighbors
+            if not (
+                g.nodes[x][primitive_key.ELEMENT].bits() == 1
+                and g.nodes[x][primitive_key.ELEMENT][1]
+            )
+        )
+
+    lengths = {nbr: depths[nbr] for nbr in neighbors if nbr in depths}
+
+    extension = []
+    for nbr, depth in lengths.items():
+        below = depth <= depth_min
+        above = depth_max is not None and depth > depth_max
+        if (below or not above) and nbr not in g.select:
+            if nbr not in extension:
+                extension.append(nbr)
+
+    return extension
+
+
 def structure_frontier_nodes(g, nodes, adj=None) -> Dict[int, Sequence[int]]:
     """
     Return the nodes that are one level deeper than the given input nodes of the
@@ -1888,7 +2237,7 @@ def structure_frontier_nodes(g, nodes, adj=None) -> Dict[int, Sequence[int]]:
             (
                 n
                 for n in subgraph_connection(g, node)
-                if structure_node_depth(g, n, depth_cache=depth_cache)
+                if structure_node_depth(g, n, depth_cache=depth_cache, adj=adj)
                 == depth + 1
             )
         )
@@ -1940,7 +2289,7 @@ def structure_vertices_at_depth(
         A cache of precalculated depths
 
     adj : Dict[node_id, Sequence[node_id]]
-        An adjacency map
+        An adjacency map of the nodes, see structure_shape
 
     Returns
     -------
@@ -1952,16 +2301,8 @@ def structure_vertices_at_depth(
         ret = depth_cache.get(depth)
         if ret is not None:
             return ret
-    ret = set()
-    for v in g.select:
-        lens = []
-        for i in g.topology.primary:
-            root_v = g.select[i]
-            path_len = graph_shortest_path_length(g, root_v, v, adj)
-            if path_len is not None:
-                lens.append(path_len)
-        if lens and min(lens) == depth:
-            ret.add(v)
+    depths = structure_shape(g, adj=adj)[1]
+    ret = set(v for v in g.select if depths.get(v) == depth)
     if depth_cache is not None:
         depth_cache[depth] = ret
     return ret
@@ -1981,30 +2322,29 @@ def structure_fill(g: structure):
 
 def structure_node_depth(g: structure, node: node_id, depth_cache=None, adj=None):
     """
-    get the vertices at some some depth from the primary set
+    get the depth of a selected node from the primary set. Nodes that are not
+    selected are one deeper than the structure.
     """
-    depth = 0
-    while depth <= structure_max_depth(g, adj=adj):
-        nodes = structure_vertices_at_depth(
-            g, depth, depth_cache=depth_cache, adj=adj
-        )
-        if node in nodes:
-            break
-        else:
-            depth += 1
+    max_depth = structure_max_depth(g, adj=adj)
+    depth = structure_shape(g, adj=adj)[1].get(node)
+    if depth is None or depth > max_depth or node not in g.select:
+        depth = max_depth + 1
     return depth
 
 
 def structure_max_depth(g: structure, adj=None) -> int:
+    depths = structure_shape(g, adj=adj)[1]
+    counts = collections.Counter(depths.get(v) for v in g.select)
+
     i = 0
-    seen = set()
+    seen = 0
 
-    while len(seen) != len(g.select):
-        result = structure_vertices_at_depth(g, i, adj=adj)
+    while seen != len(g.select):
+        result = counts.get(i, 0)
         if not result:
             i = max(i - 1, 0)
             break
-        seen.update(result)
+        seen += result
         i = i + 1
 
     if i > 0:
@@ -2036,7 +2376,7 @@ def structure_topology_edges(g: structure) -> Sequence[edge_id]:
 def structure_up_to_depth(g: structure, i: int, adj=None):
 
     to_remove = []
-    for d in range(structure_max_depth(g), i, -1):
+    for d in range(structure_max_depth(g, adj=adj), i, -1):
         nodes = structure_vertices_at_depth(g, d, adj=adj)
         if nodes:
             to_remove.extend(nodes)
@@ -2464,18 +2804,177 @@ def graph_shortest_path_length(
     dst : node_id
         The destination node
     adj : Dict[node_id, Sequence[node_id]
-        A node adjacency map
+        A node adjacency map, which is only used to walk graphs with more
+        than configs.graph_distances_max_nodes nodes
 
     Returns
     -------
     int
-        The path length
+        The path length, or None if the nodes are not connected
     """
-    l = graph_shortest_path(g, a, b, adj)
-    if l is None:
-        return None
+    if len(g.nodes) > configs.graph_distances_max_nodes:
+        if not adj:
+            adj = graph_connections(g)
+        return graph_distances_walk(adj, (a,), b).get(b)
+    return graph_distance(graph_distances(g), a, b)
+
+
+def graph_distances(g: graph) -> graph_distance_table:
+    """
+    Return the table of shortest path lengths between all nodes of a graph.
+    The table is kept with the graph, and is shared with the copies of the
+    graph and the structures made from it while their nodes and edges are
+    the same. The table has a row for every node, so the depth and path
+    length functions only use it for graphs with up to
+    configs.graph_distances_max_nodes nodes, see graph_distances_walk.
+
+    Parameters
+    ----------
+    g: graph
+        The input graph
+
+    Returns
+    -------
+    graph_distance_table
+        The path lengths
+    """
+
+    shared = graph_shape_key(g)
+    cache = g.shape if isinstance(g, structure) else g.cache
+    dist = cache.get("distances")
+    if dist is not None and dist[0] == shared:
+        return dist[1]
+
+    ctx = graph_distances_ctx
+    dist = ctx.cache.get(shared)
+    if dist is None:
+        ctx.stats["misses"] += 1
+        dist = graph_distance_table_new(g)
+        if ctx.cache_size > 0:
+            ctx.cache[shared] = dist
+            if len(ctx.cache) > ctx.cache_size:
+                ctx.cache.popitem(last=False)
+                ctx.stats["evictions"] += 1
     else:
-        return len(l)-1
+        ctx.stats["hits"] += 1
+        ctx.cache.move_to_end(shared)
+
+    cache["distances"] = shared, dist
+    return dist
+
+
+def graph_distance_table_new(g: graph) -> graph_distance_table:
+    """
+    Calculate the shortest path lengths between all nodes of a graph using a
+    breadth-first search from each node.
+
+    Parameters
+    ----------
+    g: graph
+        The input graph
+
+    Returns
+    -------
+    graph_distance_table
+        The path lengths
+    """
+
+    index = {x: i for i, x in enumerate(g.nodes)}
+    n = len(index)
+
+    adj = [[] for _ in range(n)]
+    for a, b in g.edges:
+        adj[index[a]].append(index[b])
+        adj[index[b]].append(index[a])
+
+    table = array.array(arrays.find_unsigned_typecode_min(n + 1), [n]) * (n*n)
+    for i in range(n):
+        row = i * n
+        table[row + i] = 0
+        front = [i]
+        d = 0
+        while front:
+            d += 1
+            nxt = []
+            for j in front:
+                for k in adj[j]:
+                    if table[row + k] == n:
+                        table[row + k] = d
+                        nxt.append(k)
+            front = nxt
+
+    return graph_distance_table(index, table)
+
+
+def graph_distance(dist: graph_distance_table, a: node_id, b: node_id) -> int:
+    """
+    Return the length of the shortest path between two nodes from a distance
+    table, or None if the nodes are not connected.
+    """
+    n = dist.n
+    d = dist.table[dist.index[a] * n + dist.index[b]]
+    if d == n:
+        return None
+    return d
+
+
+def graph_distances_from(
+    dist: graph_distance_table, sources: Sequence[node_id]
+) -> Dict[node_id, int]:
+    """
+    Return the length of the shortest path from any of the source nodes to
+    each node that can be reached from them.
+    """
+    n = dist.n
+    rows = [dist.index[i] * n for i in sources]
+    lens = {}
+    for i, k in dist.index.items():
+        d = min((dist.table[r + k] for r in rows), default=n)
+        if d < n:
+            lens[i] = d
+    return lens
+
+
+def graph_distances_walk(
+    adj: Dict[node_id, Sequence[node_id]],
+    sources: Sequence[node_id],
+    target: node_id = None,
+) -> Dict[node_id, int]:
+    """
+    Return the length of the shortest path from any of the source nodes to
+    each node that can be reached from them by walking the graph one level
+    at a time. If a target is given, the walk stops once it is reached.
+    """
+    lens = {i: 0 for i in sources}
+    front = list(lens)
+    d = 0
+    while front and target not in lens:
+        d += 1
+        nxt = []
+        for i in front:
+            for j in adj[i]:
+                if j not in lens:
+                    lens[j] = d
+                    nxt.append(j)
+        front = nxt
+    return lens
+
+
+def graph_distances_cache_clear() -> None:
+    """
+    Remove all shared distance tables and reset the statistics.
+    """
+    graph_distances_ctx.cache.clear()
+    graph_distances_ctx.stats.clear()
+
+
+def graph_distances_cache_stats() -> Dict[str, int]:
+    """
+    Return the hits, misses, and evictions of the shared distance tables.
+    """
+    stats = dict(graph_distances_ctx.stats)
+    stats["size"] = len(graph_distances_ctx.cache)
+    return stats
 
 def graph_to_intvec(g: graph, atom_primitives, bond_primitives) -> arrays.intvec:
     intvec = arrays.intvec()
@@ -77,6 +77,83 @@ def structure_hierarchy_copy(th: structure_hierarchy) -> structure_hierarchy:
     return structure_hierarchy(index, smarts, subgraphs, topology)
 
 
+def smarts_hierarchy_diff(A: smarts_hierarchy, B: smarts_hierarchy) -> Dict:
+    """
+    Compute the changes needed to transform hierarchy A into hierarchy B. The
+    tree is only included if it changed, and only the SMARTS that were added,
+    changed, or removed are included.
+
+    Parameters
+    ----------
+    A : smarts_hierarchy
+        The reference hierarchy, or None if there is no reference
+    B : smarts_hierarchy
+        The target hierarchy
+
+    Returns
+    -------
+    Dict
+        The diff with keys "index", "smarts", and "removed"
+    """
+
+    diff = {"index": None, "smarts": {}, "removed": []}
+
+    if A is None:
+        diff["index"] = trees.tree_index_copy(B.index)
+        diff["smarts"].update(B.smarts)
+        return diff
+
+    a, b = A.index, B.index
+    node_key = lambda n: (n.index, n.category, n.type, n.name)
+    if (
+        a.above != b.above
+        or a.below != b.below
+        or [node_key(n) for n in a.nodes.values()]
+        != [node_key(n) for n in b.nodes.values()]
+    ):
+        diff["index"] = trees.tree_index_copy(b)
+
+    for idx, sma in B.smarts.items():
+        if idx not in A.smarts or A.smarts[idx] != sma:
+            diff["smarts"][idx] = sma
+
+    diff["removed"].extend(idx for idx in A.smarts if idx not in B.smarts)
+
+    return diff
+
+
+def smarts_hierarchy_patch(A: smarts_hierarchy, diff: Dict) -> smarts_hierarchy:
+    """
+    Apply a diff from smarts_hierarchy_diff to a hierarchy, modifying it in
+    place.
+
+    Parameters
+    ----------
+    A : smarts_hierarchy
+        The hierarchy to modify, or None to create a new hierarchy
+    diff : Dict
+        The diff to apply
+
+    Returns
+    -------
+    smarts_hierarchy
+        The modified hierarchy
+    """
+
+    if A is None:
+        A = smarts_hierarchy(trees.tree_index(), {})
+
+    if diff["index"] is not None:
+        A.index = diff["index"]
+
+    for idx in diff["removed"]:
+        A.smarts.pop(idx, None)
+
+    A.smarts.update(diff["smarts"])
+
+    return A
+
+
 def smarts_hierarchy_to_structure_hierarchy(
     shier: smarts_hierarchy,
     gcd: codecs.graph_codec,
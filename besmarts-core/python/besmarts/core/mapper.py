@@ -4,6 +4,7 @@ besmarts.core.mapper
 Functions for mapping between two structures of arbitrary size
 """
 
+import collections
 import datetime
 import math
 import os
@@ -49,6 +50,15 @@ class align_score_ctx:
     ref = None
     to_check = None
 
+class pairwise_overlap_ctx:
+    """
+    The scores of pairwise_overlap, keyed by the hashes of the two atoms and
+    their bonds, shared by all calls in a process.
+    """
+    cache = collections.OrderedDict()
+    cache_size = 2**16
+    stats = collections.Counter()
+
 # TODO convert to workspaces?
 class map_vertices_ctx:
     cg = None
@@ -222,6 +232,51 @@ def mapper(
     )
 
 
+def mapper_equal(A: graphs.structure, B: graphs.structure) -> bool:
+    """
+    Determine whether A is equal to B up to a permutation of the topology,
+    where every selected node and every edge between selected nodes of A maps
+    onto an equal node and edge of B. Unlike comparing hashes, this is exact.
+
+    Parameters
+    ----------
+    A : graphs.structure
+        The first input structure that defines the domain of the map
+    B : graphs.structure
+        The second input structure the defines the range of the map
+
+    Returns
+    -------
+    bool
+        Whether A is equal to B
+    """
+
+    if len(A.select) != len(B.select):
+        return False
+
+    edges_a = [e for e in A.edges if e[0] in A.select and e[1] in A.select]
+    edges_b = [e for e in B.edges if e[0] in B.select and e[1] in B.select]
+    if len(edges_a) != len(edges_b):
+        return False
+
+    M = map_to(A, B, strict=True, equality=True).map
+    if len(M) != len(A.select) or any(j is None for j in M.values()):
+        return False
+
+    for i, j in M.items():
+        if A.nodes[i] != B.nodes[j]:
+            return False
+
+    for i, j in edges_a:
+        if M.get(i) is None or M.get(j) is None:
+            return False
+        e = tuple(sorted((M[i], M[j])))
+        if e not in B.edges or A.edges[(i, j)] != B.edges[e]:
+            return False
+
+    return True
+
+
 def mapper_force_equality(G, H, pool=None) -> mapped_type:
     """
     Determine the mapping between two graphs G and H where G must be equal to H
@@ -1315,33 +1370,192 @@ def overlap_scores(cg, o, skip=None, cg_depth_cache=None, o_depth_cache=None):
     return scores
 
 
+def pairwise_overlap_cache_configure(cache_size: int) -> None:
+    """
+    Set the maximum number of scores kept by pairwise_overlap. A size of 0
+    disables the cache.
+    """
+    pairwise_overlap_ctx.cache_size = cache_size
+    cache = pairwise_overlap_ctx.cache
+    while len(cache) > max(cache_size, 0):
+        cache.popitem(last=False)
+
+
+def pairwise_overlap_cache_clear() -> None:
+    """
+    Remove all cached scores and reset the statistics.
+    """
+    pairwise_overlap_ctx.cache.clear()
+    pairwise_overlap_ctx.stats.clear()
+
+
+def pairwise_overlap_cache_stats() -> Dict[str, int]:
+    """
+    Return the hits, misses, and evictions of the pairwise_overlap cache.
+    """
+    stats = dict(pairwise_overlap_ctx.stats)
+    stats["size"] = len(pairwise_overlap_ctx.cache)
+    return stats
+
+
+def pairwise_overlap_key(g, n, bonds):
+    return hash(g.nodes[n]), tuple(hash(g.edges[b]) for b in bonds)
+
+
+def linear_assignment(W: List[List[int]]) -> Tuple[int, List[int]]:
+    """
+    Find the assignment of rows to columns with the largest total weight using
+    the Hungarian method. If the matrix is not square, each row or each column
+    is assigned, whichever there are fewer of.
+
+    Parameters
+    ----------
+    W : List[List[int]]
+        The weight matrix
+
+    Returns
+    -------
+    Tuple[int, List[int]]
+        The total weight and the column assigned to each row, or None if the
+        row was not assigned
+    """
+
+    n = len(W)
+    m = len(W[0]) if n else 0
+    if n == 0 or m == 0:
+        return 0, [None] * n
+
+    transpose = n > m
+    if transpose:
+        W = [list(x) for x in zip(*W)]
+        n, m = m, n
+
+    # minimize the negative weights; u and v are the row and column
+    # potentials, and p[j] is the row assigned to column j, all 1-indexed
+    inf = math.inf
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = W[i0 - 1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                cur = -row[j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            cols[p[j] - 1] = j - 1
+    total = sum(W[i][j] for i, j in enumerate(cols))
+
+    if transpose:
+        rows = [None] * m
+        for i, j in enumerate(cols):
+            rows[j] = i
+        cols = rows
+
+    return total, cols
+
+
 def pairwise_overlap(cg, A, o, B):
     H = {}
 
+    A = list(A)
+    B = list(B)
     dprint(f"pairwise overlap {len(A)} {len(B)}")
-    for i in A:
-        prim_i = cg.nodes[i]
-        bonds_i = tuple(
-            tuple(sorted((i, j))) for j in graphs.subgraph_connection(cg, i)
-        )
-        dprint(f"pairwise overlap bonds to permute", bonds_i)
-        if len(bonds_i) > 4:
-            breakpoint()
-        for j in B:
-            prim_j = o.nodes[j]
-            bond_j = tuple(
-                tuple(sorted((j, k))) for k in graphs.subgraph_connection(o, j)
-            )
-            best_score = 0
-            for bi, bond_i in enumerate(itertools.permutations(bonds_i), 0):
-                score = 0
-                for b_i, b_j in zip(bond_i, bond_j):
-                    b_i = cg.edges[b_i]
-                    b_j = o.edges[b_j]
-                    score += (b_i & b_j).bits(maxbits=True)
-                best_score = max(best_score, score)
-
-            H[(i, j)] = (prim_i & prim_j).bits(maxbits=True) + best_score + 1
+
+    cache = pairwise_overlap_ctx.cache
+    cache_size = pairwise_overlap_ctx.cache_size
+    stats = pairwise_overlap_ctx.stats
+
+    bonds_A = [
+        tuple(tuple(sorted((i, j))) for j in graphs.subgraph_connection(cg, i))
+        for i in A
+    ]
+    bonds_B = [
+        tuple(tuple(sorted((j, k))) for k in graphs.subgraph_connection(o, j))
+        for j in B
+    ]
+    keys_A = [pairwise_overlap_key(cg, i, b) for i, b in zip(A, bonds_A)]
+    keys_B = [pairwise_overlap_key(o, j, b) for j, b in zip(B, bonds_B)]
+
+    atom_scores = None
+    for ii, i in enumerate(A):
+        bonds_i = bonds_A[ii]
+        h_i, hb_i = keys_A[ii]
+        hb_i = tuple(sorted(hb_i))
+        for jj, j in enumerate(B):
+            bond_j = bonds_B[jj]
+            h_j, hb_j = keys_B[jj]
+
+            # the bonds of i are assigned optimally, so only the order of the
+            # bonds of j can change the score, and only if some are left out
+            # below
+            if len(hb_j) <= len(hb_i):
+                hb_j = tuple(sorted(hb_j))
+            key = (h_i, h_j, hb_i, hb_j)
+
+            score = cache.get(key)
+            if score is not None:
+                stats["hits"] += 1
+                cache.move_to_end(key)
+                H[(i, j)] = score
+                continue
+            stats["misses"] += 1
+
+            if atom_scores is None:
+                # score all atom pairs at once; only bonds are assigned below
+                atom_scores = chem.bechem_batch_overlap(
+                    [cg.nodes[x] for x in A], [o.nodes[y] for y in B]
+                )
+
+            # only the first len(bonds_i) bonds of j are compared
+            W = [
+                [(cg.edges[b_i] & o.edges[b_j]).bits(maxbits=True)
+                    for b_j in bond_j[:len(bonds_i)]]
+                for b_i in bonds_i
+            ]
+            best_score, _ = linear_assignment(W)
+
+            score = atom_scores[ii][jj] + best_score + 1
+            H[(i, j)] = score
+
+            if cache_size > 0:
+                cache[key] = score
+                if len(cache) > cache_size:
+                    cache.popitem(last=False)
+                    stats["evictions"] += 1
+
     dprint(f"pairwise overlap {A} {B} {H[(i, j)]}")
 
     return H
@@ -1351,7 +1565,9 @@ def group_by_isomorphism(
     structures: List[graphs.structure], mapping_cache=None
 ):
     """
-    Group structures that are isomorphic (equal).
+    Group structures that are isomorphic (equal). Structures are first
+    bucketed by their invariant hash, and only structures in the same bucket
+    are mapped to each other.
 
     Parameters
     ----------
@@ -1364,15 +1580,17 @@ def group_by_isomorphism(
 
     Returns
     -------
-    List[List[graphs.structure]]
-        A list of groups of structures that are isomorphic (equal).
+    List[List[int]]
+        A list of groups of indices of structures that are isomorphic (equal).
     """
 
-    keys = list(range(len(structures)))
-    groups = [keys]
+    buckets = {}
+    for i, g in enumerate(structures):
+        buckets.setdefault(graphs.structure_invariant(g), []).append(i)
+
     new_groups = []
 
-    for group in groups:
+    for group in buckets.values():
         keys = list(group)
         while keys:
             n = keys.pop()
@@ -1380,20 +1598,21 @@ def group_by_isomorphism(
             ref_graph = structures[n]
             for m in keys:
                 cmp_graph = structures[m]
+                if len(ref_graph.select) != len(cmp_graph.select):
+                    continue
                 skip = None
                 if mapping_cache is not None:
                     skip = mapping_cache.get((n, m))
                 mapping = map_to(
                     ref_graph, cmp_graph, strict=True, equality=True, skip=skip
-                )
-                if mapping:
+                ).map
+                if len(mapping) == len(ref_graph.select):
                     new_group.append(m)
-                    for k in list(mapping):
-                        if mapping[k] is None:
-                            del mapping[k]
                     if mapping_cache is not None:
                         mapping_cache[(n, m)] = mapping
-                        mapping_cache[(m, n)] = mapping
+                        mapping_cache[(m, n)] = {
+                            v: k for k, v in mapping.items()
+                        }
             new_groups.append(new_group)
             for m in new_group[1:]:
                 keys.remove(m)
@@ -1868,6 +2087,10 @@ def intersection_list_dispatch(
 def union_list_dispatch(
     indices: List[int],
 ) -> graphs.structure:
+    """
+    Union the selections of union_ctx.A with the given indices, and return
+    the result encoded as an intvec.
+    """
     topo = union_ctx.topology
 
     reference = union_ctx.reference
@@ -1878,22 +2101,24 @@ def union_list_dispatch(
         A = union_ctx.A.read_structure_list(indices)
     else:
         icd: codecs.intvec_codec = union_ctx.icd
-        if union_ctx.result is None:
-            G = union_ctx.A[0]
-            sel = union_ctx.A[1]
-            A = [graphs.graph_to_structure(icd.graph_decode(G[sel[i][0]]), sel[i][1], topo) for i in indices]
-            if max_depth is not None and max_depth > 0:
-                # print(f"EXTENDING to {max_depth}")
-                # for i, x in enumerate(A):
-                #     print(i, x.select)
-                mapper_smarts_extend(configs.smarts_extender_config(max_depth, max_depth, True), A)
-                # for i, x in enumerate(A):
-                #     print(i, x.select)
-        else:
-            A = [icd.structure_decode(union_ctx.result[i]) for i in indices]
-    
+        G = union_ctx.A[0]
+        sel = union_ctx.A[1]
+        extend = max_depth is not None and max_depth > 0
+        if extend:
+            extend_config = configs.smarts_extender_config(
+                max_depth, max_depth, True
+            )
+        A = []
+        for i, group in itertools.groupby(indices, key=lambda j: sel[j][0]):
+            g = icd.graph_decode(G[i])
+            sels = [sel[j][1] for j in group]
+            if extend:
+                A.extend(
+                    graphs.graph_to_structures_extend(g, sels, topo, extend_config)
+                )
+            else:
+                A.extend(graphs.graph_to_structures(g, sels, topo))
 
-    
     Q = union_list(
         A, config, max_depth, reference, sort=True, executor=None, verbose=False
     )
@@ -1902,6 +2127,29 @@ def union_list_dispatch(
     return icd.structure_encode(Q)
 
 
+def union_list_reduce(
+    partials: List[arrays.intvec],
+) -> arrays.intvec:
+    """
+    Union the given partial unions, encoded as intvecs, and return the
+    result encoded as an intvec.
+    """
+    icd: codecs.intvec_codec = union_ctx.icd
+    A = [icd.structure_decode(x) for x in partials]
+
+    Q = union_list(
+        A,
+        union_ctx.config,
+        union_ctx.max_depth,
+        union_ctx.reference,
+        sort=True,
+        executor=None,
+        verbose=False
+    )
+
+    return icd.structure_encode(Q)
+
+
 def intersection_list_parallel(
     A: Sequence[graphs.structure],
     config: configs.mapper_config = None,
@@ -1957,24 +2205,35 @@ def union_list_parallel(
     executor=None,
     icd = None,
 ) -> graphs.structure:
-    procs = configs.processors
-
+    """
+    Calculate the union of the selections of a dataset in parallel. The
+    selections are first unioned in chunks, and the partial unions are then
+    reduced in rounds until one remains. A single pool is used for all rounds
+    and the partial unions are passed to the workers encoded as intvecs.
 
-    if len(selections) == 1:
-        # return graphs.structure_copy(A[0])
-        i = selections[0][0][0]
-        sel = selections[0][1]
-        g = graphs.graph_to_structure(G[i], sel, topo)
-        return g
+    Parameters
+    ----------
+    G : Dict[int, intvec]
+        The encoded graphs of the dataset
+    selections : List[Tuple[int, Tuple[int]]]
+        The graph index and selected nodes of each selection
+    topo : structure_topology
+        The topology of the selections
+    config : configs.mapper_config
+        The configuration for mapping new nodes
+    max_depth : int
+        The depth to extend the selections to
+    reference : structure
+        The structure to align the selections to
+    icd : codecs.intvec_codec
+        The codec of the encoded graphs
 
-    # icd = None
+    Returns
+    -------
+    structure
+        The union of the selections
+    """
 
-    # if icd:
-    #     print(f"{datetime.datetime.now()} Writing structures to disk...")
-    #     adb = db.db_dict(icd, "A.db")
-    #     adb.write_structure({i:a for i, a in enumerate(A)})
-    #     union_ctx.A = adb
-    # else:
     union_ctx.A = G, selections
     union_ctx.icd = icd
 
@@ -1982,7 +2241,6 @@ def union_list_parallel(
         reference = graphs.graph_to_structure(icd.graph_decode(G[selections[0][0]]), selections[0][1], topo)
         # union_ctx.reference = graphs.graph_to_structure(icd.graph_decode(G[selections[0]]))
     union_ctx.reference = reference
-    union_ctx.result = None
     union_ctx.topology = topo
     union_ctx.config = config
     union_ctx.max_depth = max_depth
@@ -1991,41 +2249,43 @@ def union_list_parallel(
     procs = min(os.cpu_count(), len(indices))
     procs = min(procs, configs.processors)
 
-    work = []
-
     print(timestamp(), f"Union merging={len(indices)}")
-    while len(indices) > 1:
-        # print(timestamp(), f"Initializing pool")
+    if len(indices) == 1:
+        work = [union_list_dispatch(indices)]
+    else:
+        # the pool is made once, after the data is set, so that the workers
+        # inherit the selections; the partial unions are sent to them
         with multiprocessing.pool.Pool(processes=procs) as pool:
-            # print(timestamp(), f"Generating batches")
             chunk_n = max(2, len(indices) // procs)
             chunk_n = min(chunk_n, 10000)
-
-            chunked = arrays.batched(indices, chunk_n)
-            # print(timestamp(), f"Submitting")
             work = [
                 pool.apply_async(union_list_dispatch, (chunk,))
-                for chunk in chunked
+                for chunk in arrays.batched(indices, chunk_n)
             ]
-            # print(timestamp(), f"Collecting")
             work = [unit.get() for unit in work]
+            print(timestamp(), f"Union merging={len(work)}")
 
-        union_ctx.result = work
+            if len(work) // procs < 2:
+                procs = max(1, procs // 2)
+
+            while len(work) > 1:
+                chunk_n = max(2, len(work) // procs)
+                chunk_n = min(chunk_n, 10000)
+                work = [
+                    pool.apply_async(union_list_reduce, (chunk,))
+                    for chunk in arrays.batched(work, chunk_n)
+                ]
+                work = [unit.get() for unit in work]
+                print(timestamp(), f"Union merging={len(work)}")
+
+                if len(work) // procs < 2:
+                    procs = max(1, procs // 2)
 
-        # print(timestamp(), f"Done")
-        indices = list(range(len(work)))
-        print(timestamp(), f"Union merging={len(indices)}")
-        if len(indices) // procs < 2:
-            procs = max(1, procs // 2)
-    # print()
     ans = work[0]
     union_ctx.A = None
     union_ctx.reference = None
     union_ctx.config = None
     union_ctx.max_depth = None
-    union_ctx.result = None
-    # if icd:
-    #     adb.remove()
     return icd.structure_decode(ans)
 
 
@@ -0,0 +1,456 @@
+"""
+besmarts.core.packed
+
+A compact, read-only graph representation for large datasets. Instead of a
+dictionary of bechem objects per node and edge, each primitive is stored as a
+contiguous column of integers and the connectivity is stored in compressed
+sparse row (CSR) form. The bechem objects are only created when a node or
+edge is accessed, which allows existing code that reads graphs to use packed
+graphs directly.
+"""
+
+import array
+import sys
+from typing import Dict, Sequence, Mapping, Iterator
+
+from besmarts.core import arrays
+from besmarts.core import chem
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core.primitives import primitive_key
+
+
+class packed_graph:
+    """
+    An immutable graph that stores primitives in columns. Node and edge
+    positions are given by their order in node_ids and edge_ids. The
+    neighbors of the node at position i are indices[indptr[i]:indptr[i+1]],
+    and the corresponding edge positions are in edge_of.
+    """
+
+    __slots__ = (
+        "atom_primitives",
+        "bond_primitives",
+        "node_ids",
+        "atoms",
+        "edge_ids",
+        "bonds",
+        "indptr",
+        "indices",
+        "edge_of",
+        "select",
+        "topology",
+        "position",
+        "nodes",
+        "edges",
+        "cache",
+        "shape",
+    )
+
+    def __init__(
+        self,
+        atom_primitives: Sequence[primitive_key],
+        bond_primitives: Sequence[primitive_key],
+        node_ids: array.array,
+        atoms: Dict[primitive_key, array.array],
+        edge_ids: array.array,
+        bonds: Dict[primitive_key, array.array],
+        select: Sequence[int] = None,
+        topo: topology.structure_topology = None,
+    ):
+        self.atom_primitives = tuple(atom_primitives)
+        self.bond_primitives = tuple(bond_primitives)
+
+        self.node_ids: array.array = node_ids
+        self.atoms: Dict[primitive_key, array.array] = atoms
+
+        # flattened pairs of node ids
+        self.edge_ids: array.array = edge_ids
+        self.bonds: Dict[primitive_key, array.array] = bonds
+
+        self.select = select
+        self.topology = topo
+
+        self.position: Dict[int, int] = {n: i for i, n in enumerate(node_ids)}
+        self.indptr, self.indices, self.edge_of = packed_graph_build_csr(
+            self.position, edge_ids
+        )
+
+        self.nodes = packed_nodes(self)
+        self.edges = packed_edges(self)
+        self.cache = {}
+        self.shape = {}
+
+
+class packed_nodes(Mapping):
+    """
+    A read-only mapping of node id to bechem over a packed graph. The bechem
+    objects are created on each access, so modifying them does not modify
+    the graph.
+    """
+
+    __slots__ = ("g", "serial")
+
+    def __init__(self, g: packed_graph):
+        self.g = g
+        # read-only, so the ids never change, see graphs.graph_dict
+        self.serial = next(graphs.graph_dict_serials)
+
+    def __getitem__(self, n) -> chem.bechem:
+        return packed_graph_node(self.g, n)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.g.node_ids)
+
+    def __len__(self) -> int:
+        return len(self.g.node_ids)
+
+    def __contains__(self, n) -> bool:
+        return n in self.g.position
+
+
+class packed_edges(Mapping):
+    """
+    A read-only mapping of edge id to bechem over a packed graph. The bechem
+    objects are created on each access, so modifying them does not modify
+    the graph.
+    """
+
+    __slots__ = ("g", "position", "serial")
+
+    def __init__(self, g: packed_graph):
+        self.g = g
+        self.serial = next(graphs.graph_dict_serials)
+        e = g.edge_ids
+        self.position = {
+            graphs.edge((e[i], e[i + 1])): i // 2 for i in range(0, len(e), 2)
+        }
+
+    def __getitem__(self, e) -> chem.bechem:
+        return packed_graph_edge_at(self.g, self.position[graphs.edge(e)])
+
+    def __iter__(self) -> Iterator[graphs.edge_id]:
+        return iter(self.position)
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+    def __contains__(self, e) -> bool:
+        return graphs.edge(e) in self.position
+
+
+def packed_graph_build_csr(position, edge_ids):
+    """
+    Build the CSR adjacency of a graph from a flattened list of edges.
+
+    Parameters
+    ----------
+    position : Dict[int, int]
+        The position of each node id
+    edge_ids : array.array
+        The flattened pairs of node ids of each edge
+
+    Returns
+    -------
+    Tuple[array.array, array.array, array.array]
+        The row pointers, the neighbor positions, and the edge positions
+    """
+
+    n = len(position)
+    degree = [0] * (n + 1)
+    for x in edge_ids:
+        degree[position[x] + 1] += 1
+
+    indptr = array.array("l", degree)
+    for i in range(n):
+        indptr[i + 1] += indptr[i]
+
+    fill = list(indptr[:-1])
+    indices = array.array("l", [0] * len(edge_ids))
+    edge_of = array.array("l", [0] * len(edge_ids))
+    for k in range(0, len(edge_ids), 2):
+        a = position[edge_ids[k]]
+        b = position[edge_ids[k + 1]]
+        indices[fill[a]] = b
+        edge_of[fill[a]] = k // 2
+        fill[a] += 1
+        indices[fill[b]] = a
+        edge_of[fill[b]] = k // 2
+        fill[b] += 1
+
+    return indptr, indices, edge_of
+
+
+def packed_graph_from_graph(
+    g: graphs.graph,
+    atom_primitives: Sequence[primitive_key] = None,
+    bond_primitives: Sequence[primitive_key] = None,
+) -> packed_graph:
+    """
+    Pack a graph, subgraph, or structure.
+
+    Parameters
+    ----------
+    g : graphs.graph
+        The graph to pack
+    atom_primitives : Sequence[primitive_key]
+        The atom primitives to store. Defaults to those of the first node.
+    bond_primitives : Sequence[primitive_key]
+        The bond primitives to store. Defaults to those of the first edge.
+
+    Returns
+    -------
+    packed_graph
+        The packed graph
+    """
+
+    if atom_primitives is None:
+        atom_primitives = next(iter(g.nodes.values())).select if g.nodes else ()
+    if bond_primitives is None:
+        bond_primitives = next(iter(g.edges.values())).select if g.edges else ()
+
+    node_ids = array.array("q", g.nodes)
+    atoms = {
+        name: array.array("q", (x.primitives[name].v for x in g.nodes.values()))
+        for name in atom_primitives
+    }
+
+    edge_ids = array.array("q", (i for e in g.edges for i in e))
+    bonds = {
+        name: array.array("q", (x.primitives[name].v for x in g.edges.values()))
+        for name in bond_primitives
+    }
+
+    return packed_graph(
+        atom_primitives,
+        bond_primitives,
+        node_ids,
+        atoms,
+        edge_ids,
+        bonds,
+        tuple(g.select) if hasattr(g, "select") else None,
+        getattr(g, "topology", None),
+    )
+
+
+def packed_graph_from_intvec(
+    intvec: arrays.intvec,
+    atom_primitives: Sequence[primitive_key],
+    bond_primitives: Sequence[primitive_key],
+    copy=True,
+) -> packed_graph:
+    """
+    Pack a graph directly from its intvec encoding without creating any
+    bechem objects. If copy is False, the primitive columns are strided views
+    into the intvec buffer and no primitive values are copied; the intvec
+    must not be resized while the packed graph is in use.
+
+    Parameters
+    ----------
+    intvec : arrays.intvec
+        The encoded graph, subgraph, or structure
+    atom_primitives : Sequence[primitive_key]
+        The atom primitives of the encoding
+    bond_primitives : Sequence[primitive_key]
+        The bond primitives of the encoding
+    copy : bool
+        Whether to copy the primitives out of the intvec buffer
+
+    Returns
+    -------
+    packed_graph
+        The packed graph
+    """
+
+    vec = intvec.v
+    n_nodes, n_nprim, n_edges, n_eprim, graph_t = vec[:5]
+    if not copy:
+        vec = memoryview(vec)
+
+    stride = n_nprim + 1
+    end = 5 + n_nodes * stride
+    ids = vec[5:end:stride]
+    select = tuple(-i for i in ids if i < 0)
+    node_ids = array.array("q", (abs(i) for i in ids))
+    atoms = {
+        name: vec[6 + k:end:stride] for k, name in enumerate(atom_primitives)
+    }
+
+    stride = n_eprim + 2
+    start = end
+    end = start + n_edges * stride
+    edge_ids = array.array("q")
+    for k in range(start, end, stride):
+        edge_ids.extend(graphs.edge((vec[k], vec[k + 1])))
+    bonds = {
+        name: vec[start + 2 + k:end:stride]
+        for k, name in enumerate(bond_primitives)
+    }
+
+    topo = None
+    if graph_t > 0:
+        topo = topology.topology_index[graph_t]
+
+    return packed_graph(
+        atom_primitives,
+        bond_primitives,
+        node_ids,
+        atoms,
+        edge_ids,
+        bonds,
+        select if graph_t != 0 else None,
+        topo,
+    )
+
+
+def packed_graph_node(g: packed_graph, n) -> chem.bechem:
+    """
+    Return a new bechem of a node in a packed graph.
+    """
+
+    i = g.position[n]
+    return chem.bechem(
+        {name: arrays.bitvec(g.atoms[name][i]) for name in g.atom_primitives},
+        g.atom_primitives,
+    )
+
+
+def packed_graph_edge_at(g: packed_graph, i: int) -> chem.bechem:
+    """
+    Return a new bechem of the edge at position i in a packed graph.
+    """
+
+    return chem.bechem(
+        {name: arrays.bitvec(g.bonds[name][i]) for name in g.bond_primitives},
+        g.bond_primitives,
+    )
+
+
+def packed_graph_neighbors(g: packed_graph, n) -> Sequence[int]:
+    """
+    Return the node ids adjacent to node n.
+    """
+
+    i = g.position[n]
+    ids = g.node_ids
+    return [ids[j] for j in g.indices[g.indptr[i]:g.indptr[i + 1]]]
+
+
+def packed_graph_connections(g: packed_graph) -> Dict[int, Sequence[int]]:
+    """
+    Return the adjacency of each node, in the same form as
+    graphs.graph_connections.
+    """
+
+    return {n: packed_graph_neighbors(g, n) for n in g.node_ids}
+
+
+def packed_graph_to_graph(g: packed_graph) -> graphs.graph:
+    """
+    Unpack a packed graph into a new graph, subgraph, or structure, depending
+    on whether the packed graph has a selection and a topology.
+
+    Parameters
+    ----------
+    g : packed_graph
+        The packed graph
+
+    Returns
+    -------
+    graphs.graph
+        The unpacked graph
+    """
+
+    nodes = {n: packed_graph_node(g, n) for n in g.node_ids}
+    e = g.edge_ids
+    edges = {
+        (e[2 * i], e[2 * i + 1]): packed_graph_edge_at(g, i)
+        for i in range(len(e) // 2)
+    }
+
+    if g.topology is not None:
+        return graphs.structure(nodes, edges, g.select, g.topology)
+    elif g.select is not None:
+        return graphs.subgraph(nodes, edges, g.select)
+    else:
+        return graphs.graph(nodes, edges)
+
+
+def packed_graph_to_intvec(g: packed_graph) -> arrays.intvec:
+    """
+    Encode a packed graph using the same layout as graphs.graph_to_intvec,
+    graphs.subgraph_to_intvec, and graphs.structure_to_intvec.
+    """
+
+    graph_t = 0
+    if g.topology is not None:
+        graph_t = topology.index_of(g.topology)
+    elif g.select is not None:
+        graph_t = -1
+
+    intvec = arrays.intvec()
+    vec = intvec.v
+    vec.fromlist([
+        len(g.node_ids),
+        len(g.atom_primitives),
+        len(g.edge_ids) // 2,
+        len(g.bond_primitives),
+        graph_t
+    ])
+
+    order = list(range(len(g.node_ids)))
+    select = set()
+    if g.select is not None:
+        select = set(g.select)
+        order = [g.position[n] for n in g.select] + [
+            i for i, n in enumerate(g.node_ids) if n not in select
+        ]
+
+    for i in order:
+        n = g.node_ids[i]
+        vec.append(-n if n in select else n)
+        vec.fromlist([g.atoms[name][i] for name in g.atom_primitives])
+
+    e = g.edge_ids
+    for i in range(len(e) // 2):
+        vec.append(e[2 * i])
+        vec.append(e[2 * i + 1])
+        vec.fromlist([g.bonds[name][i] for name in g.bond_primitives])
+
+    return intvec
+
+
+def packed_graph_memory(g: packed_graph) -> int:
+    """
+    Return the approximate number of bytes used by a packed graph, not
+    including the shared primitive names and topology.
+    """
+
+    size = sys.getsizeof(g)
+    for x in (g.node_ids, g.edge_ids, g.indptr, g.indices, g.edge_of):
+        size += sys.getsizeof(x)
+    for col in (g.atoms, g.bonds):
+        size += sys.getsizeof(col)
+        size += sum(sys.getsizeof(x) for x in col.values())
+    size += sys.getsizeof(g.position)
+    size += sys.getsizeof(g.edges.position)
+    return size
+
+
+def graph_memory(g: graphs.graph) -> int:
+    """
+    Return the approximate number of bytes used by a graph, not including
+    the shared primitive names and topology.
+    """
+
+    size = sys.getsizeof(g) + sys.getsizeof(g.cache)
+    for objs in (g.nodes, g.edges):
+        size += sys.getsizeof(objs)
+        for k, bc in objs.items():
+            size += sys.getsizeof(k) + sys.getsizeof(bc)
+            size += sys.getsizeof(bc.primitives) + sys.getsizeof(bc.select)
+            for x in bc.primitives.values():
+                size += sys.getsizeof(x) + sys.getsizeof(x.v)
+    if hasattr(g, "select"):
+        size += sys.getsizeof(g.select)
+    return size
@@ -6,6 +6,8 @@ bit iteration, and analytical splits based on a predefined partitioning.
 """
 
 import array
+import atexit
+import collections
 import pprint
 import time
 import itertools
@@ -90,9 +92,10 @@ def process_split_matches_distributed(Sj, indices, shm=None):
     icd = shm.icd
     G = shm.G
     s = shm.selections
+    cache = process_split_matches_cache(G, icd)
     values = (j for j in indices if mapper.mapper_match(
-            graphs.graph_to_structure(
-                icd.graph_decode(G[s[j][0]]),
+            graphs.graph_as_structure(
+                cache.graph_decode(s[j][0]),
                 s[j][1],
                 Sj.topology),
             Sj
@@ -788,7 +791,7 @@ def split_shm_load(shm):
 
 def process_split_general_distributed(pack, shm=None):
 
-    S0 = shm.S0
+    pack = split_pack_load(pack, shm)
 
     _, T1 = process_split_distributed(pack, shm=shm)
 
@@ -800,6 +803,8 @@ def process_split_general_distributed(pack, shm=None):
 
 def process_split_specific_distributed(pack, shm=None):
 
+    pack = split_pack_load(pack, shm)
+
     shard, T1 = process_split_distributed(pack, shm=shm)
 
     specific = process_split_intersect_distributed(
@@ -1035,25 +1040,146 @@ def process_split_difference_distributed(pack, T, S0, splitter, A, selections, i
     return (Tsj, shard, h, matches, makes_split)
 
 
+class process_split_matches_ctx:
+    cache = None
+    cache_size = 1024
+
+    # lazy graphs build new bechem objects on every node and edge access
+    lazy = False
+
+    # the first selection of each distinct environment
+    selections = None
+    groups = {}
+
+    stats = collections.Counter()
+
+
+def process_split_matches_cache(A, icd: codecs.intvec_codec):
+    """
+    Return the decoded graph cache of this process for the dataset A, making
+    a new cache if the dataset changed.
+    """
+
+    cache = process_split_matches_ctx.cache
+    if cache is None or cache.A is not A or cache.icd is not icd:
+        # the old graphs keep the old dataset alive
+        process_split_matches_cache_clear()
+        cache = codecs.intvec_codec_decode_cache(
+            icd,
+            A,
+            maxsize=process_split_matches_ctx.cache_size,
+            lazy=process_split_matches_ctx.lazy
+        )
+        process_split_matches_ctx.cache = cache
+    return cache
+
+
+def process_split_matches_cache_clear():
+    """
+    Release the decoded graph cache and the environment groups of this
+    process so the dataset they were made from can be freed, resized, or
+    closed.
+    """
+
+    ctx = process_split_matches_ctx
+    if ctx.cache is not None:
+        codecs.intvec_codec_decode_cache_clear(ctx.cache)
+    ctx.cache = None
+    ctx.selections = None
+    ctx.groups = {}
+
+
+def process_split_matches_groups(
+    cache, selections, topology: structure_topology, depth: int
+) -> List[int]:
+    """
+    Return the first selection of each distinct environment in the data,
+    where the environment of a selection is its structure extended to the
+    given depth. Selections with the same environment match any pattern of
+    that depth the same way, so only one of each needs to be matched.
+    Environments are bucketed by hash and a selection is only grouped with a
+    representative that it is equal to, so a hash collision costs an extra
+    match rather than a wrong answer.
+    """
+
+    ctx = process_split_matches_ctx
+    if ctx.selections is not selections:
+        ctx.selections = selections
+        ctx.groups = {}
+
+    key = (topology.primary, depth)
+    reps = ctx.groups.get(key)
+    if reps is None:
+        config = configs.smarts_extender_config(depth, depth, True)
+        seen = {}
+        reps = []
+        groups = itertools.groupby(
+            enumerate(selections), key=lambda x: x[1][0]
+        )
+        for idx, group in groups:
+            group = list(group)
+            structs = graphs.graph_to_structures_extend(
+                cache.graph_decode(idx),
+                [sel for _, (_, sel) in group],
+                topology,
+                config
+            )
+            for (i, _), ai in zip(group, structs):
+                bucket = seen.setdefault(hash(ai), [])
+                if not any(mapper.mapper_equal(ai, bj) for bj in bucket):
+                    bucket.append(ai)
+                    reps.append(i)
+        ctx.groups[key] = reps
+    return reps
+
+
+def process_split_matches_stats():
+    """
+    Return the number of calls, matches performed, matches avoided, and
+    splits found by process_split_matches in this process.
+    """
+    return dict(process_split_matches_ctx.stats)
+
+
 def process_split_matches(Sj, A, selections, icd: codecs.intvec_codec, return_matches=True):
+    """
+    Determine whether a pattern splits the data by matching selections in
+    order until both a match and a non-match are found. Only the first
+    selection of each distinct environment is matched, which gives the same
+    answer as matching every selection.
+
+    Returns
+    -------
+    Tuple[List, bool]
+        The result of the first selection, the index of the first selection
+        with a different result (or the number of selections if none), and
+        the number of selections matched; and whether the pattern splits the
+        data
+    """
+
+    stats = process_split_matches_ctx.stats
 
     yes = 0
     no = 0
-    # matches: List[bool] = list([None] * len(A))
-    matches = [None, len(A)]
+    matches = [None, len(selections), 0]
     makes_split = False
 
-    for i, (idx, sel) in enumerate(selections):
-        ai = graphs.graph_as_structure(icd.graph_decode(A[idx]), sel, Sj.topology)
+    cache = process_split_matches_cache(A, icd)
+    reps = process_split_matches_groups(
+        cache, selections, Sj.topology, graphs.structure_max_depth(Sj)
+    )
 
+    for i in reps:
+        idx, sel = selections[i]
+        ai = graphs.graph_as_structure(cache.graph_decode(idx), sel, Sj.topology)
+
+        matches[2] += 1
         if mapper.mapper_match(ai, Sj):
             yes = 1
-            # matches[i] = True
             if matches[0] is None:
                 matches[0] = True
         else:
             no = 1
-            # matches[i] = False
             if matches[0] is None:
                 matches[0] = False
         if yes and no:
@@ -1061,6 +1187,13 @@ def process_split_matches(Sj, A, selections, icd: codecs.intvec_codec, return_ma
             matches[1] = i
             break
 
+    stats["calls"] += 1
+    stats["probes"] += matches[2]
+    if makes_split:
+        stats["splits"] += 1
+    else:
+        stats["skipped"] += len(selections) - matches[2]
+
     return matches, makes_split
 
 
@@ -1110,6 +1243,159 @@ def process_split_intersect_distributed(pack, T, S0, splitter, A, selections, ic
     return (Tsj, shard, h, matches, makes_split)
 
 
+def split_bit_slot(bit: structure):
+    """
+    Return the position and primitive of the only bits set in a single bit
+    split, or None if the bits are in more than one primitive.
+    """
+
+    slot = None
+    for idx, bc in itertools.chain(bit.nodes.items(), bit.edges.items()):
+        for name in bc.select:
+            if bc.primitives[name].v == 0:
+                continue
+            if slot is not None:
+                return None
+            slot = (idx, name)
+    return slot
+
+
+def split_bits_screen(S0: structure, single_bits, selections, ws):
+    """
+    Find the selections matched by the specific split of each single bit.
+
+    A selection that matches the specific split of a combination of bits
+    must match the split of at least one of its bits in each position and
+    primitive, so these are used to bound the matches of any combination
+    without matching graphs.
+
+    Parameters
+    ----------
+    S0 : structure
+        The structure being split
+    single_bits : List[Tuple[structure, Dict[node_id, node_id]]]
+        The single bit splits and their maps to S0
+    selections : List[Tuple[int, Sequence[int]]]
+        The data to match
+    ws : compute.workspace_local
+        The workspace to run the matches in
+
+    Returns
+    -------
+    Dict[int, Tuple[Tuple[node_id, str], int]]
+        The position, primitive, and matches of each single bit keyed by the
+        index of the bit. Matches are a bitset over the selections.
+    """
+
+    chunksize = 1000
+    screen = {}
+    tasks = {}
+    for i, (bit, M) in enumerate(single_bits):
+        slot = split_bit_slot(bit)
+        if slot is None:
+            continue
+
+        T = mapper.map_to(bit, S0, add_nodes=1, fill=True, skip=M or None)
+        mj = {v: k for k, v in T.map.items() if v is not None}
+        Sj = mapper.intersection_conditional(T.H, T.G, map=mj)
+        Sj = graphs.structure_remove_full_leaves(Sj)
+
+        screen[i] = [slot, 0]
+        code = arrays.find_unsigned_typecode_min(len(selections))
+        for j, chunk in enumerate(
+            arrays.batched(range(len(selections)), chunksize)
+        ):
+            tasks[(i, j)] = (
+                process_split_matches_distributed,
+                (Sj, array.array(code, chunk)),
+                {},
+            )
+
+    completed = set()
+    while len(completed) < len(tasks):
+        unfinished = {k: v for k, v in tasks.items() if k not in completed}
+        compute.workspace_local_submit(ws, unfinished)
+        results = compute.workspace_flush(ws, set(unfinished), timeout=1.0)
+        for (i, j), matches in results.items():
+            if (i, j) in completed:
+                continue
+            completed.add((i, j))
+            entry = screen[i]
+            for k in matches:
+                entry[1] |= 1 << k
+
+    return {k: tuple(v) for k, v in screen.items()}
+
+
+def split_bits_screen_enabled(n_bits, n_selections, min_bits, uptobits) -> bool:
+    """
+    Return whether screening the single bits is expected to pay for itself.
+    The screen costs one match per bit and selection, while each combination
+    it prunes saves a mapping and the matches of the combination. Only
+    combinations of two or more bits can be pruned without a match, and
+    typically only a small fraction of them are, so the screen is run when
+    there are configs.split_bit_screen_min_ratio of these combinations for
+    each match of the screen.
+    """
+
+    if not configs.split_bit_screen:
+        return False
+
+    n_multi = sum(
+        math.comb(n_bits, i) for i in range(max(2, min_bits), uptobits)
+    )
+    cost = n_bits * n_selections
+    return n_multi > 0 and n_multi >= configs.split_bit_screen_min_ratio * cost
+
+
+def split_bit_combinations(n_bits, min_bits, uptobits, n_ops):
+    """
+    Generate the index, bit depth, and bit indices of every combination of
+    single bits that is searched. Each combination is given n_ops indices,
+    one for each of the general and specific splits.
+    """
+
+    idx = 0
+    for i in range(min_bits, uptobits):
+        for unit in itertools.combinations(range(n_bits), i):
+            for _ in range(n_ops):
+                yield idx, i, unit
+                idx += 1
+
+
+def split_pack_load(pack, shm):
+    """
+    Return the single bits of a combination given by the indices of the bits
+    in the shared single_bits of the workspace.
+    """
+
+    if pack and type(pack[0]) is int:
+        pack = tuple(shm.single_bits[i] for i in pack)
+    return pack
+
+
+def split_bits_bound(screen, unit, full: int) -> int:
+    """
+    Return a bitset of the selections that could match the specific split of
+    a combination of bits, given as indices into the single bits. Bits in the same position and primitive are
+    alternatives, so their matches are combined with OR, and the positions
+    must all match, so they are combined with AND.
+    """
+
+    slots = {}
+    for bit in unit:
+        entry = screen.get(bit)
+        if entry is None:
+            return full
+        slot, matches = entry
+        slots[slot] = slots.get(slot, 0) | matches
+
+    bound = full
+    for matches in slots.values():
+        bound &= matches
+    return bound
+
+
 def split_subgraphs(
     topology: structure_topology,
     splitter: smarts_splitter_config,
@@ -1363,6 +1649,47 @@ def split_subgraphs(
 
     return S, shards, matched
 
+class split_segment_ctx:
+    # the dataset and the shared segment its graphs are copied to
+    G = None
+    segment = None
+
+
+def split_segment_get(G) -> compute.shm_segment:
+    """
+    Return the shared segment of a dataset of intvecs, copying the dataset
+    into a new segment only if it is not the dataset of the current one. A
+    dataset must not be changed while its segment is in use.
+    """
+
+    ctx = split_segment_ctx
+    if ctx.segment is not None and ctx.G is G and len(G) == len(ctx.segment.index):
+        return ctx.segment
+
+    split_segment_close()
+    ctx.segment = compute.shm_segment_new(G)
+    ctx.G = G
+    return ctx.segment
+
+
+def split_segment_close():
+    """
+    Release the shared segment of the current dataset and remove its shared
+    memory.
+    """
+
+    ctx = split_segment_ctx
+    segment = ctx.segment
+    ctx.G = None
+    ctx.segment = None
+    if segment is not None:
+        process_split_matches_cache_clear()
+        compute.shm_segment_close(segment, unlink=True)
+
+
+atexit.register(split_segment_close)
+
+
 def split_subgraphs_distributed(
     topology: structure_topology,
     splitter: smarts_splitter_config,
@@ -1442,208 +1769,191 @@ def split_subgraphs_distributed(
     # this should be encoded and whatnot before start
     # shm = shm_split_subgraphs(splitter, S0, A)
 
-    shm = {"splitter": splitter, "S0": S0, "G": G, "selections": selections, "icd": icd}
+    # the workers rebuild each combination from these, so the tasks only
+    # need to carry the indices of the bits. The graphs are shared in one
+    # segment so the workers read them in place, and the segment is reused
+    # by each split of the same dataset
+    segment = split_segment_get(G)
+    shm = {
+        "splitter": splitter,
+        "S0": S0,
+        "G": segment,
+        "selections": selections,
+        "icd": icd,
+        "single_bits": single_bits,
+    }
 
     # we need 1 for this main process, and the other for the workspace server
     nproc = configs.processors - 1
 
-
-    offsets = {}
-    iterable = {}
-    idx_offset = 0
     n_ops = int(splitter.split_specific) + int(splitter.split_general)
-    print(f"{datetime.datetime.now()} Building tasks")
-    for i in range(min_bits, uptobits):
-        iterable.update(
-            {
-                n_ops * idx: unit
-                for idx, unit in enumerate(
-                    itertools.combinations(single_bits, i),
-                    idx_offset,
-                )
-            }
-        )
-        if n_ops == 2:
-            iterable.update({idx + 1: unit for idx, unit in iterable.items()})
-        idx_offset += len(iterable)
-        offsets[i] = idx_offset
+    n_bits = len(single_bits)
+    Bn = sum(n_ops * math.comb(n_bits, i) for i in range(min_bits, uptobits))
+
+    screen = None
+    full = (1 << len(selections)) - 1
+    if splitter.split_specific and split_bits_screen_enabled(
+        n_bits, len(selections), min_bits, uptobits
+    ):
+        print(f"{datetime.datetime.now()} Screening bit combinations")
+        ws = compute.workqueue_new_workspace(wq, nproc=nproc, shm=shm)
+        screen = split_bits_screen(S0, single_bits, selections, ws)
+        compute.workqueue_remove_workspace(wq, ws)
+        ws.close()
+        ws = None
 
     addr = ("", 0)
-    if len(iterable) <= nproc:
+    if Bn <= nproc:
         addr = ('127.0.0.1', 0)
-        nproc = len(iterable)
+        nproc = Bn
 
     ws = compute.workqueue_new_workspace(wq, address=addr, nproc=nproc, shm=shm)
 
-    Bn = 0
-    completed = set()
-    all_completed = 0
+    n_completed = 0
+    pruned = 0
+    probes = 0
     results = {}
     updates = set()
     visited = set()
     sma_visited = set()
-    k = 0
-    n = 0
-    while len(completed) < len(iterable):
-        Bn = n_ops * (
-            math.factorial(len(single_bits))
-            // (math.factorial(len(single_bits) - i) * math.factorial(i))
-        )
 
+    print(f"{datetime.datetime.now()} Streaming {Bn} tasks")
+    combinations = split_bit_combinations(n_bits, min_bits, uptobits, n_ops)
+    for batch in arrays.batched(combinations, 100000):
+        tasks = {}
+        depths = {}
+        for idx, depth, unit in batch:
+            specific = (idx % n_ops) or not splitter.split_general
+            if specific:
+                # a specific split that no selection can match never splits
+                if screen and not split_bits_bound(screen, unit, full):
+                    pruned += 1
+                    n_completed += 1
+                    continue
+                fn = process_split_specific_distributed
+            else:
+                fn = process_split_general_distributed
+            tasks[idx] = (fn, (unit,), {})
+            depths[idx] = depth
 
-        unfinished = {
-            idx: unit
-            for idx, unit in iterable.items()
-            if idx not in completed
-        }
-            # we are making general and specific splits, so double the number
-        for batch in arrays.batched(unfinished.items(), 100000):
-            for chunk in arrays.batched(batch, 100):
-                tasks = {}
-                for idx, unit in chunk:
-                    if idx % n_ops:
-                        if splitter.split_specific:
-                            tasks[idx] = (
-                                process_split_specific_distributed,
-                                (unit,),
-                                {},
-                            )
-                        elif splitter.split_general:
-                            tasks[idx] = (
-                                process_split_general_distributed,
-                                (unit,),
-                                {},
-                            )
-                    else:
-                        if splitter.split_general:
-                            tasks[idx] = (
-                                process_split_general_distributed,
-                                (unit,),
-                                {},
-                            )
-                        elif splitter.split_specific:
-                            tasks[idx] = (
-                                process_split_specific_distributed,
-                                (unit,),
-                                {},
-                            )
+        results.clear()
+        while len(results) < len(tasks):
+            unfinished = [x for x in tasks.items() if x[0] not in results]
+            for chunk in arrays.batched(unfinished, 100):
+                compute.workspace_local_submit(ws, dict(chunk))
+            results.update(
+                compute.workspace_flush(
+                    ws, set(x[0] for x in unfinished), timeout=1.0
+                )
+            )
 
-                compute.workspace_local_submit(ws, tasks)
+        for idx, splits in sorted(results.items(), key=lambda x: x[0]):
+            n_completed += 1
+            depth = depths[idx]
 
-        k = 0
-        for i in range(min_bits, uptobits):
-            n = offsets[i]
-            these_results = compute.workspace_flush(
-                ws, set([x[0] for x in batch if x[0] < n]), timeout=1.0
-            )
-            for idx, splits in sorted(
-                these_results.items(), key=lambda x: x[0]
-            ):
-                if idx not in completed:
-                    completed.add(idx)
-                    all_completed += 1
-
-                for j, unit in enumerate(splits):
-                    matches = None
-                    shard = None
-                    Tsj = None
-
-                    if unit is not None:
-                        Tsj, shard, hashshard, matches, makes_split = unit
-                    else:
-                        # print(f"unit IS NONE")
-                        continue
+            for j, unit in enumerate(splits):
+                matches = None
+                shard = None
+                Tsj = None
 
-                    # if jj + j == clen * ci + len(work) and j == len(splits):
-                    progress = int(len([x for x in completed if x < n]) / Bn * 10)
-                    report_number = progress
-                    if (verbose and debug) or (report_number not in updates):
-                        updates.add(report_number)
-                        print(
-                            datetime.datetime.now(),
-                            f"Searching atoms={len(shard.nodes)}"
-                            f" data={len(selections)}"
-                            f" bit_depth={i}/{uptobits-1}"
-                            f" b_j={all_completed}/{Bn}"
-                            f" hits={hits}            ",
-                            end="\n",
-                        )
+                if unit is not None:
+                    Tsj, shard, hashshard, matches, makes_split = unit
+                else:
+                    # print(f"unit IS NONE")
+                    continue
 
-                    if Tsj is None:
-                        # print(f"Tsj IS NONE")
-                        continue
+                progress = int(n_completed / Bn * 10)
+                report_number = progress
+                if (verbose and debug) or (report_number not in updates):
+                    updates.add(report_number)
+                    print(
+                        datetime.datetime.now(),
+                        f"Searching atoms={len(shard.nodes)}"
+                        f" data={len(selections)}"
+                        f" bit_depth={depth}/{uptobits-1}"
+                        f" b_j={n_completed}/{Bn}"
+                        f" hits={hits}            ",
+                        end="\n",
+                    )
 
-                    Sj = Tsj.H
-
-                    if verbose and debug:
-                        print(
-                            "S0 =>",
-                            gcd.smarts_encode(Tsj.G),
-                            "\nSj =>",
-                            gcd.smarts_encode(Sj),
-                            "\nbj =>",
-                            gcd.smarts_encode(shard),
-                            makes_split,
-                            hashshard,
-                        )
+                if Tsj is None:
+                    # print(f"Tsj IS NONE")
+                    continue
 
-                    if matches is None or len(matches) == 0:
-                        # print(f"MATCHES IS {matches}")
-                        continue
+                Sj = Tsj.H
 
-                    if hashshard in visited:
-                        # print(f"HASH DUP: {hashshard}")
-                        continue
-                    else:
-                        # print(f"HASH NEW: {hashshard}")
-                        visited.add(hashshard)
+                if verbose and debug:
+                    print(
+                        "S0 =>",
+                        gcd.smarts_encode(Tsj.G),
+                        "\nSj =>",
+                        gcd.smarts_encode(Sj),
+                        "\nbj =>",
+                        gcd.smarts_encode(shard),
+                        makes_split,
+                        hashshard,
+                    )
 
-                    sma = gcd.smarts_encode(Sj)
+                if matches is None or len(matches) == 0:
+                    # print(f"MATCHES IS {matches}")
+                    continue
 
-                    if sma in sma_visited:
-                        continue
-                    else:
-                        sma_visited.add(sma) 
-
-                    _matches = list([matches[0]] * matches[1])
-
-                    if matches[1] < len(selections):
-                        _matches.append(not matches[0])
-
-                    matches = _matches
-
-                    if len(matches) < len(selections):
-                        matches.extend([None] * (len(selections) - len(matches)))
-
-                    matches = tuple(matches)
-                    if False and verbose and debug:
-                        for ii, sma in enumerate(smarts):
-                            is_match = mapper.mapper_match(A[ii], Sj)
-                            print("     ", f"{str(is_match):6s}", sma)
-                        print()
-
-                    unique_split = matches not in matched
-                    if makes_split and ((not splitter.unique) or unique_split):
-                        hits += 1
-                        S.append(Tsj)
-                        shards.append(shard)
-                        matched.append(matches)
-                        if (
-                            splitter.max_splits > 0
-                            and hits > splitter.max_splits
-                        ):
-                            break
+                if hashshard in visited:
+                    # print(f"HASH DUP: {hashshard}")
+                    continue
+                else:
+                    # print(f"HASH NEW: {hashshard}")
+                    visited.add(hashshard)
+
+                sma = gcd.smarts_encode(Sj)
+
+                if sma in sma_visited:
+                    continue
+                else:
+                    sma_visited.add(sma) 
+
+                probes += matches[2]
+                _matches = list([matches[0]] * matches[1])
+
+                if matches[1] < len(selections):
+                    _matches.append(not matches[0])
+
+                matches = _matches
+
+                if len(matches) < len(selections):
+                    matches.extend([None] * (len(selections) - len(matches)))
+
+                matches = tuple(matches)
+                if False and verbose and debug:
+                    for ii, sma in enumerate(smarts):
+                        is_match = mapper.mapper_match(A[ii], Sj)
+                        print("     ", f"{str(is_match):6s}", sma)
+                    print()
+
+                unique_split = matches not in matched
+                if makes_split and ((not splitter.unique) or unique_split):
+                    hits += 1
+                    S.append(Tsj)
+                    shards.append(shard)
+                    matched.append(matches)
+                    if (
+                        splitter.max_splits > 0
+                        and hits > splitter.max_splits
+                    ):
+                        break
             if splitter.max_splits > 0 and hits > splitter.max_splits:
                 break
-        k = len(completed)
-        print(f"Progress: {k/n*100:5.2f}%  {k:8d}/{n}")
+        print(f"Progress: {n_completed/Bn*100:5.2f}%  {n_completed:8d}/{Bn}")
+        # stop streaming once max_splits is passed, otherwise each later
+        # batch would append and match one more split before breaking
         if splitter.max_splits > 0 and hits > splitter.max_splits:
             break
-    if n > 0:
-        print(f"Finished: {k/n*100:5.2f}%  {k:8d}/{n}")
-        if len(completed) < len(iterable) and not (splitter.max_splits > 0 and hits > splitter.max_splits):
-            breakpoint()
-            print("something wrong...")
+
+    print(
+        f"{datetime.datetime.now()} Finished {n_completed}/{Bn} tasks;"
+        f" screened out {pruned} specific splits;"
+        f" matched {probes} selections"
+    )
 
     compute.workqueue_remove_workspace(wq, ws)
     print("Closing workspace")
@@ -1776,7 +2086,7 @@ def split_subgraphs_distributed(
             for s, b, m in keep.values():
                 S.append(s)
                 shards.append(b)
-                matched.append(match)
+                matched.append(m)
             unique_hits = len(keep)
             print(
                 datetime.datetime.now(),
@@ -1791,6 +2101,8 @@ def split_subgraphs_distributed(
         end="\n",
     )
 
+    process_split_matches_cache_clear()
+
     return S, shards, matched
 
 
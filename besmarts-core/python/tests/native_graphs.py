@@ -0,0 +1,103 @@
+"""
+besmarts.tests.native_graphs
+
+The bundled graphs that the tests and benchmarks are run on, and the codecs
+to encode them with.
+"""
+
+import os
+from typing import Iterable, List
+
+from besmarts.core import graphs
+from besmarts.core import codecs
+from besmarts.core import configs
+from besmarts.core import mapper
+from besmarts.core import trees
+from besmarts.core import hierarchies
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+files = [
+    os.path.join(here, "g.bg"),
+    os.path.join(here, "..", "examples", "propane.bg"),
+]
+
+
+def native_graphs_load(fnames: Iterable[str] = None) -> List[graphs.graph]:
+    """
+    Load the graphs of one or more files, defaulting to the bundled files.
+    Subgraphs and structures are loaded as the graphs they select from.
+    """
+
+    G = []
+    for fname in fnames or files:
+        for g in codec_native.graph_codec_native_stream(fname):
+            if hasattr(g, "select"):
+                g = graphs.subgraph_to_graph(g)
+            G.append(g)
+    return G
+
+
+def native_graphs_intvec_codec(g: graphs.graph) -> codecs.intvec_codec:
+    """
+    Return an intvec codec for graphs with the same primitives as g.
+    """
+
+    return codecs.intvec_codec(
+        codec_native.primitive_codecs_get(),
+        tuple(next(iter(g.nodes.values())).primitives),
+        tuple(next(iter(g.edges.values())).primitives),
+    )
+
+
+def native_graphs_environments(
+    structs: Iterable[graphs.structure], depth: int
+) -> List[graphs.structure]:
+    """
+    Return the unique environments of the structures extended to a depth.
+    """
+
+    config = configs.smarts_extender_config(depth, depth, True)
+    envs = {}
+    for s in structs:
+        s = graphs.structure_copy(s)
+        mapper.mapper_smarts_extend(config, [s])
+        s = graphs.structure_remove_unselected(s)
+        envs.setdefault(hash(s), s)
+    return list(envs.values())
+
+
+def native_graphs_hierarchy(
+    structs: List[graphs.structure], topo
+) -> hierarchies.structure_hierarchy:
+    """
+    Build a hierarchy from the structures: a root pattern, one child per
+    unique depth 0 environment, and one grandchild per unique depth 1
+    environment under each child it matches. The hierarchy has no SMARTS.
+    """
+
+    index = trees.tree_index()
+    subgraphs = {}
+
+    root = index.node_add(None, trees.tree_node(None, "parameter", "", "p0"))
+    subgraphs[root.index] = mapper.union_list(
+        native_graphs_environments(structs, 0)
+    )
+
+    n = 1
+    for S0 in native_graphs_environments(structs, 0):
+        node = index.node_add(
+            root.index, trees.tree_node(None, "parameter", "", f"p{n}")
+        )
+        n += 1
+        subgraphs[node.index] = S0
+        for S1 in native_graphs_environments(structs, 1):
+            if not mapper.mapper_match(S1, S0):
+                continue
+            child = index.node_add(
+                node.index, trees.tree_node(None, "parameter", "", f"p{n}")
+            )
+            n += 1
+            subgraphs[child.index] = S1
+
+    return hierarchies.structure_hierarchy(index, {}, subgraphs, topo)
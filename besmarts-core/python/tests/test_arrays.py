@@ -7,6 +7,7 @@ import unittest
 
 from besmarts.core.arrays import bitvec
 from besmarts.core.arrays import intvec
+from besmarts.core import arrays
 
 class test_bitvec(unittest.TestCase):
 
@@ -69,6 +70,68 @@ class test_bitvec(unittest.TestCase):
         self.assertTrue(bitvec(2) in bitvec(3))
         self.assertTrue(bitvec(3) not in bitvec(2))
 
+class test_bitvec_batch(unittest.TestCase):
+
+    def setUp(self):
+        self.a = [bitvec(x, maxbits=70) for x in (0, 5, -1, 2**69 + 3, ~6)]
+        self.b = [bitvec(x, maxbits=70) for x in (4, -1, 2**68, ~1)]
+
+    def test_bitvec_batch_pack(self):
+        a = self.a
+        v = arrays.bitvec_batch_unpack(arrays.bitvec_batch_pack(a))
+        self.assertEqual([bitvec(x, maxbits=70) for x in v], a)
+
+    def bits(self, bv, maxbits=False):
+        # the scalar count, except that every bit of an unbounded value is
+        # counted
+        if bv.v >= 0 and bv.maxbits == arrays.INF:
+            return bin(bv.v).count("1")
+        return bv.bits(maxbits=maxbits)
+
+    def assertBatchOps(self, a, b):
+        # every pair must match the scalar operations
+        A, B = arrays.bitvec_batch_outer(
+            arrays.bitvec_batch_pack(a), arrays.bitvec_batch_pack(b)
+        )
+        pairs = [(x, y) for x in a for y in b]
+        self.assertEqual(
+            arrays.bitvec_batch_bits(A & B, maxbits=True),
+            [self.bits(x & y, maxbits=True) for x, y in pairs]
+        )
+        self.assertEqual(
+            arrays.bitvec_batch_bits(A | B),
+            [self.bits(x | y) for x, y in pairs]
+        )
+        self.assertEqual(
+            arrays.bitvec_batch_subset(A, B),
+            [arrays.bitvec_subset(x, y) for x, y in pairs]
+        )
+        self.assertEqual(
+            arrays.bitvec_batch_intersects(A, B),
+            [bool((x & y).any()) for x, y in pairs]
+        )
+
+    def test_bitvec_batch_ops(self):
+        self.assertBatchOps(self.a, self.b)
+
+    def test_bitvec_batch_unbounded(self):
+        INF = arrays.INF
+        a = [bitvec(x, maxbits=INF) for x in (0, 5, -1, 2**130 + 3, ~2**70)]
+        b = [bitvec(x, maxbits=INF) for x in (4, -1, 2**68, ~1)]
+        v = arrays.bitvec_batch_unpack(arrays.bitvec_batch_pack(a))
+        self.assertEqual(v, [x.v for x in a])
+        self.assertBatchOps(a, b)
+
+        # values wider than their maxbits keep all of their bits
+        a = [bitvec(2**80 + 1, maxbits=64), bitvec(~2**90, maxbits=64)]
+        batch = arrays.bitvec_batch_pack(a)
+        self.assertEqual(arrays.bitvec_batch_unpack(batch), [x.v for x in a])
+        self.assertBatchOps(a, self.b)
+
+        # unless the number of bits to keep is given
+        batch = arrays.bitvec_batch_pack(a, maxbits=8)
+        self.assertEqual(arrays.bitvec_batch_unpack(batch), [1, -1])
+
 class test_intvec(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,84 @@
+"""
+besmarts.tests.test_cluster_compress
+
+"""
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.core import topology
+from besmarts.core import configs
+from besmarts.core import clusters
+from besmarts.core import splits
+
+import native_graphs
+
+
+class test_clustering_compress_selections(unittest.TestCase):
+
+    def setUp(self):
+        G = native_graphs.native_graphs_load()
+        self.icd = native_graphs.native_graphs_intvec_codec(G[0])
+        self.G = {i: self.icd.graph_encode(g) for i, g in enumerate(G)}
+        self.selections = [
+            (i, s.select)
+            for i, g in enumerate(G)
+            for s in graphs.graph_to_structure_bonds(g)
+        ]
+
+    def test_clustering_compress_selections(self):
+        topo = topology.bond
+        for depth in (0, 1):
+            unique, groups = clusters.clustering_compress_selections(
+                self.G, self.selections, topo, depth, self.icd
+            )
+            self.assertEqual(len(unique), len(groups))
+            self.assertLess(len(unique), len(self.selections))
+            self.assertEqual(
+                sorted(i for x in groups for i in x),
+                list(range(len(self.selections)))
+            )
+            self.assertEqual([x[0] for x in groups], sorted(x[0] for x in groups))
+
+            config = configs.smarts_extender_config(depth, depth, True)
+            for group, sel in zip(groups, unique):
+                self.assertEqual(self.selections[group[0]], sel)
+                ref = graphs.graph_to_structure(
+                    self.icd.graph_decode(self.G[sel[0]]), sel[1], topo
+                )
+                graphs.structure_extend(config, [ref])
+                ref = graphs.structure_remove_unselected(ref)
+                for j in group[1:]:
+                    i, s = self.selections[j]
+                    g = graphs.graph_to_structure(
+                        self.icd.graph_decode(self.G[i]), s, topo
+                    )
+                    graphs.structure_extend(config, [g])
+                    g = graphs.structure_remove_unselected(g)
+                    T = mapper.map_to(ref, g, strict=True, equality=True)
+                    self.assertEqual(len(T.map), len(ref.select))
+
+    def test_clustering_expand_split_return(self):
+        groups = [[0, 2], [1], [3, 4]]
+        ret = splits.split_return_type(
+            (), (), ((0,), (1, 2)), (), self.selections[:3], topology.bond
+        )
+        ret = clusters.clustering_expand_split_return(
+            ret, self.selections[:5], groups
+        )
+        self.assertEqual(ret.matched_idx, ((0, 2), (1, 3, 4)))
+        self.assertEqual(ret.unmatch_idx, ())
+        self.assertEqual(ret.subgraphs, self.selections[:5])
+
+        ret = splits.split_return_type(
+            (), (), ((0,),), (), self.selections[:3], topology.bond
+        )
+        ret = clusters.clustering_expand_split_return(
+            ret, self.selections[:5], groups
+        )
+        self.assertEqual(ret.matched_idx, ((0, 2),))
+        self.assertEqual(ret.unmatch_idx, (1, 3, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
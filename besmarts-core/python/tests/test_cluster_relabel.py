@@ -0,0 +1,145 @@
+"""
+besmarts.tests.test_cluster_relabel
+
+"""
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.core import topology
+from besmarts.core import trees
+from besmarts.core import hierarchies
+from besmarts.core import clusters
+from besmarts.codecs import codec_native
+from besmarts.assign import hierarchy_assign_native
+
+import native_graphs
+
+
+class graph_codec_table(codec_native.graph_codec_native):
+    """
+    Decodes the SMILES and SMARTS it was given the graphs of
+    """
+
+    def __init__(self, G, atom_primitives, bond_primitives):
+        super().__init__(
+            codec_native.primitive_codecs_get(), atom_primitives, bond_primitives
+        )
+        self.G = G
+        self.S = {}
+
+    def smiles_decode(self, smiles):
+        return self.G[smiles]
+
+    def smarts_decode(self, smarts):
+        return self.S[smarts]
+
+    def smarts_add(self, S):
+        sma = self.smarts_encode(S)
+        self.S[sma] = S
+        return sma
+
+
+class test_clustering_relabel(unittest.TestCase):
+
+    def setUp(self):
+        G = native_graphs.native_graphs_load()
+        self.smiles = [f"g{i}" for i in range(len(G))]
+        self.topo = topology.bond
+        g = G[0]
+        self.gcd = graph_codec_table(
+            dict(zip(self.smiles, G)),
+            tuple(next(iter(g.nodes.values())).primitives),
+            tuple(next(iter(g.edges.values())).primitives),
+        )
+        self.labeler = hierarchy_assign_native.smarts_hierarchy_assignment_native()
+
+        # the environments to split with, from the most to the least common
+        structs = [s for g in G for s in graphs.graph_to_structure_bonds(g)]
+        envs = {}
+        for s in structs:
+            s = graphs.structure_remove_unselected(s)
+            envs.setdefault(s, []).append(s)
+        self.envs = [
+            x[0] for x in sorted(envs.values(), key=lambda x: -len(x))
+        ]
+
+        S0 = mapper.union_list(structs)
+        S0 = graphs.structure_remove_unselected(S0)
+
+        index = trees.tree_index()
+        root = index.node_add(
+            None, trees.tree_node(None, "parameter", "", "p0")
+        )
+        hidx = hierarchies.structure_hierarchy(index, {}, {}, self.topo)
+        hidx.subgraphs[root.index] = S0
+        hidx.smarts[root.index] = self.gcd.smarts_add(S0)
+        self.root = root
+
+        self.cst = self.relabel(hidx)
+
+    def relabel(self, hidx):
+        assignments = self.labeler.assign(hidx, self.gcd, self.smiles, self.topo)
+        return clusters.smarts_clustering(
+            hidx,
+            assignments,
+            clusters.clustering_build_assignment_mappings(hidx, assignments),
+        )
+
+    def split(self, cst, S, Sj, name):
+        hidx = cst.hierarchy.copy()
+        hent = hidx.index.node_add(
+            S.index, trees.tree_node(None, "parameter", "", name), index=0
+        )
+        hidx.subgraphs[hent.index] = Sj
+        hidx.smarts[hent.index] = self.gcd.smarts_add(Sj)
+        new = clusters.clustering_update_split(
+            cst, hidx, S, hent, self.labeler, self.gcd, self.smiles
+        )
+        return new, hent
+
+    def merge(self, cst, hent):
+        hidx = cst.hierarchy.copy()
+        trees.tree_index_node_remove(hidx.index, hent.index)
+        return clusters.clustering_update_merge(
+            cst, hidx, hent, self.labeler, self.gcd, self.smiles
+        )
+
+    def assertClusteringEqual(self, cst):
+        ref = self.relabel(cst.hierarchy)
+        self.assertEqual(
+            [a.selections for a in cst.group.assignments],
+            [a.selections for a in ref.group.assignments]
+        )
+        self.assertEqual(cst.mappings, ref.mappings)
+
+    def test_clustering_update_split_merge(self):
+        cst = self.cst
+
+        # the new nodes are specializations of their parents as the splits
+        # of an optimization are
+        Sa, Sb, Sc = self.envs[:3]
+        S1 = graphs.structure_remove_unselected(mapper.union_list([Sa, Sb]))
+        cst, p1 = self.split(cst, self.root, S1, "p1")
+        self.assertClusteringEqual(cst)
+        cst, p2 = self.split(cst, p1, Sa, "p2")
+        self.assertClusteringEqual(cst)
+        cst, p3 = self.split(cst, self.root, Sc, "p3")
+        self.assertClusteringEqual(cst)
+        cst, p4 = self.split(cst, p1, Sb, "p4")
+        self.assertClusteringEqual(cst)
+
+        for n in (p2, p3, p4):
+            self.assertTrue(cst.mappings[n.name])
+
+        # merging a node hands its members back to the nodes before it
+        cst = self.merge(cst, p4)
+        self.assertClusteringEqual(cst)
+        cst = self.merge(cst, p1)
+        self.assertClusteringEqual(cst)
+        cst = self.merge(cst, p3)
+        self.assertClusteringEqual(cst)
+        self.assertTrue(cst.mappings["p2"])
+
+if __name__ == "__main__":
+    unittest.main()
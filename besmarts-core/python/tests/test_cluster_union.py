@@ -0,0 +1,232 @@
+"""
+besmarts.tests.test_cluster_union
+
+"""
+import unittest
+from unittest import mock
+
+from besmarts.core import arrays
+from besmarts.core import configs
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.core import topology
+from besmarts.core import clusters
+
+import native_graphs
+
+
+class test_clustering_union(unittest.TestCase):
+
+    def setUp(self):
+        G = native_graphs.native_graphs_load()
+        self.icd = native_graphs.native_graphs_intvec_codec(G[0])
+        self.G = {i: self.icd.graph_encode(g) for i, g in enumerate(G)}
+        self.topo = topology.bond
+        structs = []
+        self.selections = []
+        for i, g in enumerate(G):
+            for s in graphs.graph_to_structure_bonds(g):
+                structs.append(s)
+                self.selections.append((i, s.select))
+        S0 = mapper.union_list(structs)
+        self.S0 = graphs.structure_remove_unselected(S0)
+        clusters.clustering_union_ctx.unions.clear()
+
+    def tearDown(self):
+        clusters.clustering_union_ctx.unions.clear()
+
+    def union(self, selections, depth=0):
+        Q = mapper.union_list_parallel(
+            self.G, selections, self.topo, reference=self.S0, max_depth=depth,
+            icd=self.icd
+        )
+        return graphs.structure_copy(Q)
+
+    def union_get(self, selections, depth=0):
+        return clusters.clustering_union_get(
+            "p0", self.G, selections, self.topo, self.S0, depth, self.icd
+        )
+
+    def test_clustering_union_get(self):
+        sel = self.selections
+        Q = self.union_get(sel)
+        self.assertEqual(Q, self.union(sel))
+
+        U = clusters.clustering_union_ctx.unions["p0"]
+        self.assertEqual(len(U.members), len(sel))
+        self.assertLess(len(U.envs), len(sel))
+
+        # members leave
+        sub = sel[::3]
+        self.assertEqual(self.union_get(sub), self.union(sub))
+        self.assertEqual(len(U.members), len(sub))
+        self.assertIs(clusters.clustering_union_ctx.unions["p0"], U)
+
+        # and return
+        self.assertEqual(self.union_get(sel), Q)
+        self.assertIs(clusters.clustering_union_ctx.unions["p0"], U)
+
+    def test_clustering_union_counts(self):
+        sel = self.selections
+        self.union_get(sel)
+        U = clusters.clustering_union_ctx.unions["p0"]
+        n = sum(x[0] for x in U.envs.values())
+        self.assertEqual(n, len(sel))
+
+        self.union_get(sel[:1])
+        self.assertEqual(len(U.envs), 1)
+        for k, c in U.counts.items():
+            self.assertTrue(all(x == 1 for x in c.values()))
+
+
+    def test_clustering_union_collisions(self):
+        sel = self.selections
+        self.union_get(sel)
+        n = len(clusters.clustering_union_ctx.unions["p0"].envs)
+        clusters.clustering_union_ctx.unions.clear()
+
+        # every environment has the same hash, so only the equality checks
+        # keep them apart
+        with mock.patch.object(graphs.structure, "__hash__", lambda s: 0):
+            Q = self.union_get(sel)
+            U = clusters.clustering_union_ctx.unions["p0"]
+            self.assertEqual(len(U.envs), n)
+            sub = sel[1::2]
+            Qsub = self.union_get(sub)
+        self.assertEqual(Q, self.union(sel))
+        self.assertEqual(Qsub, self.union(sub))
+
+    def test_clustering_union_depth(self):
+        sel = self.selections
+        G = {i: self.icd.graph_decode(g) for i, g in self.G.items()}
+        depth = 1
+        Q = graphs.structure_copy(self.union_get(sel, depth))
+        U = clusters.clustering_union_ctx.unions["p0"]
+        for sub in (sel[::3], sel[1::2], sel):
+            Qsub = graphs.structure_copy(self.union_get(sub, depth))
+            self.assertIs(clusters.clustering_union_ctx.unions["p0"], U)
+
+            # the union is the same as counting the selections onto the
+            # frame from scratch
+            V = clusters.clustering_union(graphs.structure_copy(U.frame), U.key)
+            self.assertTrue(
+                clusters.clustering_union_update(
+                    V, self.G, sub, self.topo, depth, self.icd
+                )
+            )
+            self.assertEqual(
+                Qsub,
+                graphs.structure_copy(clusters.clustering_union_get_structure(V))
+            )
+
+            # and every selection maps into it
+            for i, s in sub:
+                x = clusters.clustering_union_structures(
+                    G[i], [s], self.topo, depth
+                )[0]
+                M = mapper.map_to(x, Qsub).map
+                for n, bc in x.nodes.items():
+                    self.assertIsNotNone(M.get(n))
+                    for p, bv in bc.primitives.items():
+                        on = Qsub.nodes[M[n]].primitives[p].v
+                        self.assertEqual(bv.v & ~on, 0)
+        self.assertEqual(Qsub, Q)
+
+    def test_clustering_union_rebuild(self):
+        # a selection that does not fit the frame rebuilds the union
+        sel = self.selections
+        depth = 2
+        with mock.patch.object(
+            clusters, "clustering_union_env_add", return_value=None
+        ):
+            Q = graphs.structure_copy(self.union_get(sel, depth))
+        self.assertNotIn("p0", clusters.clustering_union_ctx.unions)
+        self.assertEqual(Q, self.union(sel, depth))
+
+    def test_clustering_union_disabled(self):
+        sel = self.selections
+        self.union_get(sel)
+        incremental = configs.clustering_incremental_union
+        configs.clustering_incremental_union = False
+        try:
+            sub = sel[::3]
+            Q = graphs.structure_copy(self.union_get(sub))
+            self.assertNotIn("p0", clusters.clustering_union_ctx.unions)
+        finally:
+            configs.clustering_incremental_union = incremental
+        self.assertEqual(Q, self.union(sub))
+
+
+class test_union_list_parallel(unittest.TestCase):
+
+    def setUp(self):
+        G = native_graphs.native_graphs_load()
+        self.icd = native_graphs.native_graphs_intvec_codec(G[0])
+        self.G = {i: self.icd.graph_encode(g) for i, g in enumerate(G)}
+        self.procs = configs.processors
+
+    def tearDown(self):
+        configs.processors = self.procs
+
+    def union_rounds(self, topo, selections, reference, depth, procs):
+        """
+        Union the selections in the same chunks and rounds that
+        union_list_parallel uses, in this process
+        """
+        A = []
+        for i, sel in selections:
+            g = self.icd.graph_decode(self.G[i])
+            A.append(graphs.graph_to_structure(g, sel, topo))
+        if depth:
+            config = configs.smarts_extender_config(depth, depth, True)
+            mapper.mapper_smarts_extend(config, A)
+
+        work = list(range(len(A)))
+        rounds = 0
+        while len(work) > 1 or rounds == 0:
+            chunk_n = min(max(2, len(work) // procs), 10000)
+            work = [
+                mapper.union_list(
+                    [A[x] if rounds == 0 else x for x in chunk],
+                    max_depth=depth,
+                    reference=reference,
+                    sort=True
+                )
+                for chunk in arrays.batched(work, chunk_n)
+            ]
+            if len(work) // procs < 2:
+                procs = max(1, procs // 2)
+            rounds += 1
+        return work[0], rounds
+
+    def test_union_list_parallel(self):
+        configs.processors = 4
+        for topo in (topology.bond, topology.angle):
+            selections = [
+                (i, s.select)
+                for i, g in self.G.items()
+                for s in graphs.graph_to_structure_topology(
+                    self.icd.graph_decode(g), topo
+                )
+            ]
+            g = self.icd.graph_decode(self.G[0])
+            reference = graphs.graph_to_structure(g, selections[0][1], topo)
+            for depth in (0, 1):
+                ref, rounds = self.union_rounds(
+                    topo, selections, reference, depth, 4
+                )
+                self.assertGreater(rounds, 1)
+
+                # the workers are only made when there is more than one CPU
+                with mock.patch("os.cpu_count", return_value=4):
+                    Q = mapper.union_list_parallel(
+                        self.G, selections, topo, reference=reference,
+                        max_depth=depth, icd=self.icd
+                    )
+                self.assertEqual(
+                    graphs.structure_copy(Q), graphs.structure_copy(ref)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+besmarts.tests.test_codec_native
+
+"""
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def graph_equal(test, g, h):
+    test.assertEqual(type(g), type(h))
+    test.assertEqual(list(g.nodes), list(h.nodes))
+    test.assertEqual(set(g.edges), set(h.edges))
+    test.assertTrue(all(g.nodes[i] == h.nodes[i] for i in g.nodes))
+    test.assertTrue(all(g.edges[e] == h.edges[e] for e in g.edges))
+    test.assertEqual(getattr(g, "select", None), getattr(h, "select", None))
+    test.assertEqual(getattr(g, "topology", None), getattr(h, "topology", None))
+
+
+class test_codec_native_stream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        G = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))
+        g = graphs.subgraph_to_graph(G[0])
+        G.append(g)
+        G.extend(
+            codec_native.graph_codec_native_load(
+                os.path.join(here, "..", "examples", "propane.bg")
+            )
+        )
+        self.G = G
+
+        # the text format keeps the selection in node order, so structures
+        # are only written packed
+        self.S = graphs.graph_to_structure_topology(g, topology.torsion)[:3]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_graph_codec_native_iter(self):
+        f = io.StringIO()
+        codec_native.graph_codec_native_write(f, iter(self.G), buffer_size=100)
+        text = f.getvalue()
+
+        f = io.StringIO()
+        codec_native.graph_codec_native_write(f, self.G)
+        self.assertEqual(f.getvalue(), text)
+
+        # the reader does not seek, so it reads from where the file is
+        f = io.StringIO("\n" + text)
+        f.readline()
+        G = codec_native.graph_codec_native_iter(f)
+        self.assertEqual(type(next(G)), graphs.subgraph)
+        self.assertEqual(len(list(G)), len(self.G) - 1)
+
+        G = codec_native.graph_codec_native_read(io.StringIO(text))
+        for g, h in zip(G, self.G):
+            self.assertEqual(codec_native.graph_save(g), codec_native.graph_save(h))
+
+    def test_graph_codec_native_pack(self):
+        path = os.path.join(self.tmp.name, "G")
+        G = self.G + self.S
+        packed = codec_native.graph_codec_native_pack(path, iter(G))
+        self.assertEqual(len(packed), len(G))
+        for g, h in zip(packed, G):
+            graph_equal(self, g, h)
+
+        packed = codec_native.graph_codec_native_unpack(path)
+        for i in (4, 0, 2):
+            graph_equal(self, packed[i], G[i])
+
+        # workers map the same files
+        other = pickle.loads(pickle.dumps(packed))
+        graph_equal(self, other[5], G[5])
+
+        # a text file converts without loading it
+        fname = os.path.join(self.tmp.name, "G.bg")
+        codec_native.graph_codec_native_save(fname, self.G)
+        packed = codec_native.graph_codec_native_pack(
+            path, codec_native.graph_codec_native_stream(fname)
+        )
+        self.assertEqual(len(packed), len(self.G))
+        graph_equal(self, packed[1], self.G[1])
+
+    def test_graph_codec_native_pack_primitives(self):
+        path = os.path.join(self.tmp.name, "G")
+        g = self.G[2]
+        i = next(iter(g.nodes))
+        atom = graphs.graph({i: g.nodes[i]}, {})
+
+        # a lone atom first does not lose the bonds of the graphs after it
+        packed = codec_native.graph_codec_native_pack(path, [atom, g])
+        bonds = tuple(next(iter(g.edges.values())).select)
+        self.assertEqual(packed.bond_primitives, bonds)
+        graph_equal(self, packed[1], g)
+        graph_equal(self, codec_native.graph_codec_native_unpack(path)[1], g)
+
+        # graphs with other primitives are rejected
+        with self.assertRaises(AssertionError):
+            codec_native.graph_codec_native_pack(
+                path, [g], bond_primitives=("bond_order",)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
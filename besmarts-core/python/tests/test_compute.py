@@ -0,0 +1,133 @@
+"""
+besmarts.tests.test_compute
+
+"""
+import array
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+
+from besmarts.core import arrays
+from besmarts.core import configs
+from besmarts.core import compute
+
+
+def intvecs(n):
+    A = {}
+    for i in range(n):
+        iv = arrays.intvec()
+        iv.v = array.array("q", range(i, 3*i))
+        A[10*i] = iv
+    return A
+
+
+class shm_proxy:
+    """
+    Sends the shm through pickle like the manager of a remote workspace
+    """
+
+    def __init__(self, shm):
+        self.shm = shm
+
+    def get(self):
+        return pickle.loads(pickle.dumps(self.shm.get()))
+
+    def segment(self, digest):
+        return self.shm.segment(digest)
+
+
+class test_myqueue(unittest.TestCase):
+
+    def test_get_available(self):
+        q = compute.myqueue()
+        self.assertEqual(q.get_available(timeout=0.01), [])
+
+        q.put([{0: 0}, {1: 1}, {2: 2}], n=3)
+        self.assertEqual(q.get_available(timeout=0.01, n=2), [{0: 0}, {1: 1}])
+        self.assertEqual(q.get_available(timeout=0.01), [{2: 2}])
+
+    def test_get_available_wakes(self):
+        q = compute.myqueue()
+        t = threading.Timer(0.05, q.put, args=({0: 0},))
+        t.start()
+        t0 = time.monotonic()
+        self.assertEqual(q.get_available(timeout=10.0), [{0: 0}])
+        self.assertLess(time.monotonic() - t0, 5.0)
+        t.join()
+
+
+class test_shm_segment(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = tempfile.TemporaryDirectory()
+        self.path = configs.shm_cache_path
+        configs.shm_cache_path = self.cache.name
+        self.A = intvecs(5)
+
+    def tearDown(self):
+        configs.shm_cache_path = self.path
+        self.cache.cleanup()
+
+    def test_shm_segment_local(self):
+        seg = compute.shm_segment_new(self.A)
+        self.assertEqual(list(seg), list(self.A))
+        for k, iv in self.A.items():
+            self.assertEqual(list(seg[k].v), list(iv.v))
+
+        # attaches to the same shared memory by name
+        other = pickle.loads(pickle.dumps(seg))
+        self.assertEqual(other.name, seg.name)
+        for k, iv in self.A.items():
+            self.assertEqual(list(other[k].v), list(iv.v))
+
+        compute.shm_segment_close(other)
+        compute.shm_segment_close(seg, unlink=True)
+
+    def test_shm_segment_remote(self):
+        seg = compute.shm_segment_new(self.A, shared=False)
+        shm = compute.shm_local(data={"G": seg})
+
+        # a remote worker fetches the segment once and then reads the disk
+        # cache
+        path = compute.shm_segment_cache_path(seg.digest)
+        self.assertFalse(os.path.exists(path))
+        remote = compute.shm_init(shm_proxy(shm))
+        self.assertTrue(os.path.exists(path))
+        for k, iv in self.A.items():
+            self.assertEqual(list(remote.G[k].v), list(iv.v))
+
+        other = pickle.loads(pickle.dumps(seg))
+        self.assertEqual(list(other[40].v), list(self.A[40].v))
+
+        compute.shm_segment_close(remote.G)
+        compute.shm_segment_close(other)
+
+    def test_shm_segment_cache_prune(self):
+        n = configs.shm_cache_max
+        configs.shm_cache_max = 2
+        try:
+            paths = []
+            for i in range(4):
+                seg = compute.shm_segment_new(intvecs(i + 2), shared=False)
+                data = compute.shm_segment_bytes(seg)
+                remote = pickle.loads(pickle.dumps(seg))
+                self.assertTrue(compute.shm_segment_cache_write(remote, data))
+                compute.shm_segment_close(remote)
+                path = compute.shm_segment_cache_path(seg.digest)
+                os.utime(path, (i, i))
+                paths.append(path)
+        finally:
+            configs.shm_cache_max = n
+
+        # only the most recent segments are kept
+        self.assertEqual([os.path.exists(x) for x in paths], [0, 0, 1, 1])
+
+        self.assertEqual(compute.shm_segment_cache_prune(0), 2)
+        self.assertEqual(os.listdir(self.cache.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+"""
+besmarts.tests.test_db
+
+"""
+import multiprocessing
+import os
+import pickle
+import tempfile
+import unittest
+
+from besmarts.core import db
+from besmarts.core import configs
+from besmarts.core import graphs
+from besmarts.core import trees
+from besmarts.core import topology
+from besmarts.core import hierarchies
+from besmarts.codecs import codec_native
+from besmarts.assign import hierarchy_assign_native
+
+import native_graphs
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def table_writer(path, w):
+    t = db.db_table_open(path, "q")
+    for k in range(50):
+        db.db_table_append(t, [[w, k] + [w] * (k % 3)])
+
+
+class test_db_dataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        G = native_graphs.native_graphs_load()
+        self.icd = native_graphs.native_graphs_intvec_codec(G[0])
+        self.G = G
+        self.A = [self.icd.graph_encode(g) for g in G]
+        self.selections = [
+            (i, s.select)
+            for i, g in enumerate(G)
+            for s in graphs.graph_to_structure_bonds(g)
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_db_dataset_roundtrip(self):
+        path = os.path.join(self.tmp.name, "ds")
+        ds = db.db_dataset_open(path, create=True)
+        self.assertEqual(db.db_dataset_write_graphs(ds, self.A), range(2))
+        db.db_dataset_write_selections(ds, self.selections)
+        labels = [f"b{i}" for i in range(len(self.selections))]
+        db.db_dataset_write_labels(ds, labels)
+
+        # append after the first write
+        self.assertEqual(db.db_dataset_write_graphs(ds, self.A[:1]), range(2, 3))
+        self.assertEqual(len(ds), 3)
+        db.db_dataset_close(ds)
+
+        ds = db.db_dataset_open(path)
+        self.assertEqual(len(ds), 3)
+        for i, iv in enumerate(self.A + self.A[:1]):
+            self.assertEqual(list(ds[i].v), list(iv.v))
+        self.assertEqual(db.db_dataset_read_selections(ds), self.selections)
+        self.assertEqual(db.db_dataset_read_labels(ds, [2, 0]), labels[2::-2])
+
+        g = self.icd.graph_decode(ds[1])
+        self.assertEqual(list(g.nodes), list(self.G[1].nodes))
+        self.assertEqual(list(g.edges), list(self.G[1].edges))
+
+        # workers map the same files
+        other = pickle.loads(pickle.dumps(ds))
+        vecs = db.db_dataset_read_graph_list(other, [1, 0])
+        self.assertEqual(list(vecs[0].v), list(self.A[1].v))
+        self.assertEqual(list(vecs[1].v), list(self.A[0].v))
+
+        db.db_dataset_remove(ds)
+        self.assertFalse(os.path.exists(path))
+
+    def test_db_table_append_concurrent(self):
+        path = os.path.join(self.tmp.name, "t")
+        db.db_table_open(path, "q", create=True)
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(target=table_writer, args=(path, w)) for w in range(4)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        t = db.db_table_open(path, "q")
+        self.assertEqual(len(t), 200)
+        recs = sorted(tuple(x) for x in db.db_table_read_list(t, range(len(t))))
+        self.assertEqual(
+            recs,
+            sorted((w, k) + (w,) * (k % 3) for w in range(4) for k in range(50))
+        )
+
+    def test_db_dict(self):
+        name = os.path.join(self.tmp.name, "kv")
+        d = db.db_dict(self.icd, name)
+        d.write_graph({0: self.G[0], 1: self.G[1]}, prefix="g")
+        d.write_graph({0: self.G[1]}, prefix="g")
+        d.delete_intvec([1], prefix="g")
+
+        d = db.db_dict(self.icd, name)
+        self.assertEqual(list(d.read_intvec(0, prefix="g").v), list(self.A[1].v))
+        with self.assertRaises(KeyError):
+            d.read_intvec(1, prefix="g")
+        d.remove()
+
+
+class graph_codec_counter(codec_native.graph_codec_native):
+    """
+    Decodes names to graphs and counts the decodes
+    """
+
+    def __init__(self, G, atom_primitives, bond_primitives):
+        super().__init__(
+            codec_native.primitive_codecs_get(), atom_primitives, bond_primitives
+        )
+        self.G = G
+        self.decodes = 0
+
+    def smiles_decode(self, smiles):
+        self.decodes += 1
+        return self.G[smiles]
+
+
+def smiles_cache_writer(G, atoms, bonds, w):
+    db.db_smiles_cache_ctx.caches.clear()
+    db.db_smiles_cache_ctx.pending_max = 3
+    gcd = graph_codec_counter(G, atoms, bonds)
+    names = list(G)
+    for smi in names[w::2] + names[:w:-1]:
+        db.db_smiles_decode(gcd, smi)
+    db.db_smiles_cache_flush(gcd)
+
+
+def smiles_cache_labeler(G, atoms, bonds):
+    db.db_smiles_cache_ctx.caches.clear()
+    gcd = graph_codec_counter(G, atoms, bonds)
+    shier = hierarchies.smarts_hierarchy(trees.tree_index(), {})
+    hierarchy_assign_native.smarts_hierarchy_assign(
+        shier, gcd, list(G), topology.bond
+    )
+    # exit the way a pool worker does, without running atexit
+    os._exit(0)
+
+
+class test_db_smiles_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = configs.smiles_cache_path
+        configs.smiles_cache_path = self.tmp.name
+        g = graphs.subgraph_to_graph(
+            codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        )
+        self.G = {"g": g}
+        self.atoms = tuple(next(iter(g.nodes.values())).primitives)
+        self.bonds = tuple(next(iter(g.edges.values())).primitives)
+
+    def tearDown(self):
+        configs.smiles_cache_path = self.path
+        db.db_smiles_cache_ctx.caches.clear()
+        self.tmp.cleanup()
+
+    def test_db_smiles_decode(self):
+        gcd = graph_codec_counter(self.G, self.atoms, self.bonds)
+        g = db.db_smiles_decode(gcd, "g")
+        h = db.db_smiles_decode(gcd, "g")
+        self.assertEqual(gcd.decodes, 1)
+        self.assertEqual(db.db_smiles_cache_flush(gcd), 1)
+        self.assertEqual(list(h.nodes), list(g.nodes))
+        self.assertEqual(list(h.edges), list(g.edges))
+        self.assertTrue(all(h.nodes[i] == g.nodes[i] for i in g.nodes))
+
+        # a restart reads the graphs from disk
+        db.db_smiles_cache_ctx.caches.clear()
+        gcd = graph_codec_counter(self.G, self.atoms, self.bonds)
+        found = db.db_smiles_cache_read(gcd, ["g", "x"])
+        self.assertEqual(list(found), ["g"])
+        self.assertEqual(gcd.decodes, 0)
+
+        # a codec that perceives other primitives does not share graphs
+        gcd = graph_codec_counter(self.G, self.atoms[:1], self.bonds)
+        self.assertEqual(db.db_smiles_cache_read(gcd, ["g"]), {})
+
+    def test_db_smiles_cache_concurrent(self):
+        g = self.G["g"]
+        G = {}
+        for k in range(40):
+            G[f"g{k}"] = graphs.graph(
+                {i + 100 * k: x for i, x in g.nodes.items()},
+                {(i + 100 * k, j + 100 * k): x for (i, j), x in g.edges.items()},
+            )
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(
+                target=smiles_cache_writer,
+                args=(G, self.atoms, self.bonds, w)
+            )
+            for w in range(4)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        # every SMILES is paired with its own graph
+        gcd = graph_codec_counter(G, self.atoms, self.bonds)
+        found = db.db_smiles_cache_read(gcd, G)
+        self.assertEqual(set(found), set(G))
+        icd = db.db_smiles_cache_get(gcd).icd
+        for smi, v in found.items():
+            h = icd.graph_decode(v)
+            self.assertEqual(list(h.nodes), list(G[smi].nodes))
+        self.assertEqual(gcd.decodes, 0)
+
+    def test_db_smiles_cache_labeler(self):
+        ctx = multiprocessing.get_context("fork")
+        p = ctx.Process(
+            target=smiles_cache_labeler, args=(self.G, self.atoms, self.bonds)
+        )
+        p.start()
+        p.join()
+        self.assertEqual(p.exitcode, 0)
+
+        gcd = graph_codec_counter(self.G, self.atoms, self.bonds)
+        self.assertEqual(list(db.db_smiles_cache_read(gcd, ["g"])), ["g"])
+
+    def test_db_smiles_cache_refresh(self):
+        g = self.G["g"]
+        G = {"g": g, "h": g, "k": g}
+        gcd = graph_codec_counter(G, self.atoms, self.bonds)
+        cache = db.db_smiles_cache_get(gcd)
+
+        # another process writing to the same table
+        t = db.db_table_open(cache.table.path, "q")
+        v = cache.icd.graph_encode(g)
+
+        # only the first miss of a batch looks for the SMILES of others
+        db.db_smiles_decode(gcd, "g")
+        db.db_table_append(t, [db.db_smiles_cache_record("h", v)])
+        db.db_smiles_decode(gcd, "h")
+        self.assertEqual(gcd.decodes, 2)
+
+        db.db_smiles_cache_flush(gcd)
+        db.db_table_append(t, [db.db_smiles_cache_record("k", v)])
+        db.db_smiles_decode(gcd, "k")
+        self.assertEqual(gcd.decodes, 2)
+
+    def test_db_smiles_cache_disabled(self):
+        configs.smiles_cache_path = None
+        gcd = graph_codec_counter(self.G, self.atoms, self.bonds)
+        db.db_smiles_decode(gcd, "g")
+        db.db_smiles_decode(gcd, "g")
+        self.assertEqual(gcd.decodes, 2)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
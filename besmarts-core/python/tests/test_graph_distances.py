@@ -0,0 +1,166 @@
+"""
+besmarts.tests.test_graph_distances
+
+"""
+import os
+import pickle
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import configs
+from besmarts.core import topology
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def distances_brute(g, a):
+    """
+    The reference path lengths from a, found by visiting the graph one level
+    at a time
+    """
+    adj = graphs.graph_connections(g)
+    lens = {a: 0}
+    front = [a]
+    while front:
+        nxt = []
+        for i in front:
+            for j in adj[i]:
+                if j not in lens:
+                    lens[j] = lens[i] + 1
+                    nxt.append(j)
+        front = nxt
+    return lens
+
+
+class test_graph_distances(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        self.g = graphs.subgraph_to_graph(g)
+        graphs.graph_distances_cache_clear()
+
+    def test_graph_distances_brute(self):
+        g = self.g
+        for a in g.nodes:
+            ref = distances_brute(g, a)
+            for b in g.nodes:
+                self.assertEqual(
+                    graphs.graph_shortest_path_length(g, a, b), ref.get(b)
+                )
+
+    def test_graph_distances_shared(self):
+        structs = graphs.graph_to_structure_torsions(self.g)
+        for s in structs:
+            graphs.structure_max_depth(s)
+        stats = graphs.graph_distances_cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], len(structs) - 1)
+        self.assertIs(
+            graphs.graph_distances(structs[0]),
+            graphs.graph_distances(structs[-1])
+        )
+
+    def test_structure_depths(self):
+        structs = graphs.graph_to_structure_bonds(self.g)
+        config = configs.smarts_extender_config(3, 3, True)
+        graphs.structure_extend(config, structs)
+        for s in structs:
+            primary = [s.select[i] for i in s.topology.primary]
+            refs = [distances_brute(s, i) for i in primary]
+            depths = {n: min(r[n] for r in refs) for n in s.nodes}
+
+            self.assertEqual(
+                set(s.select), set(n for n, d in depths.items() if d <= 3)
+            )
+            self.assertEqual(
+                graphs.structure_max_depth(s), max(depths[n] for n in s.select)
+            )
+            for n in s.select:
+                self.assertEqual(graphs.structure_node_depth(s, n), depths[n])
+
+    def test_graph_distances_walk(self):
+        config = configs.smarts_extender_config(3, 3, True)
+        tabled = graphs.graph_to_structures_extend(
+            self.g, None, topology.bond, config
+        )
+
+        max_nodes = configs.graph_distances_max_nodes
+        configs.graph_distances_max_nodes = 0
+        try:
+            graphs.graph_distances_cache_clear()
+            walked = graphs.graph_to_structures_extend(
+                self.g, None, topology.bond, config
+            )
+            structs = graphs.graph_to_structure_bonds(self.g)
+            graphs.structure_extend(config, structs)
+            adj = graphs.graph_connections(self.g)
+            for s in walked + structs:
+                for n in s.nodes:
+                    graphs.structure_node_depth(s, n, adj=adj)
+            for a in self.g.nodes:
+                for b in self.g.nodes:
+                    self.assertEqual(
+                        graphs.graph_shortest_path_length(self.g, a, b),
+                        distances_brute(self.g, a).get(b)
+                    )
+            self.assertEqual(graphs.graph_distances_cache_stats()["size"], 0)
+        finally:
+            configs.graph_distances_max_nodes = max_nodes
+
+        self.assertEqual(
+            [s.select for s in walked], [s.select for s in tabled]
+        )
+        self.assertEqual(
+            [s.select for s in structs], [s.select for s in tabled]
+        )
+        for s, t in zip(walked, tabled):
+            self.assertEqual(graphs.structure_shape(s), graphs.structure_shape(t))
+
+    def test_graph_shape_key(self):
+        g = self.g
+        h = graphs.graph_copy(g)
+        key = graphs.graph_shape_key(g)
+        self.assertEqual(graphs.graph_shape_key(h), key)
+
+        # changing a bechem keeps the key, adding or removing an id does not
+        n = next(iter(h.nodes))
+        h.nodes[n] = h.nodes[n].copy()
+        self.assertEqual(graphs.graph_shape_key(h), key)
+        e = next(iter(h.edges))
+        h.edges[e] = h.edges.pop(e)
+        self.assertNotEqual(graphs.graph_shape_key(h), key)
+        self.assertEqual(graphs.graph_shape_key(g), key)
+
+        # serials are not kept across processes
+        p = pickle.loads(pickle.dumps(g))
+        self.assertEqual(p.nodes, g.nodes)
+        self.assertNotEqual(graphs.graph_shape_key(p), key)
+
+    def test_graph_distances_rewired(self):
+        s = graphs.structure_copy(graphs.graph_to_structure_bonds(self.g)[0])
+        primary = [s.select[i] for i in s.topology.primary]
+        graphs.structure_shape(s)
+        graphs.graph_shortest_path_length(s, primary[0], primary[1])
+
+        # move an edge without changing the number of nodes or edges
+        (i, j), e = next(
+            (k, v) for k, v in s.edges.items() if not set(k) & set(primary)
+        )
+        del s.edges[(i, j)]
+        k = next(n for n in s.nodes if n not in (i, j) and (i, n) not in s.edges)
+        s.edges[graphs.edge((i, k))] = e
+
+        refs = [distances_brute(s, x) for x in primary]
+        depths = graphs.structure_shape(s)[1]
+        for n in s.nodes:
+            depth = min(r.get(n, len(s.nodes)) for r in refs)
+            self.assertEqual(depths.get(n, len(s.nodes)), depth)
+            self.assertEqual(
+                graphs.graph_shortest_path_length(s, primary[0], n),
+                refs[0].get(n)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+besmarts.tests.test_hierarchy_diff
+
+"""
+import pickle
+import unittest
+
+from besmarts.core import hierarchies
+from besmarts.core import trees
+
+
+def hierarchy_state(sh):
+    nodes = [(n.index, n.category, n.type, n.name) for n in sh.index.nodes.values()]
+    return nodes, sh.index.above, sh.index.below, sh.smarts
+
+
+def hierarchy_new():
+    index = trees.tree_index()
+    smarts = {}
+    root = index.node_add(None, trees.tree_node(0, "parameter", "parameter", "b1"))
+    smarts[root.index] = "[*:1]~[*:2]"
+    for i, sma in enumerate(("[#6:1]~[*:2]", "[#1:1]~[*:2]"), 2):
+        n = index.node_add(
+            root.index, trees.tree_node(0, "parameter", "parameter", f"b{i}")
+        )
+        smarts[n.index] = sma
+    return hierarchies.smarts_hierarchy(index, smarts)
+
+
+class test_smarts_hierarchy_diff(unittest.TestCase):
+
+    def setUp(self):
+        self.A = hierarchy_new()
+
+    def test_diff_new(self):
+        diff = hierarchies.smarts_hierarchy_diff(None, self.A)
+        self.assertIsNotNone(diff["index"])
+        self.assertEqual(diff["smarts"], self.A.smarts)
+        self.assertEqual(diff["removed"], [])
+
+        B = hierarchies.smarts_hierarchy_patch(None, diff)
+        self.assertEqual(hierarchy_state(B), hierarchy_state(self.A))
+
+    def test_diff_unchanged(self):
+        B = hierarchies.smarts_hierarchy_copy(self.A)
+        diff = hierarchies.smarts_hierarchy_diff(self.A, B)
+        self.assertEqual(diff, {"index": None, "smarts": {}, "removed": []})
+
+    def test_diff_smarts(self):
+        B = hierarchies.smarts_hierarchy_copy(self.A)
+        B.smarts[1] = "[#7:1]~[*:2]"
+        diff = hierarchies.smarts_hierarchy_diff(self.A, B)
+
+        # only the changed SMARTS is sent and the tree is not
+        self.assertIsNone(diff["index"])
+        self.assertEqual(diff["smarts"], {1: "[#7:1]~[*:2]"})
+
+        C = hierarchies.smarts_hierarchy_copy(self.A)
+        C = hierarchies.smarts_hierarchy_patch(C, pickle.loads(pickle.dumps(diff)))
+        self.assertEqual(hierarchy_state(C), hierarchy_state(B))
+
+    def test_diff_tree(self):
+        B = hierarchies.smarts_hierarchy_copy(self.A)
+        n = B.index.node_add(
+            1, trees.tree_node(0, "parameter", "parameter", "b4")
+        )
+        B.smarts[n.index] = "[#6:1]-[#6:2]"
+        B.index.node_remove(2)
+        del B.smarts[2]
+
+        diff = hierarchies.smarts_hierarchy_diff(self.A, B)
+        self.assertIsNotNone(diff["index"])
+        self.assertEqual(diff["smarts"], {n.index: "[#6:1]-[#6:2]"})
+        self.assertEqual(diff["removed"], [2])
+
+        C = hierarchies.smarts_hierarchy_copy(self.A)
+        C = hierarchies.smarts_hierarchy_patch(C, pickle.loads(pickle.dumps(diff)))
+        self.assertEqual(hierarchy_state(C), hierarchy_state(B))
+
+        # the diff holds a copy of the tree, so changing the target later
+        # does not change a hierarchy that was patched in the same process
+        C = hierarchies.smarts_hierarchy_copy(self.A)
+        C = hierarchies.smarts_hierarchy_patch(C, diff)
+        B.index.node_remove(n.index)
+        self.assertIn(n.index, C.index.nodes)
+
+
+if __name__ == "__main__":
+    unittest.main()
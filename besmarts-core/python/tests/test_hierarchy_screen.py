@@ -0,0 +1,94 @@
+"""
+besmarts.tests.test_hierarchy_screen
+
+"""
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import trees
+from besmarts.core import hierarchies
+from besmarts.codecs import codec_native
+from besmarts.assign import hierarchy_assign_native
+
+import native_graphs
+
+
+class graph_codec_table(codec_native.graph_codec_native):
+    """
+    Decodes the names of the graphs and subgraphs it was given
+    """
+
+    def __init__(self, G, S, atom_primitives, bond_primitives):
+        super().__init__(
+            codec_native.primitive_codecs_get(), atom_primitives, bond_primitives
+        )
+        self.G = G
+        self.S = S
+
+    def smiles_decode(self, smiles):
+        return self.G[smiles]
+
+    def smarts_decode(self, smarts):
+        return self.S[smarts]
+
+
+class test_hierarchy_screen(unittest.TestCase):
+
+    def setUp(self):
+        self.G = native_graphs.native_graphs_load()
+
+    def assign(self, topo):
+        structs = [graphs.graph_to_structure_topology(g, topo) for g in self.G]
+        sh = native_graphs.native_graphs_hierarchy(
+            [s for x in structs for s in x], topo
+        )
+        roots = trees.tree_index_roots(sh.index)
+
+        hierarchy_assign_native.screen_stats.clear()
+        screened = [
+            hierarchy_assign_native.structure_hierarchy_assign(
+                sh, roots, x, screen=True
+            )
+            for x in structs
+        ]
+        self.assertGreater(hierarchy_assign_native.screen_stats["screened"], 0)
+
+        ref = [
+            hierarchy_assign_native.structure_hierarchy_assign(
+                sh, roots, x, screen=False
+            )
+            for x in structs
+        ]
+        self.assertEqual(screened, ref)
+        return sh, ref
+
+    def test_structure_hierarchy_assign_bonds(self):
+        self.assign(topology.bond)
+
+    def test_structure_hierarchy_assign_angles(self):
+        self.assign(topology.angle)
+
+    def test_smarts_hierarchy_assign(self):
+        topo = topology.bond
+        sh, ref = self.assign(topo)
+
+        smiles = [f"g{i}" for i in range(len(self.G))]
+        smarts = {i: f"s{i}" for i in sh.subgraphs}
+        g = self.G[0]
+        gcd = graph_codec_table(
+            dict(zip(smiles, self.G)),
+            {smarts[i]: S for i, S in sh.subgraphs.items()},
+            tuple(next(iter(g.nodes.values())).primitives),
+            tuple(next(iter(g.edges.values())).primitives),
+        )
+        shier = hierarchies.smarts_hierarchy(sh.index, smarts)
+
+        sag = hierarchy_assign_native.smarts_hierarchy_assign(
+            shier, gcd, smiles, topo
+        )
+        self.assertEqual([a.selections for a in sag.assignments], ref)
+
+
+if __name__ == "__main__":
+    unittest.main()
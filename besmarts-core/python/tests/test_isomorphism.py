@@ -0,0 +1,54 @@
+"""
+besmarts.tests.test_isomorphism
+
+"""
+import os
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.core import configs
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+class test_group_by_isomorphism(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        self.g = graphs.subgraph_to_graph(g)
+        self.structs = graphs.graph_to_structure_bonds(self.g)
+        config = configs.smarts_extender_config(1, 1, True)
+        mapper.mapper_smarts_extend(config, self.structs)
+
+    def test_structure_invariant_relabel(self):
+        for s in self.structs:
+            n = len(s.nodes)
+            relabel = {k: n - i for i, k in enumerate(s.nodes)}
+            r = graphs.structure_relabel_nodes(s, relabel)
+            self.assertEqual(
+                graphs.structure_invariant(r), graphs.structure_invariant(s)
+            )
+
+    def test_structure_hash_extend(self):
+        s = graphs.graph_to_structure_bonds(self.g)[0]
+        h0 = hash(s)
+        config = configs.smarts_extender_config(1, 1, True)
+        graphs.structure_extend(config, [s])
+        self.assertNotEqual(hash(s), h0)
+        self.assertEqual(hash(s), hash(graphs.structure_copy(s)))
+        self.assertEqual(hash(s), hash(self.structs[0]))
+
+    def test_group_by_isomorphism(self):
+        S = self.structs
+        groups = mapper.group_by_isomorphism(S)
+        self.assertEqual(sorted(i for x in groups for i in x), list(range(len(S))))
+        for group in groups:
+            for i in group[1:]:
+                T = mapper.map_to(S[group[0]], S[i], strict=True, equality=True)
+                self.assertEqual(len(T.map), len(S[group[0]].select))
+
+
+if __name__ == "__main__":
+    unittest.main()
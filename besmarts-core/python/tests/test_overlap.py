@@ -0,0 +1,128 @@
+"""
+besmarts.tests.test_overlap
+
+"""
+import itertools
+import os
+import random
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import mapper
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def pairwise_overlap_brute(cg, A, o, B):
+    """
+    The reference scores, found by trying every ordering of the bonds
+    """
+    H = {}
+    for i in A:
+        bonds_i = [
+            tuple(sorted((i, j))) for j in graphs.subgraph_connection(cg, i)
+        ]
+        for j in B:
+            bond_j = [
+                tuple(sorted((j, k))) for k in graphs.subgraph_connection(o, j)
+            ]
+            best_score = 0
+            for bond_i in itertools.permutations(bonds_i):
+                score = 0
+                for b_i, b_j in zip(bond_i, bond_j):
+                    score += (cg.edges[b_i] & o.edges[b_j]).bits(maxbits=True)
+                best_score = max(best_score, score)
+            atom = (cg.nodes[i] & o.nodes[j]).bits(maxbits=True)
+            H[(i, j)] = atom + best_score + 1
+    return H
+
+
+class test_pairwise_overlap(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        self.g = graphs.subgraph_to_graph(g)
+        mapper.pairwise_overlap_cache_clear()
+
+    def tearDown(self):
+        mapper.pairwise_overlap_cache_configure(2**16)
+        mapper.pairwise_overlap_cache_clear()
+
+    def test_pairwise_overlap_brute(self):
+        mapper.pairwise_overlap_cache_configure(0)
+        G = [self.g]
+        G.extend(
+            codec_native.graph_codec_native_load(
+                os.path.join(here, "..", "examples", "propane.bg")
+            )
+        )
+        for g in G:
+            for h in G:
+                A = list(g.nodes)
+                B = list(h.nodes)
+                self.assertEqual(
+                    mapper.pairwise_overlap(g, A, h, B),
+                    pairwise_overlap_brute(g, A, h, B)
+                )
+
+    def test_pairwise_overlap_cache(self):
+        g = self.g
+        A = list(g.nodes)
+
+        mapper.pairwise_overlap_cache_configure(0)
+        ref = mapper.pairwise_overlap(g, A, g, A)
+        self.assertEqual(mapper.pairwise_overlap_cache_stats()["size"], 0)
+
+        mapper.pairwise_overlap_cache_configure(2**16)
+        self.assertEqual(mapper.pairwise_overlap(g, A, g, A), ref)
+        self.assertEqual(mapper.pairwise_overlap(g, A, g, A), ref)
+
+        stats = mapper.pairwise_overlap_cache_stats()
+        self.assertGreater(stats["hits"], len(A)**2)
+        self.assertEqual(stats["size"], stats["misses"] - len(A)**2)
+
+    def test_pairwise_overlap_cache_size(self):
+        g = self.g
+        A = list(g.nodes)
+        mapper.pairwise_overlap_cache_configure(2)
+        mapper.pairwise_overlap(g, A, g, A)
+        stats = mapper.pairwise_overlap_cache_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertGreater(stats["evictions"], 0)
+
+
+class test_linear_assignment(unittest.TestCase):
+
+    def test_linear_assignment_brute(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            n = rng.randint(0, 6)
+            m = rng.randint(1, 6)
+            W = [[rng.randint(0, 9) for _ in range(m)] for _ in range(n)]
+
+            if n <= m:
+                ref = max(
+                    (sum(W[i][j] for i, j in enumerate(p))
+                        for p in itertools.permutations(range(m), n)),
+                    default=0
+                )
+            else:
+                ref = max(
+                    sum(W[i][j] for j, i in enumerate(p))
+                    for p in itertools.permutations(range(n), m)
+                )
+
+            score, cols = mapper.linear_assignment(W)
+            self.assertEqual(score, ref)
+            assigned = [j for j in cols if j is not None]
+            self.assertEqual(len(assigned), min(n, m))
+            self.assertEqual(len(set(assigned)), len(assigned))
+            self.assertEqual(
+                sum(W[i][j] for i, j in enumerate(cols) if j is not None),
+                score
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+besmarts.tests.test_packed
+
+"""
+import os
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import packed
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+class test_packed_graph(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        self.g = graphs.subgraph_to_graph(g)
+        self.structs = graphs.graph_to_structure_bonds(self.g)
+
+    def test_packed_graph_roundtrip(self):
+        g = self.g
+        h = packed.packed_graph_to_graph(packed.packed_graph_from_graph(g))
+        self.assertEqual(type(h), graphs.graph)
+        self.assertEqual(list(h.nodes), list(g.nodes))
+        self.assertEqual(list(h.edges), list(g.edges))
+        for n in g.nodes:
+            self.assertEqual(h.nodes[n], g.nodes[n])
+        for e in g.edges:
+            self.assertEqual(h.edges[e], g.edges[e])
+
+    def test_packed_graph_intvec(self):
+        s = self.structs[0]
+        p = packed.packed_graph_from_graph(s)
+        iv = graphs.structure_to_intvec(s, p.atom_primitives, p.bond_primitives)
+        q = packed.packed_graph_from_intvec(
+            iv, p.atom_primitives, p.bond_primitives
+        )
+        self.assertEqual(q.select, s.select)
+        self.assertEqual(q.topology, s.topology)
+        self.assertEqual(list(packed.packed_graph_to_intvec(q).v), list(iv.v))
+
+    def test_packed_graph_intvec_view(self):
+        g = self.g
+        p = packed.packed_graph_from_graph(g)
+        iv = graphs.graph_to_intvec(g, p.atom_primitives, p.bond_primitives)
+        q = packed.packed_graph_from_intvec(
+            iv, p.atom_primitives, p.bond_primitives, copy=False
+        )
+        for n in g.nodes:
+            self.assertEqual(q.nodes[n], g.nodes[n])
+        for e in g.edges:
+            self.assertEqual(q.edges[e], g.edges[e])
+
+    def test_packed_graph_connections(self):
+        p = packed.packed_graph_from_graph(self.g)
+        adj = graphs.graph_connections(self.g)
+        for n, nbrs in packed.packed_graph_connections(p).items():
+            self.assertEqual(sorted(nbrs), sorted(adj[n]))
+
+    def test_packed_graph_read_only_use(self):
+        s = self.structs[0]
+        p = packed.packed_graph_from_graph(s)
+        self.assertEqual(
+            graphs.structure_max_depth(p), graphs.structure_max_depth(s)
+        )
+        self.assertEqual(graphs.structure_copy(p), s)
+
+
+if __name__ == "__main__":
+    unittest.main()
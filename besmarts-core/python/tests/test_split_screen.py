@@ -0,0 +1,211 @@
+"""
+besmarts.tests.test_split_screen
+
+"""
+import os
+import unittest
+from unittest import mock
+
+from besmarts.core import configs
+from besmarts.core import graphs
+from besmarts.core import graph_visitors
+from besmarts.core import mapper
+from besmarts.core import splits
+from besmarts.core import codecs
+from besmarts.core import packed
+from besmarts.codecs import codec_native
+
+import native_graphs
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+class test_split_screen(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        g = graphs.subgraph_to_graph(g)
+        S0 = mapper.union_list(graphs.graph_to_structure_bonds(g))
+        self.S0 = graphs.structure_remove_unselected(S0)
+        self.bits = list(
+            graph_visitors.structure_iter_bits(self.S0, skip_ones=True)
+        )
+
+    def test_split_bit_slot(self):
+        slots = [splits.split_bit_slot(b) for b in self.bits]
+        self.assertTrue(all(x is not None for x in slots))
+        self.assertEqual(splits.split_bit_slot(self.S0), None)
+
+    def test_split_bits_bound(self):
+        b0, b1 = self.bits[0], self.bits[1]
+        same = splits.split_bit_slot(b0) == splits.split_bit_slot(b1)
+        screen = {
+            0: (splits.split_bit_slot(b0), 0b0011),
+            1: (splits.split_bit_slot(b1), 0b0110),
+        }
+        full = 0b1111
+        bound = splits.split_bits_bound(screen, (0, 1), full)
+        self.assertEqual(bound, 0b0111 if same else 0b0010)
+
+        # bits that were not screened cannot bound the matches
+        bound = splits.split_bits_bound(screen, (0, 2), full)
+        self.assertEqual(bound, full)
+
+    def test_split_bits_screen_enabled(self):
+        ratio = configs.split_bit_screen_min_ratio
+        try:
+            configs.split_bit_screen_min_ratio = 2.0
+            # 10 bits make 45 pairs, which is less than 2 per match
+            self.assertFalse(splits.split_bits_screen_enabled(10, 100, 1, 3))
+            # 120 triples and 45 pairs are enough for 40 matches
+            self.assertTrue(splits.split_bits_screen_enabled(10, 4, 1, 4))
+            # single bits are never pruned by the screen
+            self.assertFalse(splits.split_bits_screen_enabled(10, 1, 1, 2))
+
+            configs.split_bit_screen_min_ratio = 0.0
+            self.assertTrue(splits.split_bits_screen_enabled(10, 100, 1, 3))
+        finally:
+            configs.split_bit_screen_min_ratio = ratio
+
+    def test_split_bit_combinations(self):
+        combos = list(splits.split_bit_combinations(4, 1, 3, 2))
+        self.assertEqual([x[0] for x in combos], list(range(2 * (4 + 6))))
+        self.assertEqual(combos[0], (0, 1, (0,)))
+        self.assertEqual(combos[1], (1, 1, (0,)))
+        self.assertEqual(combos[-1], (19, 2, (2, 3)))
+
+
+class test_process_split_matches(unittest.TestCase):
+
+    def setUp(self):
+        G = native_graphs.native_graphs_load()
+        self.icd = native_graphs.native_graphs_intvec_codec(G[0])
+        self.A = {i: self.icd.graph_encode(g) for i, g in enumerate(G)}
+        self.structs = []
+        self.selections = []
+        for i, g in enumerate(G):
+            for s in graphs.graph_to_structure_bonds(g):
+                self.structs.append(s)
+                self.selections.append((i, s.select))
+        S0 = mapper.union_list(self.structs)
+        S0 = graphs.structure_remove_unselected(S0)
+        self.bits = list(graph_visitors.structure_iter_bits(S0, skip_ones=True))
+
+    def test_process_split_matches(self):
+        stats0 = splits.process_split_matches_stats()
+        n = 0
+        for Sj in self.bits:
+            ref = [mapper.mapper_match(s, Sj) for s in self.structs]
+            matches, makes_split = splits.process_split_matches(
+                Sj, self.A, self.selections, self.icd
+            )
+            n += matches[2]
+            self.assertEqual(makes_split, any(ref) and not all(ref))
+            self.assertEqual(matches[0], ref[0])
+            if makes_split:
+                i = ref.index(not ref[0])
+                self.assertEqual(matches[1], i)
+            else:
+                self.assertEqual(matches[1], len(ref))
+
+        stats = splits.process_split_matches_stats()
+        self.assertEqual(stats["calls"] - stats0.get("calls", 0), len(self.bits))
+        self.assertEqual(stats["probes"] - stats0.get("probes", 0), n)
+        self.assertLess(n, len(self.bits) * len(self.structs))
+
+    def test_process_split_matches_groups(self):
+        topo = self.structs[0].topology
+        for depth in (0, 1):
+            splits.process_split_matches_cache_clear()
+            cache = splits.process_split_matches_cache(self.A, self.icd)
+            reps = splits.process_split_matches_groups(
+                cache, self.selections, topo, depth
+            )
+
+            # every environment collides, so the groups must come from the
+            # equality checks alone
+            splits.process_split_matches_cache_clear()
+            cache = splits.process_split_matches_cache(self.A, self.icd)
+            with mock.patch.object(graphs.structure, "__hash__", lambda s: 0):
+                collided = splits.process_split_matches_groups(
+                    cache, self.selections, topo, depth
+                )
+            self.assertEqual(collided, reps)
+            self.assertLess(len(reps), len(self.selections))
+
+    def test_mapper_equal(self):
+        a, b = self.structs[0], self.structs[1]
+        self.assertTrue(mapper.mapper_equal(a, a))
+        r = graphs.structure(a.nodes, a.edges, a.select[::-1], a.topology)
+        self.assertTrue(mapper.mapper_equal(a, r))
+        self.assertEqual(
+            mapper.mapper_equal(a, b),
+            mapper.mapper_match(a, b) and mapper.mapper_match(b, a)
+        )
+
+    def test_split_segment_get(self):
+        seg = splits.split_segment_get(self.A)
+        try:
+            self.assertIs(splits.split_segment_get(self.A), seg)
+            for k, iv in self.A.items():
+                self.assertEqual(list(seg[k].v), list(iv.v))
+
+            # a different dataset replaces the segment
+            A = dict(self.A)
+            other = splits.split_segment_get(A)
+            self.assertIsNot(other, seg)
+            self.assertIsNone(seg.buffer)
+        finally:
+            splits.split_segment_close()
+        self.assertIsNone(splits.split_segment_ctx.segment)
+        self.assertIsNone(other.buffer)
+
+    def test_intvec_codec_decode_cache(self):
+        cache = codecs.intvec_codec_decode_cache(self.icd, self.A, maxsize=1)
+        g = cache.graph_decode(0)
+        self.assertIs(cache.graph_decode(0), g)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.graph_decode(1)
+        self.assertEqual(list(cache.graphs), [1])
+        self.assertIsNot(cache.graph_decode(0), g)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        codecs.intvec_codec_decode_cache_clear(cache)
+        self.assertEqual(len(cache.graphs), 0)
+        self.assertIsNone(cache.A)
+
+        # lazy graphs are views that decode the same nodes and edges
+        lazy = codecs.intvec_codec_decode_cache(self.icd, self.A, lazy=True)
+        h = lazy.graph_decode(0)
+        g = self.icd.graph_decode(self.A[0])
+        self.assertIsInstance(h, packed.packed_graph)
+        self.assertEqual(dict(h.nodes), g.nodes)
+        self.assertEqual(dict(h.edges), g.edges)
+
+    def test_process_split_matches_cache(self):
+        cache = splits.process_split_matches_cache(self.A, self.icd)
+        self.assertIs(splits.process_split_matches_cache(self.A, self.icd), cache)
+        splits.process_split_matches(
+            self.bits[0], self.A, self.selections, self.icd
+        )
+        self.assertGreater(len(cache.graphs), 0)
+
+        # a new dataset releases the graphs of the old one
+        A = dict(self.A)
+        other = splits.process_split_matches_cache(A, self.icd)
+        self.assertIsNot(other, cache)
+        self.assertEqual(len(cache.graphs), 0)
+        self.assertIsNone(splits.process_split_matches_ctx.selections)
+        for iv in self.A.values():
+            iv.v.append(0)
+            iv.v.pop()
+
+        other.graph_decode(0)
+        splits.process_split_matches_cache_clear()
+        self.assertIsNone(splits.process_split_matches_ctx.cache)
+        self.A[0].v.append(0)
+        self.A[0].v.pop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+besmarts.tests.test_structure_extend
+
+"""
+import os
+import unittest
+
+from besmarts.core import graphs
+from besmarts.core import topology
+from besmarts.core import configs
+from besmarts.codecs import codec_native
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+class test_graph_to_structures_extend(unittest.TestCase):
+
+    def setUp(self):
+        g = codec_native.graph_codec_native_load(os.path.join(here, "g.bg"))[0]
+        self.g = graphs.subgraph_to_graph(g)
+        self.atom_primitives = tuple(next(iter(self.g.nodes.values())).primitives)
+        self.bond_primitives = tuple(next(iter(self.g.edges.values())).primitives)
+
+    def test_graph_to_structures_extend(self):
+        g = self.g
+        for topo in (topology.bond, topology.angle, topology.torsion):
+            selections = [
+                s.select for s in graphs.graph_to_structure_topology(g, topo)
+            ]
+            for d_min, d_max, h in ((0, 0, True), (1, 3, False), (2, None, True)):
+                config = configs.smarts_extender_config(d_min, d_max, h)
+                ref = [graphs.graph_to_structure(g, x, topo) for x in selections]
+                graphs.structure_extend(config, ref)
+
+                structs = graphs.graph_to_structures_extend(
+                    g, None, topo, config
+                )
+                self.assertEqual(
+                    [s.select for s in structs], [s.select for s in ref]
+                )
+                self.assertEqual(structs, ref)
+
+    def test_graph_to_intvecs_extend(self):
+        g = self.g
+        topo = topology.torsion
+        config = configs.smarts_extender_config(2, 2, True)
+        structs = graphs.graph_to_structures_extend(g, None, topo, config)
+        vecs = graphs.graph_to_intvecs_extend(
+            g, None, topo, config, self.atom_primitives, self.bond_primitives
+        )
+        self.assertEqual(len(vecs), len(structs))
+        for s, iv in zip(structs, vecs):
+            ref = graphs.structure_to_intvec(
+                s, self.atom_primitives, self.bond_primitives
+            )
+            self.assertEqual(list(iv.v), list(ref.v))
+
+
+if __name__ == "__main__":
+    unittest.main()
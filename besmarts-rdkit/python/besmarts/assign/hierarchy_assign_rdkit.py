@@ -2,8 +2,13 @@
 besmarts.assign.hierarchy_assign_rdkit
 """
 
+import os
 import multiprocessing
 import datetime
+import collections
+import pickle
+import queue
+import traceback
 
 from rdkit import Chem
 
@@ -15,6 +20,7 @@ from besmarts.core import trees
 from besmarts.core import tree_iterators
 from besmarts.core import hierarchies
 from besmarts.core import assignments
+from besmarts.core import db
 
 from besmarts.cluster import cluster_assignment
 from besmarts.codecs import codec_rdkit
@@ -48,11 +54,390 @@ class smarts_hierarchy_assignment_rdkit(
     ):
         return smarts_hierarchy_assign_outofplanes(shier, gcd, smiles)
 
+class smarts_hierarchy_assignment_rdkit_service(
+    smarts_hierarchy_assignment_rdkit
+):
+    """
+    An RDKit labeler that keeps a persistent pool of workers between labeling
+    passes. The workers keep their query and molecule caches, and only the
+    changes to the hierarchy are sent to them on each pass. Call close when
+    finished to shut down the workers.
+    """
+
+    __slots__ = ("procs", "chunksize", "mols_max", "service")
+
+    def __init__(self, procs=None, chunksize=None, mols_max=10000):
+        self.procs = procs
+        self.chunksize = chunksize
+        self.mols_max = mols_max
+        self.service = None
+
+    def __getstate__(self):
+        return (self.procs, self.chunksize, self.mols_max)
+
+    def __setstate__(self, state):
+        self.procs, self.chunksize, self.mols_max = state
+        self.service = None
+
+    def assign(
+        self, shier: hierarchies.smarts_hierarchy, gcd, smiles, topo
+    ):
+        procs = self.procs
+        if procs is None:
+            procs = configs.processors
+        if procs is None:
+            procs = os.cpu_count()
+
+        srv = self.service
+        if procs <= 1 or len(smiles) <= 1 or (
+            srv is not None and srv.pid != os.getpid()
+        ):
+            # serial, or we are a copy that lives inside of a worker
+            rdkit_cache_configure(self.mols_max)
+            return smarts_hierarchy_assign(shier, gcd, smiles, topo)
+
+        if srv is not None and (
+            srv.gcd is not gcd or srv.topo != topo or srv.procs != procs
+            or not srv.workers
+        ):
+            srv.close()
+            srv = None
+
+        if srv is None:
+            srv = smarts_hierarchy_assign_service(
+                gcd, topo, procs, self.mols_max
+            )
+            self.service = srv
+
+        return srv.assign(shier, smiles, self.chunksize)
+
+    def close(self):
+        if self.service is not None:
+            self.service.close()
+            self.service = None
+
+
+class smarts_hierarchy_assign_service:
+    """
+    A set of long-lived labeling workers. Each worker holds a copy of the
+    current hierarchy, which is kept up to date by sending versioned diffs to
+    every worker. SMILES are sent in chunks through a shared queue, and each
+    chunk is tagged with the hierarchy version it must be labeled with.
+    """
+
+    def __init__(self, gcd, topo, procs, mols_max=0):
+        self.gcd = gcd
+        self.topo = topo
+        self.procs = procs
+        self.pid = os.getpid()
+        self.version = 0
+        self.hier = None
+
+        ctx = multiprocessing.get_context("fork")
+        self.iqueue = ctx.Queue()
+        self.oqueue = ctx.Queue()
+        self.cqueues = []
+        self.workers = []
+        for _ in range(procs):
+            cq = ctx.Queue()
+            p = ctx.Process(
+                target=smarts_hierarchy_assign_worker,
+                args=(gcd, topo, mols_max, self.iqueue, cq, self.oqueue),
+                daemon=True,
+            )
+            p.start()
+            self.cqueues.append(cq)
+            self.workers.append(p)
+
+    def update(self, shier: hierarchies.smarts_hierarchy):
+        """
+        Send the changes of the hierarchy to the workers.
+        """
+        shier = hierarchies.smarts_hierarchy(shier.index, shier.smarts)
+        diff = hierarchies.smarts_hierarchy_diff(self.hier, shier)
+        if self.hier is not None and not (
+            diff["index"] or diff["smarts"] or diff["removed"]
+        ):
+            return
+        self.version += 1
+        for cq in self.cqueues:
+            cq.put((self.version, diff))
+        self.hier = hierarchies.smarts_hierarchy_patch(
+            hierarchies.smarts_hierarchy_copy(self.hier) if self.hier else None,
+            diff
+        )
+
+    def assign(
+        self, shier: hierarchies.smarts_hierarchy, smiles_list, chunksize=None
+    ) -> assignments.smiles_assignment_group:
+
+        assert type(smiles_list) != str
+
+        self.update(shier)
+
+        n = len(smiles_list)
+        if chunksize is None:
+            chunksize = max(1, min(1000, n // (4 * self.procs)))
+
+        n_chunks = 0
+        for n_chunks, i in enumerate(range(0, n, chunksize), 1):
+            self.iqueue.put((self.version, i, smiles_list[i:i+chunksize]))
+
+        sa = [None] * n
+        error = None
+        for _ in range(n_chunks):
+            # collect every chunk, even after an error, so that the queue is
+            # empty for the next pass
+            i, chunk, err = self.get()
+            if err is not None:
+                error = error or err
+            else:
+                sa[i:i+len(chunk)] = chunk
+
+        if error is not None:
+            e, tb = error
+            raise e from RuntimeError(f"Labeling worker traceback:\n{tb}")
+
+        return assignments.smiles_assignment_group(sa, self.topo)
+
+    def get(self):
+        """
+        Wait for a labeled chunk. If a worker exits while waiting, the other
+        workers are stopped and an exception is raised, since the chunk it
+        held will never be returned.
+        """
+        while True:
+            try:
+                return self.oqueue.get(timeout=1.0)
+            except queue.Empty:
+                for p in self.workers:
+                    if not p.is_alive():
+                        self.terminate()
+                        raise RuntimeError(
+                            f"Labeling worker {p.pid} exited with code"
+                            f" {p.exitcode}"
+                        )
+
+    def terminate(self):
+        if self.pid != os.getpid():
+            return
+        for p in self.workers:
+            p.terminate()
+        for p in self.workers:
+            p.join()
+        self.workers.clear()
+        self.cqueues.clear()
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+        for _ in self.workers:
+            self.iqueue.put(None)
+        for p in self.workers:
+            p.join()
+        self.workers.clear()
+        self.cqueues.clear()
+
+
+def smarts_hierarchy_assign_worker(gcd, topo, mols_max, iq, cq, oq):
+
+    rdkit_cache_configure(mols_max)
+    smarts_hierarchy_assign_ctx.gcd = gcd
+    smarts_hierarchy_assign_ctx.topo = topo
+
+    version = 0
+    hier = None
+
+    while True:
+        task = iq.get()
+        if task is None:
+            break
+
+        v, i, chunk = task
+        while version < v:
+            version, diff = cq.get()
+            hier = hierarchies.smarts_hierarchy_patch(hier, diff)
+
+        smarts_hierarchy_assign_ctx.hier = hier
+        try:
+            sa = smarts_hierarchy_assign_smiles_list(chunk)
+        except Exception as e:
+            oq.put((i, None, smarts_hierarchy_assign_error(e)))
+        else:
+            oq.put((i, sa, None))
+
+
+def smarts_hierarchy_assign_error(e):
+    """
+    Return an exception raised in a worker and its traceback in a form that
+    can be sent to the parent.
+    """
+
+    tb = traceback.format_exc()
+    try:
+        pickle.loads(pickle.dumps(e))
+    except Exception:
+        e = RuntimeError(repr(e))
+    return e, tb
+
+
 class smarts_hierarchy_assign_ctx:
     hier = None
     gcd =  None
     topo =  None
 
+
+class rdkit_cache_ctx:
+    """
+    Per-process caches of compiled SMARTS queries and sanitized molecules.
+    These are module globals so that each pool worker keeps its own copy
+    between labeling passes.
+    """
+
+    # SMARTS -> (query mol, query atom idx to tag), least recently used first
+    queries = collections.OrderedDict()
+
+    # maximum number of queries to keep; 0 disables the query cache
+    queries_max = 10000
+
+    # SMILES -> (mol, atom idx to tag), least recently used first
+    mols = collections.OrderedDict()
+
+    # maximum number of molecules to keep; 0 disables the molecule cache
+    mols_max = 0
+
+    stats = collections.Counter()
+
+
+def rdkit_cache_configure(mols_max=None, queries_max=None):
+    """
+    Set the size of the molecule and query caches. Shrinking a cache evicts
+    the least recently used entries.
+
+    Parameters
+    ----------
+    mols_max : int
+        The maximum number of sanitized molecules to keep in each process. A
+        value of 0 disables the molecule cache.
+    queries_max : int
+        The maximum number of compiled queries to keep in each process. A
+        value of 0 disables the query cache.
+
+    Returns
+    -------
+    None
+    """
+
+    if mols_max is not None:
+        rdkit_cache_ctx.mols_max = mols_max
+        mols = rdkit_cache_ctx.mols
+        while len(mols) > max(0, mols_max):
+            mols.popitem(last=False)
+
+    if queries_max is not None:
+        rdkit_cache_ctx.queries_max = queries_max
+        queries = rdkit_cache_ctx.queries
+        while len(queries) > max(0, queries_max):
+            queries.popitem(last=False)
+
+
+def rdkit_cache_clear():
+    """
+    Clear the query and molecule caches and reset the counters of this
+    process.
+    """
+
+    rdkit_cache_ctx.queries.clear()
+    rdkit_cache_ctx.mols.clear()
+    rdkit_cache_ctx.stats.clear()
+
+
+def rdkit_cache_stats():
+    """
+    Return the cache counters of this process.
+
+    Returns
+    -------
+    Dict[str, int]
+        The hits, misses, and sizes of the query and molecule caches
+    """
+
+    stats = dict(rdkit_cache_ctx.stats)
+    for k in ("query_hit", "query_miss", "mol_hit", "mol_miss"):
+        stats.setdefault(k, 0)
+    stats["query_size"] = len(rdkit_cache_ctx.queries)
+    stats["mol_size"] = len(rdkit_cache_ctx.mols)
+    return stats
+
+
+def rdkit_query_get(sma):
+    """
+    Return the compiled query of a SMARTS pattern and the tags of its atoms,
+    compiling and caching the query if it has not been seen before. The
+    query cache uses a least recently used policy.
+
+    Parameters
+    ----------
+    sma : str
+        The SMARTS pattern
+
+    Returns
+    -------
+    Tuple[Chem.Mol, Dict[int, int]]
+        The query and the map of query atom index to tag
+    """
+
+    queries = rdkit_cache_ctx.queries
+    ret = queries.get(sma)
+    if ret is None:
+        rdkit_cache_ctx.stats["query_miss"] += 1
+        S = Chem.MolFromSmarts(sma)
+        ret = (S, codec_rdkit.get_indices(S))
+        if rdkit_cache_ctx.queries_max > 0:
+            queries[sma] = ret
+            if len(queries) > rdkit_cache_ctx.queries_max:
+                queries.popitem(last=False)
+    else:
+        rdkit_cache_ctx.stats["query_hit"] += 1
+        queries.move_to_end(sma)
+    return ret
+
+
+def rdkit_mol_get(pcp, smi):
+    """
+    Return the sanitized molecule of a SMILES string and the tags of its
+    atoms. If the molecule cache is enabled, the molecule is cached using a
+    least recently used policy.
+
+    Parameters
+    ----------
+    pcp : smiles_perception_config
+        The perception settings used to build the molecule
+    smi : str
+        The SMILES string
+
+    Returns
+    -------
+    Tuple[Chem.Mol, Dict[int, int]]
+        The molecule and the map of atom index to tag
+    """
+
+    mols = rdkit_cache_ctx.mols
+    key = (smi, pcp.protonate)
+    ret = mols.get(key)
+    if ret is None:
+        rdkit_cache_ctx.stats["mol_miss"] += 1
+        mol = make_rdmol(pcp, smi)
+        ret = (mol, codec_rdkit.get_indices(mol))
+        if rdkit_cache_ctx.mols_max > 0:
+            mols[key] = ret
+            if len(mols) > rdkit_cache_ctx.mols_max:
+                mols.popitem(last=False)
+    else:
+        rdkit_cache_ctx.stats["mol_hit"] += 1
+        mols.move_to_end(key)
+    return ret
+
 def smarts_hierarchy_assign_smiles(smiles):
 
     shier = smarts_hierarchy_assign_ctx.hier
@@ -69,9 +454,9 @@ def smarts_hierarchy_assign_smiles(smiles):
     }[topo]
 
 
-    g = gcd.smiles_decode(smiles)
+    g = db.db_smiles_decode(gcd, smiles)
     selections = [s.select for s in graphs.graph_to_structure_topology(g, topo)]
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    mol, idx2tag = rdkit_mol_get(gcd.smiles_config, smiles)
 
     indices = selections
 
@@ -79,7 +464,7 @@ def smarts_hierarchy_assign_smiles(smiles):
     roots = [shier.index.nodes[i] for i, x in shier.index.above.items() if x is None]
     for root in roots:
         new_matches = assign(
-            shier, root, mol, indices, lambda x: tuple(sorter(x))
+            shier, root, mol, indices, lambda x: tuple(sorter(x)), idx2tag
         )
         if not match:
             match = new_matches
@@ -90,6 +475,19 @@ def smarts_hierarchy_assign_smiles(smiles):
         
     return cluster_assignment.smiles_assignment_str(smiles, match)
 
+def smarts_hierarchy_assign_smiles_list(smiles_list):
+    """
+    Label a list of SMILES and write the graphs that were decoded to the
+    SMILES cache.
+    """
+
+    try:
+        sa = [smarts_hierarchy_assign_smiles(smi) for smi in smiles_list]
+    finally:
+        # pool workers exit without running atexit
+        db.db_smiles_cache_flush(smarts_hierarchy_assign_ctx.gcd)
+    return sa
+
 def smarts_hierarchy_assign(
     shier: hierarchies.smarts_hierarchy, gcd, smiles_list, topo
     ) -> assignments.smiles_assignment_group:
@@ -108,13 +506,20 @@ def smarts_hierarchy_assign(
     procs = min(len(smiles_list), configs.processors)
 
     if procs is not None and procs > 1:
+        n = len(smiles_list)
+        chunksize = max(1, min(1000, n // (4 * procs)))
         with multiprocessing.Pool(procs) as pool:
-            for smiles in smiles_list:
-                work.append(pool.apply_async(smarts_hierarchy_assign_smiles, (smiles,)))
+            for i in range(0, n, chunksize):
+                work.append(
+                    pool.apply_async(
+                        smarts_hierarchy_assign_smiles_list,
+                        (smiles_list[i:i+chunksize],)
+                    )
+                )
             for unit in work:
-                sa.append(unit.get())
+                sa.extend(unit.get())
     else:
-        sa.extend(map(smarts_hierarchy_assign_smiles, smiles_list))
+        sa.extend(smarts_hierarchy_assign_smiles_list(smiles_list))
 
     smarts_hierarchy_assign_ctx.hier = None
     smarts_hierarchy_assign_ctx.gcd = None
@@ -127,8 +532,10 @@ def smarts_hierarchy_assign_atoms(
     shier: hierarchies.smarts_hierarchy, gcd, smiles
 ):
 
-    g = gcd.smiles_decode(smiles)
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    # each call labels a single SMILES, so write its graph now
+    g = db.db_smiles_decode(gcd, smiles)
+    db.db_smiles_cache_flush(gcd)
+    mol, _ = rdkit_mol_get(gcd.smiles_config, smiles)
 
     idx_map = {x: i for i, x in enumerate(g.nodes, 1)}
     indices = {(idx_map[x],): (x,) for x in g.nodes}
@@ -147,8 +554,9 @@ def smarts_hierarchy_assign_bonds(
     shier: hierarchies.smarts_hierarchy, gcd, smiles
 ):
 
-    g = gcd.smiles_decode(smiles)
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    g = db.db_smiles_decode(gcd, smiles)
+    db.db_smiles_cache_flush(gcd)
+    mol, _ = rdkit_mol_get(gcd.smiles_config, smiles)
 
     idx_map = {x: i for i, x in enumerate(g.nodes, 1)}
     indices = {
@@ -169,8 +577,9 @@ def smarts_hierarchy_assign_angles(
     shier: hierarchies.smarts_hierarchy, gcd, smiles
 ):
 
-    g = gcd.smiles_decode(smiles)
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    g = db.db_smiles_decode(gcd, smiles)
+    db.db_smiles_cache_flush(gcd)
+    mol, _ = rdkit_mol_get(gcd.smiles_config, smiles)
 
     idx_map = {x: i for i, x in enumerate(g.nodes, 1)}
     indices = {
@@ -192,8 +601,9 @@ def smarts_hierarchy_assign_torsions(
     shier: hierarchies.smarts_hierarchy, gcd, smiles
 ):
 
-    g = gcd.smiles_decode(smiles)
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    g = db.db_smiles_decode(gcd, smiles)
+    db.db_smiles_cache_flush(gcd)
+    mol, _ = rdkit_mol_get(gcd.smiles_config, smiles)
 
     idx_map = {x: i for i, x in enumerate(g.nodes, 1)}
     # indices = {(i,j,k,l): (i,j,k,l) for i,j,k,l in graphs.graph_torsions(g)}
@@ -222,8 +632,9 @@ def smarts_hierarchy_assign_outofplanes(
     shier: hierarchies.smarts_hierarchy, gcd, smiles
 ):
 
-    g = gcd.smiles_decode(smiles)
-    mol = make_rdmol(gcd.smiles_config, smiles)
+    g = db.db_smiles_decode(gcd, smiles)
+    db.db_smiles_cache_flush(gcd)
+    mol, _ = rdkit_mol_get(gcd.smiles_config, smiles)
 
     idx_map = {x: i for i, x in enumerate(g.nodes, 1)}
 
@@ -274,6 +685,7 @@ def assign(
     mol,
     indices,
     sorter,
+    idx2tag=None,
 ):
 
     cur = root
@@ -290,7 +702,8 @@ def assign(
         for i, h in enumerate(tree_iterators.tree_iter_dive(hidx.index, root))
     }
 
-    idx2tag = codec_rdkit.get_indices(mol)
+    if idx2tag is None:
+        idx2tag = codec_rdkit.get_indices(mol)
 
     checked = 0
 
@@ -308,9 +721,8 @@ def assign(
             break
 
         checked += 1
-        S = Chem.MolFromSmarts(sma)
+        S, s_idx2tags = rdkit_query_get(sma)
 
-        s_idx2tags = codec_rdkit.get_indices(S)
         s_idx2tags_r = [k for k,v in s_idx2tags.items() if v in range(1,l+1)]
 
         this_matches = mol.GetSubstructMatches(S, uniquify=False)